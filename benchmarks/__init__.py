@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the SDK. Run them with ``python -m benchmarks``, see
+``python -m benchmarks --help`` for the available options.
+"""
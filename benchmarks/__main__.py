@@ -0,0 +1,71 @@
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from benchmarks.harness import find_regressions, load_benchmarks, measure
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure the throughput and peak memory of the SDK.",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        default="",
+        help="only run benchmarks whose name contains this string",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="minimum number of seconds to run each benchmark for",
+    )
+    parser.add_argument(
+        "--baseline", help="JSON file of previous results to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed fractional regression against the baseline (default 0.25)",
+    )
+    parser.add_argument("--save", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    benchmarks = [b for b in load_benchmarks() if args.filter in b.name]
+    if not benchmarks:
+        print(f"no benchmarks match '{args.filter}'", file=sys.stderr)
+        return 1
+
+    width = max(len(b.name) for b in benchmarks)
+    print(f"{'benchmark':<{width}}  {'ops/s':>14}  {'peak memory':>14}")
+    results = []
+    for bench in benchmarks:
+        result = measure(bench, args.min_time)
+        results.append(result)
+        print(
+            f"{result.name:<{width}}  {result.per_second:>14,.1f}  {result.peak_memory:>12,}B"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({r.name: r.to_dict() for r in results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
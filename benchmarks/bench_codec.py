@@ -0,0 +1,26 @@
+import json
+from typing import Callable
+
+from benchmarks.corpus import QUERIES
+from benchmarks.harness import benchmark
+from snuba_sdk.codec import from_dict, to_dict
+from snuba_sdk.query import Query
+
+# Compare with the translation phase, which renders the same queries with
+# Query.snuba().
+
+
+def _register_json_phases(case: str, builder: Callable[[], Query]) -> None:
+    benchmark("to_json", case, builder)(lambda query: json.dumps(to_dict(query)))
+
+    def setup() -> str:
+        return json.dumps(to_dict(builder()))
+
+    benchmark("from_json", case, setup)(lambda data: from_dict(json.loads(data)))
+    benchmark("from_json", f"{case}_trusted", setup)(
+        lambda data: from_dict(json.loads(data), trusted=True)
+    )
+
+
+for case, query_builder in QUERIES.items():
+    _register_json_phases(case, query_builder)
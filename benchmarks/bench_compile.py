@@ -0,0 +1,30 @@
+from dataclasses import replace
+from typing import List
+
+from benchmarks.corpus import QUERIES
+from benchmarks.harness import benchmark
+from snuba_sdk.query import compile_many, Query
+
+# The number of distinct queries compiled by each run. Every run compiles
+# fresh copies, so the output cached on the queries is not reused.
+QUERY_COUNT = 500
+WORKERS = (1, 2, 4, 8)
+
+
+def _queries() -> List[Query]:
+    query = QUERIES["typical"]()
+    return [query.set_offset(i) for i in range(QUERY_COUNT)]
+
+
+def _compile(workers: int) -> None:
+    # Each run starts a pool of worker processes
+    benchmark("compile_many", f"500_typical_workers_{workers}", _queries, slow=True)(
+        lambda queries: compile_many(map(replace, queries), workers)
+    )
+
+
+benchmark("compile_many", "500_typical_serial", _queries)(
+    lambda queries: compile_many(map(replace, queries), 0)
+)
+for workers in WORKERS:
+    _compile(workers)
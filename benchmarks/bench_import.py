@@ -0,0 +1,181 @@
+"""
+The time it takes to import the SDK in a fresh interpreter, as reported by
+``python -X importtime``. Short lived processes pay this on every run, so the
+benchmark fails if a module that the SDK only loads on first use is imported
+eagerly, or if importing the SDK takes longer than importing the baseline
+revision of the SDK on the same machine, either in total or in the modules of
+the SDK itself.
+"""
+
+import atexit
+import io
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Tuple
+
+from benchmarks.harness import benchmark
+
+# The revision that the import times are compared against: the last one before
+# the import time work. It is checked out in a temporary directory and imported
+# alternately with the working tree, so both are timed on the same machine
+# under the same load. Set IMPORT_BASELINE_REF to compare with another one.
+IMPORT_BASELINE_REF = os.environ.get("IMPORT_BASELINE_REF", "7b56d31")
+
+# The modules whose import times are compared.
+IMPORT_MODULES = ("snuba_sdk.query", "snuba_sdk.legacy")
+
+# An import may take at most this much longer than the same import of the
+# baseline, which leaves room for noise but not for a regression.
+IMPORT_TOLERANCE = 1.1
+
+# Number of fresh interpreters the median import time is taken over, for each
+# of the two trees.
+IMPORT_RUNS = 15
+
+# Modules that the SDK must only import when they are first needed. threading
+# and array are not imported at all: the SDK uses _thread directly, and checks
+# for array.array values only if the array module has been imported.
+LAZY_MODULES = ("array", "hashlib", "json", "threading")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def _remove_on_exit(directory: str) -> str:
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return directory
+
+
+@lru_cache(maxsize=None)
+def _bytecode_env() -> Mapping[str, str]:
+    # Both trees are imported with compiled bytecode, like an installed
+    # package, which is kept out of the source trees.
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = _remove_on_exit(tempfile.mkdtemp())
+    return env
+
+
+@lru_cache(maxsize=None)
+def baseline_tree() -> str:
+    """
+    Check out the snuba_sdk package of IMPORT_BASELINE_REF in a temporary
+    directory, and return the directory.
+    """
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", IMPORT_BASELINE_REF, "snuba_sdk"],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    directory = _remove_on_exit(tempfile.mkdtemp())
+    # Only extract regular files and directories where extraction filters exist
+    options: Dict[str, Any] = (
+        {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+    )
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory, **options)
+    return directory
+
+
+def import_times(module: str, root: str = ROOT) -> Dict[str, Tuple[int, int]]:
+    """
+    Import a module of the SDK in the tree at root in a new interpreter, and
+    return the self and cumulative import time in microseconds of every
+    module that was imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root,
+        env=_bytecode_env(),
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return times
+
+
+def check_lazy_imports(module: str) -> List[str]:
+    times = import_times(module)
+    return [
+        f"{module} imports {lazy} eagerly" for lazy in LAZY_MODULES if lazy in times
+    ]
+
+
+def _sdk_time(times: Mapping[str, Tuple[int, int]]) -> int:
+    # The time spent in the modules of the SDK itself, which the cumulative
+    # time hides when the SDK stops importing a module of the standard library
+    return sum(
+        self_time
+        for name, (self_time, _) in times.items()
+        if name == "snuba_sdk" or name.startswith("snuba_sdk.")
+    )
+
+
+def compare_import(module: str) -> Dict[str, Tuple[int, int]]:
+    """
+    The median import time of a module in the working tree and in the
+    baseline tree, in microseconds: both the cumulative time, and the time
+    spent in the modules of the SDK. The two trees are imported alternately,
+    so changes in the load of the machine affect both the same way.
+    """
+    trees = (ROOT, baseline_tree())
+    for root in trees:
+        import_times(module, root)  # Compile the bytecode
+    runs: Dict[str, Tuple[List[int], List[int]]] = {
+        "cumulative": ([], []),
+        "SDK": ([], []),
+    }
+    for _ in range(IMPORT_RUNS):
+        for index, root in enumerate(trees):
+            times = import_times(module, root)
+            runs["cumulative"][index].append(times[module][1])
+            runs["SDK"][index].append(_sdk_time(times))
+    return {
+        measure: (int(statistics.median(current)), int(statistics.median(baseline)))
+        for measure, (current, baseline) in runs.items()
+    }
+
+
+def check_import(module: str) -> List[str]:
+    problems = check_lazy_imports(module)
+    for measure, (current, baseline) in compare_import(module).items():
+        if current > baseline * IMPORT_TOLERANCE:
+            problems.append(
+                f"the {measure} import time of {module} is {current:,}us, "
+                f"{current / baseline - 1:.0%} more than the {baseline:,}us of "
+                f"{IMPORT_BASELINE_REF}"
+            )
+    return problems
+
+
+def _register(module: str) -> None:
+    # Only the eagerly imported modules are checked by the test suite, timing
+    # the imports takes a few seconds.
+    @benchmark("import", f"{module} lazy modules")
+    def lazy(_: None) -> None:
+        problems = check_lazy_imports(module)
+        assert not problems, "; ".join(problems)
+
+    @benchmark("import", module, slow=True)
+    def run(_: None) -> None:
+        problems = check_import(module)
+        assert not problems, "; ".join(problems)
+
+
+# -X importtime was added in Python 3.7, and PYTHONPYCACHEPREFIX in 3.8
+if sys.version_info >= (3, 8):
+    for module in IMPORT_MODULES:
+        _register(module)
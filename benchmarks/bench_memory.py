@@ -0,0 +1,65 @@
+from typing import Any, List
+
+from benchmarks.harness import benchmark
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    CurriedFunction,
+    Direction,
+    Function,
+    LimitBy,
+    OrderBy,
+    Totals,
+)
+
+# The nodes built by each run are kept alive until the run ends, so the peak
+# memory divided by NODE_COUNT is roughly the size of a single node.
+NODE_COUNT = 10000
+
+
+@benchmark("memory", "10k_columns")
+def columns(_: Any) -> List[Column]:
+    return [Column(f"column_{i}") for i in range(NODE_COUNT)]
+
+
+@benchmark("memory", "10k_functions")
+def functions(_: Any) -> List[Function]:
+    column = Column("duration")
+    return [Function("plus", [column, i], f"p{i}") for i in range(NODE_COUNT)]
+
+
+@benchmark("memory", "10k_curried_functions")
+def curried_functions(_: Any) -> List[CurriedFunction]:
+    column = Column("duration")
+    return [
+        CurriedFunction("quantile", [0.5], [column], f"p{i}") for i in range(NODE_COUNT)
+    ]
+
+
+@benchmark("memory", "10k_conditions")
+def conditions(_: Any) -> List[Condition]:
+    column = Column("project_id")
+    return [Condition(column, Op.EQ, i) for i in range(NODE_COUNT)]
+
+
+@benchmark("memory", "10k_orderbys")
+def orderbys(_: Any) -> List[OrderBy]:
+    column = Column("timestamp")
+    return [OrderBy(column, Direction.ASC) for _ in range(NODE_COUNT)]
+
+
+@benchmark("memory", "10k_limitbys")
+def limitbys(_: Any) -> List[LimitBy]:
+    column = Column("title")
+    return [LimitBy(column, i + 1) for i in range(NODE_COUNT)]
+
+
+@benchmark("memory", "10k_entities")
+def entities(_: Any) -> List[Entity]:
+    return [Entity("events", i + 1) for i in range(NODE_COUNT)]
+
+
+@benchmark("memory", "10k_flags")
+def flags(_: Any) -> List[Totals]:
+    return [Totals(i % 2 == 0) for i in range(NODE_COUNT)]
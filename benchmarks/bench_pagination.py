@@ -0,0 +1,36 @@
+from benchmarks.corpus import START
+from benchmarks.harness import benchmark
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import Column, Direction, OrderBy
+from snuba_sdk.query import Query
+
+PAGES = 1000
+PAGE_SIZE = 100
+
+
+def _large_query() -> Query:
+    columns = [Column(f"column_{i}") for i in range(200)]
+    conditions = [Condition(Column("timestamp"), Op.GT, START)]
+    conditions.extend(
+        Condition(Column(f"tags[key_{i}]"), Op.NEQ, f"value_{i}") for i in range(100)
+    )
+    conditions.append(Condition(Column("group_id"), Op.IN, tuple(range(5000))))
+    return (
+        Query("discover", Entity("events"))
+        .set_select(columns)
+        .set_where(conditions)
+        .set_orderby([OrderBy(Column("timestamp"), Direction.DESC)])
+        .set_limit(PAGE_SIZE)
+    )
+
+
+def _paginate(pages: int, slow: bool) -> None:
+    @benchmark("pagination", f"{pages}_pages", _large_query, slow)
+    def paginate(query: Query) -> None:
+        for page in range(pages):
+            query.set_offset(page * PAGE_SIZE).snuba()
+
+
+_paginate(10, False)
+_paginate(PAGES, True)
@@ -0,0 +1,46 @@
+from datetime import timedelta
+from itertools import cycle
+from typing import Callable, Iterator
+
+from benchmarks.corpus import END, QUERIES, START
+from benchmarks.harness import benchmark
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.expressions import Column, Function
+from snuba_sdk.parser import parse_query
+from snuba_sdk.query import Query
+
+# Typical queries that differ in their time range, projects and offset, like a
+# stream of queries from the same page would. The parser only caches Columns,
+# so every query is tokenized and parsed afresh, as a log of queries would be.
+DISTINCT_QUERIES = 1000
+
+
+def _distinct_typical_queries() -> Iterator[str]:
+    query = QUERIES["typical"]()
+    texts = []
+    for i in range(DISTINCT_QUERIES):
+        where = [
+            Condition(Column("timestamp"), Op.GT, START + timedelta(seconds=i)),
+            Condition(Column("timestamp"), Op.LTE, END + timedelta(seconds=i)),
+            Condition(Column("project_id"), Op.IN, [i % 50, i % 50 + 1]),
+            Condition(Function("ifNull", [Column("environment"), ""]), Op.EQ, "prod"),
+        ]
+        texts.append(str(query.set_where(where).set_offset(i % 10 * 100)))
+    return cycle(texts)
+
+
+def _register_parsing_phase(case: str, builder: Callable[[], Query]) -> None:
+    dataset = builder().dataset
+
+    def setup() -> str:
+        return str(builder())
+
+    benchmark("parsing", case, setup)(lambda text: parse_query(text, dataset))
+
+
+for case, query_builder in QUERIES.items():
+    _register_parsing_phase(case, query_builder)
+
+benchmark("parsing", "typical_distinct", _distinct_typical_queries)(
+    lambda texts: parse_query(next(texts), "discover")
+)
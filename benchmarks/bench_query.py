@@ -0,0 +1,78 @@
+from dataclasses import replace
+from typing import Any, Callable, Dict
+
+from benchmarks.corpus import huge_in_query, LEGACY_BODIES, QUERIES
+from benchmarks.harness import benchmark
+from snuba_sdk.expressions import deferred_validation
+from snuba_sdk.legacy import json_to_snql
+from snuba_sdk.query import Query
+from snuba_sdk.query_visitors import (
+    Printer,
+    QueryVisitor,
+    StreamingTranslator,
+    Translator,
+    Validator,
+)
+
+
+def _uncached(visitor: QueryVisitor[Any]) -> Callable[[Query], Any]:
+    # Visit a fresh copy of the query each time, so the work is not hidden by
+    # the output cached on the query itself.
+    return lambda query: visitor.visit(replace(query))
+
+
+class _Discard:
+    # A file-like object that drops what is written to it, so the streaming
+    # benchmarks only measure the memory used to render the query.
+    def write(self, data: str) -> int:
+        return len(data)
+
+
+def _streamed(query: Query) -> int:
+    return StreamingTranslator().write(query, _Discard())  # type: ignore
+
+
+def _build_and_validate(builder: Callable[[], Query]) -> None:
+    Validator().visit(builder())
+
+
+def _build_deferred_and_validate(builder: Callable[[], Query]) -> None:
+    with deferred_validation():
+        query = builder()
+    Validator().visit(query)
+
+
+def _register_query_phases(case: str, builder: Callable[[], Query]) -> None:
+    benchmark("construction", case)(lambda _: builder())
+    benchmark("build_and_validate", case)(lambda _: _build_and_validate(builder))
+    benchmark("build_and_validate", f"{case}_deferred")(
+        lambda _: _build_deferred_and_validate(builder)
+    )
+    benchmark("validation", case, builder)(_uncached(Validator()))
+    benchmark("printing", case, builder)(_uncached(Printer()))
+    benchmark("pretty_printing", case, builder)(_uncached(Printer(pretty=True)))
+    benchmark("translation", case, builder)(_uncached(Translator()))
+    benchmark("streaming", case, builder)(_streamed)
+
+
+def _register_legacy_phase(case: str, builder: Callable[[], Dict[str, Any]]) -> None:
+    entity = "sessions" if builder()["dataset"] == "sessions" else "events"
+    benchmark("legacy", case, builder)(lambda body: json_to_snql(body, entity))
+
+
+for case, query_builder in QUERIES.items():
+    _register_query_phases(case, query_builder)
+
+# The contextual checks of the validator on a query built from scratch, so the
+# cost of comparing expressions that were never compared before is included.
+benchmark("validation", "wide_groupby_cold")(
+    lambda _: Validator().visit(QUERIES["wide_groupby"]())
+)
+
+# The query is about 10 MB, so the peak memory shows the copies of it made by
+# the Translator, compared with streaming it in chunks.
+benchmark("translation", "huge_in", huge_in_query, slow=True)(_uncached(Translator()))
+benchmark("streaming", "huge_in", huge_in_query, slow=True)(_streamed)
+
+for case, body_builder in LEGACY_BODIES.items():
+    _register_legacy_phase(case, body_builder)
@@ -0,0 +1,67 @@
+from array import array
+from typing import Any, List, Tuple
+
+from benchmarks.harness import benchmark
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.expressions import Column, is_scalar
+from snuba_sdk.legacy import parse_scalar
+from snuba_sdk.snuba import check_array_type
+from snuba_sdk.visitors import _stringify_scalar, Translation
+
+LIST_SIZE = 100000
+TRANSLATION = Translation()
+
+
+def _ints() -> List[int]:
+    return list(range(LIST_SIZE))
+
+
+def _int_tuple() -> Tuple[int, ...]:
+    return tuple(range(LIST_SIZE))
+
+
+def _strings() -> List[str]:
+    return [f"release-{i}" for i in range(LIST_SIZE)]
+
+
+def _timestamps() -> List[str]:
+    # A few distinct timestamps, repeated as they are across a batch of queries
+    return [f"2021-01-0{i % 9 + 1}T03:04:05.000006" for i in range(LIST_SIZE)]
+
+
+benchmark("scalars", "is_scalar_100k_int_tuple", _int_tuple)(is_scalar)
+benchmark("scalars", "check_array_type_100k_ints", _ints)(check_array_type)
+benchmark("scalars", "check_array_type_100k_strings", _strings)(check_array_type)
+benchmark("scalars", "stringify_100k_ints", _ints)(_stringify_scalar)
+benchmark("scalars", "stringify_100k_int_tuple", _int_tuple)(_stringify_scalar)
+benchmark("scalars", "stringify_100k_strings", _strings)(_stringify_scalar)
+benchmark("scalars", "parse_scalar_100k_strings", _strings)(parse_scalar)
+benchmark("scalars", "parse_scalar_100k_timestamps", _timestamps)(parse_scalar)
+
+
+@benchmark("scalars", "in_condition_100k_ints", _int_tuple)
+def in_condition(values: Any) -> None:
+    TRANSLATION.visit(Condition(Column("project_id"), Op.IN, values))
+
+
+def _int_array() -> "array[int]":
+    return array("q", range(LIST_SIZE))
+
+
+benchmark("scalars", "stringify_100k_array_array", _int_array)(_stringify_scalar)
+
+try:
+    import numpy
+except ImportError:
+    pass
+else:
+    benchmark(
+        "scalars",
+        "stringify_100k_numpy",
+        lambda: numpy.arange(LIST_SIZE, dtype=numpy.int64),
+    )(_stringify_scalar)
+    benchmark(
+        "scalars",
+        "is_scalar_100k_numpy",
+        lambda: numpy.arange(LIST_SIZE, dtype=numpy.int64),
+    )(is_scalar)
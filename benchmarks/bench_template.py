@@ -0,0 +1,46 @@
+from datetime import timedelta
+from typing import Any
+
+from benchmarks.corpus import END, START
+from benchmarks.harness import benchmark
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import Column, Function, Param
+from snuba_sdk.query import PreparedQuery, Query
+
+
+def _dashboard_query(project_id: Any, start: Any, end: Any, limit: Any) -> Query:
+    return (
+        Query("discover", Entity("events"))
+        .set_select(
+            [
+                Column("title"),
+                Function("count", [], "count"),
+                Function("uniq", [Column("user")], "uniq_user"),
+            ]
+        )
+        .set_groupby([Column("title")])
+        .set_where(
+            [
+                Condition(Column("project_id"), Op.EQ, project_id),
+                Condition(Column("timestamp"), Op.GTE, start),
+                Condition(Column("timestamp"), Op.LT, end),
+            ]
+        )
+        .set_limit(limit)
+    )
+
+
+def _prepare() -> PreparedQuery:
+    params = (Param("project_id"), Param("start"), Param("end"), Param("limit"))
+    return _dashboard_query(*params).prepare()
+
+
+@benchmark("templates", "rebuild_and_translate")
+def rebuild(_: None) -> None:
+    _dashboard_query(1, START, END, 100).snuba()
+
+
+@benchmark("templates", "bind", _prepare)
+def bind(prepared: PreparedQuery) -> None:
+    prepared.snuba(project_id=1, start=START, end=END + timedelta(seconds=1), limit=100)
@@ -0,0 +1,48 @@
+from typing import List
+
+from benchmarks.harness import benchmark
+from snuba_sdk.expressions import (
+    Column,
+    Consistent,
+    Debug,
+    Expression,
+    Function,
+    Granularity,
+    Limit,
+    Offset,
+    Totals,
+    Turbo,
+)
+from snuba_sdk.visitors import Translation
+
+NODE_COUNT = 1000
+TRANSLATION = Translation()
+
+
+def _mixed_nodes() -> List[Expression]:
+    kinds: List[Expression] = [
+        Column("event_id"),
+        Function("count", [], "count"),
+        Limit(10),
+        Offset(0),
+        Granularity(60),
+        Totals(True),
+        Consistent(True),
+        Turbo(True),
+        Debug(True),
+    ]
+    return [kinds[i % len(kinds)] for i in range(NODE_COUNT)]
+
+
+def _late_dispatch_nodes() -> List[Expression]:
+    # The types that used to be at the end of the isinstance chain
+    return [Debug(True) for _ in range(NODE_COUNT)]
+
+
+def _visit_all(nodes: List[Expression]) -> None:
+    for node in nodes:
+        TRANSLATION.visit(node)
+
+
+benchmark("dispatch", f"mixed_{NODE_COUNT}_nodes", _mixed_nodes)(_visit_all)
+benchmark("dispatch", f"late_{NODE_COUNT}_nodes", _late_dispatch_nodes)(_visit_all)
@@ -0,0 +1,195 @@
+"""
+Queries and legacy bodies of various shapes, used as input by the benchmarks.
+Builders are functions so that the construction of the query can be timed too.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Mapping, Union
+
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    CurriedFunction,
+    Direction,
+    Function,
+    Granularity,
+    Limit,
+    LimitBy,
+    Offset,
+    OrderBy,
+)
+from snuba_sdk.query import Query
+
+END = datetime(2021, 1, 15, 20, 51, 47, 110825)
+START = END - timedelta(days=90)
+
+NESTING_DEPTH = 100
+IN_LIST_SIZE = 10000
+SELECT_SIZE = 500
+GROUPBY_SIZE = 1000
+# Enough 32 character ids that the printed query is about 10 MB
+HUGE_IN_LIST_SIZE = 280000
+
+
+def small_query() -> Query:
+    return Query(
+        dataset="discover",
+        match=Entity("events"),
+        select=[Column("event_id")],
+        where=[Condition(Column("timestamp"), Op.GT, START)],
+        limit=Limit(10),
+    )
+
+
+def typical_query() -> Query:
+    return Query(
+        dataset="discover",
+        match=Entity("events", 0.2),
+        select=[
+            Column("title"),
+            Column("tags[release]"),
+            Function("uniq", [Column("user")], "uniq_user"),
+            Function("count", [], "count"),
+            CurriedFunction("quantile", [0.95], [Column("duration")], "p95"),
+        ],
+        groupby=[Column("title"), Column("tags[release]")],
+        where=[
+            Condition(Column("timestamp"), Op.GT, START),
+            Condition(Column("timestamp"), Op.LTE, END),
+            Condition(Column("project_id"), Op.IN, [1, 2, 3, 4, 5]),
+            Condition(Function("ifNull", [Column("environment"), ""]), Op.EQ, "prod"),
+        ],
+        having=[Condition(Function("count", []), Op.GT, 10)],
+        orderby=[OrderBy(Column("title"), Direction.ASC)],
+        limitby=LimitBy(Column("title"), 5),
+        limit=Limit(100),
+        offset=Offset(0),
+        granularity=Granularity(3600),
+    )
+
+
+def deep_nesting_query() -> Query:
+    exp: Any = Column("duration")
+    for i in range(NESTING_DEPTH):
+        exp = Function("plus", [exp, i])
+
+    return Query(
+        dataset="discover",
+        match=Entity("events"),
+        select=[Function("abs", [exp], "deep")],
+        where=[Condition(Column("timestamp"), Op.GT, START)],
+    )
+
+
+def large_in_query() -> Query:
+    return Query(
+        dataset="discover",
+        match=Entity("events"),
+        select=[Column("event_id")],
+        where=[
+            Condition(Column("timestamp"), Op.GT, START),
+            Condition(Column("project_id"), Op.IN, tuple(range(IN_LIST_SIZE))),
+        ],
+    )
+
+
+def huge_in_query() -> Query:
+    # Not in QUERIES, since it is too large to run through every benchmark
+    event_ids = [f"{i:032x}" for i in range(HUGE_IN_LIST_SIZE)]
+    return Query(
+        dataset="discover",
+        match=Entity("events"),
+        select=[Column("title")],
+        where=[
+            Condition(Column("timestamp"), Op.GT, START),
+            Condition(Column("event_id"), Op.IN, event_ids),
+        ],
+    )
+
+
+def wide_select_query() -> Query:
+    columns: List[Union[Column, CurriedFunction, Function]] = [
+        Column(f"column_{i}") for i in range(SELECT_SIZE)
+    ]
+    return Query(
+        dataset="discover",
+        match=Entity("events"),
+        select=columns + [Function("count", [], "count")],
+        groupby=columns,
+        where=[Condition(Column("timestamp"), Op.GT, START)],
+    )
+
+
+def wide_groupby_query() -> Query:
+    # The groupby is built separately from the select, in the reverse order,
+    # as it is when the two clauses come from different parts of a request.
+    return Query(
+        dataset="discover",
+        match=Entity("events"),
+        select=[Column(f"column_{i}") for i in range(GROUPBY_SIZE)]
+        + [Function("count", [], "count")],
+        groupby=[Column(f"column_{i}") for i in reversed(range(GROUPBY_SIZE))],
+        where=[Condition(Column("timestamp"), Op.GT, START)],
+        limitby=LimitBy(Column(f"column_{GROUPBY_SIZE - 1}"), 1),
+    )
+
+
+QUERIES: Mapping[str, Callable[[], Query]] = {
+    "small": small_query,
+    "typical": typical_query,
+    "deep_nesting": deep_nesting_query,
+    "large_in": large_in_query,
+    "wide_select": wide_select_query,
+    "wide_groupby": wide_groupby_query,
+}
+
+
+def small_legacy_body() -> Dict[str, Any]:
+    return {
+        "dataset": "events",
+        "selected_columns": ["event_id"],
+        "project": [1],
+        "from_date": START.isoformat(),
+        "to_date": END.isoformat(),
+        "limit": 10,
+    }
+
+
+def typical_legacy_body() -> Dict[str, Any]:
+    return {
+        "dataset": "sessions",
+        "selected_columns": ["project_id", "release"],
+        "aggregations": [
+            ["count()", "", "count"],
+            ["uniq", "user", "uniq_user"],
+            ["quantile(0.95)", "duration", "p95"],
+        ],
+        "groupby": ["release", "project_id"],
+        "conditions": [
+            ["environment", "=", "production"],
+            ["bucketed_started", ">", START.isoformat()],
+        ],
+        "having": [["count", ">", 10]],
+        "orderby": "-count",
+        "project": [1, 2, 3],
+        "organization": 1,
+        "from_date": START.isoformat(),
+        "to_date": END.isoformat(),
+        "limit": 100,
+        "offset": 0,
+        "granularity": 3600,
+    }
+
+
+def large_in_legacy_body() -> Dict[str, Any]:
+    body = small_legacy_body()
+    body["conditions"] = [["group_id", "IN", list(range(IN_LIST_SIZE))]]
+    return body
+
+
+LEGACY_BODIES: Mapping[str, Callable[[], Dict[str, Any]]] = {
+    "small": small_legacy_body,
+    "typical": typical_legacy_body,
+    "large_in": large_in_legacy_body,
+}
@@ -0,0 +1,145 @@
+import importlib
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    """
+    A single timed operation. ``setup`` is called once and its return value is
+    passed to every call of ``run``, so only the work in ``run`` is measured.
+
+    :param name: A unique name, in the form ``phase:case``.
+    :type name: str
+    :param phase: The phase of the SDK being measured, e.g. ``validation``.
+    :type phase: str
+    :param run: The operation to time.
+    :type run: Callable[[Any], Any]
+    :param setup: Builds the input for ``run``.
+    :type setup: Callable[[], Any]
+    :param slow: Whether a single run takes long or starts processes, in which
+        case the test suite doesn't run it.
+    :type slow: bool
+
+    """
+
+    name: str
+    phase: str
+    run: Callable[[Any], Any]
+    setup: Callable[[], Any] = lambda: None
+    slow: bool = False
+
+
+@dataclass(frozen=True)
+class Result:
+    name: str
+    phase: str
+    runs: int
+    seconds: float
+    peak_memory: int
+
+    @property
+    def per_second(self) -> float:
+        return self.runs / self.seconds if self.seconds > 0 else float("inf")
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"per_second": self.per_second, "peak_memory": self.peak_memory}
+
+
+BENCHMARKS: List[Benchmark] = []
+
+# Modules that register benchmarks when imported.
+BENCHMARK_MODULES = (
+    "benchmarks.bench_codec",
+    "benchmarks.bench_compile",
+    "benchmarks.bench_import",
+    "benchmarks.bench_memory",
+    "benchmarks.bench_pagination",
+    "benchmarks.bench_parser",
+    "benchmarks.bench_query",
+    "benchmarks.bench_scalars",
+    "benchmarks.bench_template",
+    "benchmarks.bench_visitors",
+)
+
+
+def load_benchmarks() -> List[Benchmark]:
+    for module in BENCHMARK_MODULES:
+        importlib.import_module(module)
+    return BENCHMARKS
+
+
+def benchmark(
+    phase: str, case: str, setup: Optional[Callable[[], Any]] = None, slow: bool = False
+) -> Callable[[Callable[[Any], Any]], Callable[[Any], Any]]:
+    """
+    Register the decorated function as a benchmark of ``phase`` on ``case``.
+    """
+
+    def register(run: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        bench = Benchmark(f"{phase}:{case}", phase, run, setup or (lambda: None), slow)
+        BENCHMARKS.append(bench)
+        return run
+
+    return register
+
+
+def measure(bench: Benchmark, min_time: float = 0.5, max_runs: int = 100000) -> Result:
+    """
+    Run a benchmark repeatedly for at least ``min_time`` seconds (and at least
+    once) and record the throughput. Peak memory is measured on a separate run,
+    since tracing allocations skews the timings.
+    """
+    state = bench.setup()
+    bench.run(state)  # Warm up any caches and imports
+
+    runs = 0
+    elapsed = 0.0
+    start = time.perf_counter()
+    while runs == 0 or (elapsed < min_time and runs < max_runs):
+        bench.run(state)
+        runs += 1
+        elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        bench.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(bench.name, bench.phase, runs, elapsed, peak)
+
+
+def find_regressions(
+    results: Sequence[Result],
+    baseline: Mapping[str, Mapping[str, float]],
+    threshold: float,
+) -> List[str]:
+    """
+    Compare results against a saved baseline. A benchmark regresses if its
+    throughput dropped, or its peak memory grew, by more than ``threshold``
+    (a fraction, e.g. 0.25 for 25%). Benchmarks missing from the baseline are
+    ignored.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected is None:
+            continue
+
+        min_speed = expected["per_second"] * (1 - threshold)
+        if result.per_second < min_speed:
+            regressions.append(
+                f"{result.name}: {result.per_second:,.1f}/s is below {min_speed:,.1f}/s"
+            )
+
+        max_memory = expected["peak_memory"] * (1 + threshold)
+        if result.peak_memory > max_memory:
+            regressions.append(
+                f"{result.name}: peak memory {result.peak_memory:,}B is above {max_memory:,.0f}B"
+            )
+
+    return regressions
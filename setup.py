@@ -31,7 +31,7 @@ setup(
     description="Snuba SDK for generating SnQL queries.",
     long_description=get_file_text("README.md"),
     long_description_content_type="text/markdown",
-    packages=find_packages(exclude=("tests", "tests.*")),
+    packages=find_packages(exclude=("tests", "tests.*", "benchmarks", "benchmarks.*")),
     # PEP 561
     package_data={"snuba_sdk": ["py.typed"]},
     zip_safe=False,
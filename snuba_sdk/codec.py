@@ -0,0 +1,667 @@
+"""
+A compact binary encoding of queries and expression trees, used to pass them
+between processes or to store them in a cache.
+
+An encoded payload starts with a magic number and the version of the format,
+followed by a table of the distinct strings in the tree, e.g. column and
+function names, and then the tree itself. Every node refers to its strings by
+their index in the table, integers are stored as variable length integers,
+long lists of integers as packed arrays and datetimes as a count of
+microseconds. The tree is stored in postfix order, the children of a node
+before the node itself, so it is decoded with a single loop over the payload.
+
+Payloads are decoded by calling the constructors of the nodes, so they are
+validated the same way as nodes built in code. Payloads from a trusted source,
+e.g. ones encoded by this process, can be decoded with ``trusted=True`` to
+skip the validation. Pickling a Query or an expression uses this encoding, and
+unpickling decodes it as trusted.
+
+Queries and expressions can also be converted to and from dicts of JSON
+compatible values with :func:`to_dict` and :func:`from_dict`, e.g. to log them
+as JSON and replay them later.
+"""
+
+import pickle
+import re
+import struct
+import sys
+from array import array
+from dataclasses import fields
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Callable, cast, Dict, List, Mapping, Sequence, Tuple, Union
+
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    Consistent,
+    CurriedFunction,
+    Debug,
+    Direction,
+    Expression,
+    Function,
+    Granularity,
+    LazyPattern,
+    Limit,
+    LimitBy,
+    Offset,
+    OrderBy,
+    Param,
+    Totals,
+    Turbo,
+)
+from snuba_sdk.query import (
+    check_groupby,
+    check_having,
+    check_limitby,
+    check_match,
+    check_orderby,
+    check_select,
+    check_where,
+    Query,
+)
+from snuba_sdk.query_visitors import InvalidQuery
+
+MAGIC = b"SNQ"
+FORMAT_VERSION = 1
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+# The position of a type in these lists is its code in the encoding, so types
+# can only be added at the end without changing the version of the format.
+NODE_TYPES: Sequence[type] = (
+    Column,
+    CurriedFunction,
+    Function,
+    Condition,
+    Entity,
+    OrderBy,
+    LimitBy,
+    Limit,
+    Offset,
+    Granularity,
+    Totals,
+    Consistent,
+    Turbo,
+    Debug,
+    Param,
+)
+ENUM_TYPES: Sequence[type] = (Op, Direction)
+
+# The tags that start each encoded value
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_STR = 5
+_BYTES = 6
+_DATETIME = 7
+_DATETIME_TZ = 8
+_DATE = 9
+_LIST = 10
+_TUPLE = 11
+_INT_LIST = 12
+_INT_TUPLE = 13
+_NODE = 14
+_ENUM = 15
+_QUERY = 16
+_PICKLE = 17
+
+# Lists of integers at least this long are packed into an array of the first
+# of these types that can hold all of them.
+_INT_ARRAY_SIZE = 8
+_INT_ARRAY_TYPECODES = ("b", "h", "i", "q")
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_QUERY_FIELDS = tuple(f.name for f in fields(Query))
+
+_NODE_CODES = {node_type: code for code, node_type in enumerate(NODE_TYPES)}
+_ENUM_CODES = {enum_type: code for code, enum_type in enumerate(ENUM_TYPES)}
+
+
+@lru_cache(maxsize=None)
+def _node_fields(node_type: type) -> Tuple[Tuple[str, ...], Tuple[bool, ...]]:
+    # The names of the fields that are encoded, and whether each one is passed
+    # to the constructor. Private fields, e.g. memoized values, are not encoded.
+    node_fields = [f for f in fields(node_type) if not f.name.startswith("_")]
+    return tuple(f.name for f in node_fields), tuple(f.init for f in node_fields)
+
+
+def _check_node(
+    node_type: type, clause: str, optional: bool = True
+) -> Callable[[Any], Any]:
+    def check(value: Any) -> Any:
+        if not isinstance(value, node_type) and not (optional and value is None):
+            raise InvalidQuery(f"{clause} clause must be a {node_type.__name__}")
+        return value
+
+    return check
+
+
+def _optional(check: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda value: value if value is None else check(value)
+
+
+# The checks applied to the clauses of a query from an untrusted payload, the
+# same ones as the set functions of Query. The dataset is checked by Query.
+_QUERY_CHECKS: Mapping[str, Callable[[Any], Any]] = {
+    "dataset": lambda value: value,
+    "match": check_match,
+    "select": _optional(check_select),
+    "groupby": _optional(check_groupby),
+    "where": _optional(check_where),
+    "having": _optional(check_having),
+    "orderby": _optional(check_orderby),
+    "limitby": _optional(check_limitby),
+    "limit": _check_node(Limit, "limit"),
+    "offset": _check_node(Offset, "offset"),
+    "granularity": _check_node(Granularity, "granularity"),
+    "totals": _check_node(Totals, "totals", optional=False),
+    "consistent": _check_node(Consistent, "consistent", optional=False),
+    "turbo": _check_node(Turbo, "turbo", optional=False),
+    "debug": _check_node(Debug, "debug", optional=False),
+}
+
+
+def _build_query(values: Dict[str, Any], trusted: bool) -> Query:
+    if not trusted:
+        for name, value in values.items():
+            _QUERY_CHECKS[name](value)
+    return Query(**values)
+
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.out = bytearray()
+        self.strings: Dict[str, int] = {}
+
+    def write_uint(self, value: int) -> None:
+        out = self.out
+        while value > 0x7F:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    def write_int(self, value: int) -> None:
+        # Zigzag encoding, so small negative numbers are also short
+        self.write_uint(value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+    def write_str(self, value: str) -> None:
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        self.write_uint(index)
+
+    def write(self, value: Any) -> None:
+        out = self.out
+        value_type: type = type(value)
+        if value_type is str:
+            out.append(_STR)
+            self.write_str(value)
+        elif value_type in _NODE_CODES:
+            for name in _node_fields(value_type)[0]:
+                self.write(getattr(value, name))
+            out.append(_NODE)
+            out.append(_NODE_CODES[value_type])
+        elif value_type is list or value_type is tuple:
+            if len(value) >= _INT_ARRAY_SIZE and self.write_int_array(value):
+                return
+            for item in value:
+                self.write(item)
+            out.append(_LIST if value_type is list else _TUPLE)
+            self.write_uint(len(value))
+        elif value is None:
+            out.append(_NONE)
+        elif value_type is bool:
+            out.append(_TRUE if value else _FALSE)
+        elif value_type is int:
+            out.append(_INT)
+            self.write_int(value)
+        elif value_type is float:
+            out.append(_FLOAT)
+            out += struct.pack(">d", value)
+        elif value_type is datetime:
+            self.write_datetime(value)
+        elif value_type is date:
+            out.append(_DATE)
+            self.write_uint(value.toordinal())
+        elif value_type is bytes:
+            out.append(_BYTES)
+            self.write_uint(len(value))
+            out += value
+        elif value_type in _ENUM_CODES:
+            out.append(_ENUM)
+            out.append(_ENUM_CODES[value_type])
+            self.write_str(value.value)
+        elif value_type is Query:
+            for name in value.get_fields():
+                self.write(getattr(value, name))
+            out.append(_QUERY)
+        else:
+            self.write_pickle(value)
+
+    def write_int_array(self, value: Sequence[Any]) -> bool:
+        if set(map(type, value)) != {int}:
+            return False
+        low, high = min(value), max(value)
+        for typecode in _INT_ARRAY_TYPECODES:
+            bits = array(typecode).itemsize * 8
+            if -(1 << (bits - 1)) <= low and high < 1 << (bits - 1):
+                break
+        else:
+            return False
+
+        values = array(typecode, value)
+        if sys.byteorder == "big":
+            values.byteswap()
+        self.out.append(_INT_LIST if type(value) is list else _INT_TUPLE)
+        self.out.append(ord(typecode))
+        self.write_uint(len(value))
+        self.out += values.tobytes()
+        return True
+
+    def write_datetime(self, value: datetime) -> None:
+        tzinfo = value.tzinfo
+        if tzinfo is None:
+            self.out.append(_DATETIME)
+            self.write_int((value - _EPOCH) // _MICROSECOND)
+            return
+
+        offset = tzinfo.utcoffset(value)
+        if (
+            offset is None
+            or type(tzinfo) is not timezone
+            or tzinfo.tzname(value) != timezone(offset).tzname(value)
+        ):
+            # Time zones with rules or names can't be stored as an offset
+            self.write_pickle(value)
+            return
+
+        self.out.append(_DATETIME_TZ)
+        self.write_int((value.replace(tzinfo=None) - _EPOCH) // _MICROSECOND)
+        self.write_int(offset // _MICROSECOND)
+
+    def write_pickle(self, value: Any) -> None:
+        # Anything else, e.g. NumPy arrays, is pickled
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.out.append(_PICKLE)
+        self.write_uint(len(data))
+        self.out += data
+
+    def payload(self) -> bytes:
+        header = _Encoder()
+        header.out += MAGIC
+        header.out.append(FORMAT_VERSION)
+        header.write_uint(len(self.strings))
+        for string in self.strings:
+            encoded = string.encode("utf-8", "surrogatepass")
+            header.write_uint(len(encoded))
+            header.out += encoded
+        return bytes(header.out + self.out)
+
+
+def encode(value: Union[Query, Expression]) -> bytes:
+    """
+    Encode a query or an expression tree.
+    """
+    encoder = _Encoder()
+    encoder.write(value)
+    return encoder.payload()
+
+
+def _read_uint(data: bytes, pos: int) -> Tuple[int, int]:
+    # Returns the value and the position after it
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _read_int(data: bytes, pos: int) -> Tuple[int, int]:
+    value, pos = _read_uint(data, pos)
+    return (value >> 1 if not value & 1 else -((value + 1) >> 1)), pos
+
+
+def _pop(stack: List[Any], count: int) -> List[Any]:
+    if count == 0:
+        return []
+    if count > len(stack):
+        raise InvalidPayload("not enough values in the payload")
+    values = stack[-count:]
+    del stack[-count:]
+    return values
+
+
+def _decode(data: bytes, trusted: bool) -> Any:
+    if data[: len(MAGIC)] != MAGIC:
+        raise InvalidPayload("not an encoded query or expression")
+    version = data[len(MAGIC)]
+    if version != FORMAT_VERSION:
+        raise InvalidPayload(f"unsupported format version {version}")
+
+    count, pos = _read_uint(data, len(MAGIC) + 1)
+    strings: List[str] = []
+    for _ in range(count):
+        size, pos = _read_uint(data, pos)
+        if pos + size > len(data):
+            raise InvalidPayload("truncated string table")
+        strings.append(data[pos : pos + size].decode("utf-8", "surrogatepass"))
+        pos += size
+
+    # The values are pushed on a stack, and each node or list pops its items
+    stack: List[Any] = []
+    push = stack.append
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        if tag == _STR:
+            index = data[pos]
+            if index < 0x80:
+                pos += 1
+            else:
+                index, pos = _read_uint(data, pos)
+            push(strings[index])
+        elif tag == _NODE:
+            node_type = NODE_TYPES[data[pos]]
+            pos += 1
+            names, init = _node_fields(node_type)
+            values = _pop(stack, len(names))
+            node: Any
+            if trusted:
+                node = object.__new__(node_type)
+                for name, value in zip(names, values):
+                    object.__setattr__(node, name, value)
+            else:
+                node = node_type(
+                    **{name: value for name, value, i in zip(names, values, init) if i}
+                )
+            push(node)
+        elif tag == _LIST or tag == _TUPLE:
+            count = data[pos]
+            if count < 0x80:
+                pos += 1
+            else:
+                count, pos = _read_uint(data, pos)
+            items = _pop(stack, count)
+            push(items if tag == _LIST else tuple(items))
+        elif tag == _INT:
+            number = data[pos]
+            if number < 0x80:
+                pos += 1
+                push(number >> 1 if not number & 1 else -((number + 1) >> 1))
+            else:
+                number, pos = _read_int(data, pos)
+                push(number)
+        elif tag == _NONE:
+            push(None)
+        elif tag == _FALSE:
+            push(False)
+        elif tag == _TRUE:
+            push(True)
+        elif tag == _INT_LIST or tag == _INT_TUPLE:
+            packed = array(chr(data[pos]))
+            count, pos = _read_uint(data, pos + 1)
+            size = packed.itemsize * count
+            if pos + size > end:
+                raise InvalidPayload("truncated array")
+            packed.frombytes(data[pos : pos + size])
+            pos += size
+            if sys.byteorder == "big":
+                packed.byteswap()
+            push(packed.tolist() if tag == _INT_LIST else tuple(packed))
+        elif tag == _FLOAT:
+            push(struct.unpack_from(">d", data, pos)[0])
+            pos += 8
+        elif tag == _DATETIME:
+            micros, pos = _read_int(data, pos)
+            push(_EPOCH + micros * _MICROSECOND)
+        elif tag == _DATETIME_TZ:
+            micros, pos = _read_int(data, pos)
+            offset, pos = _read_int(data, pos)
+            tzinfo = timezone(offset * _MICROSECOND)
+            push((_EPOCH + micros * _MICROSECOND).replace(tzinfo=tzinfo))
+        elif tag == _DATE:
+            ordinal, pos = _read_uint(data, pos)
+            push(date.fromordinal(ordinal))
+        elif tag == _BYTES:
+            size, pos = _read_uint(data, pos)
+            if pos + size > end:
+                raise InvalidPayload("truncated bytes")
+            push(data[pos : pos + size])
+            pos += size
+        elif tag == _ENUM:
+            enum_type: Any = ENUM_TYPES[data[pos]]
+            index, pos = _read_uint(data, pos + 1)
+            push(enum_type(strings[index]))
+        elif tag == _QUERY:
+            values = _pop(stack, len(_QUERY_FIELDS))
+            push(_build_query(dict(zip(_QUERY_FIELDS, values)), trusted))
+        elif tag == _PICKLE:
+            if not trusted:
+                raise InvalidPayload("pickled values can only be decoded if trusted")
+            size, pos = _read_uint(data, pos)
+            push(pickle.loads(data[pos : pos + size]))
+            pos += size
+        else:
+            raise InvalidPayload(f"unknown tag {tag}")
+
+    if len(stack) != 1:
+        raise InvalidPayload("the payload must contain a single value")
+    return stack[0]
+
+
+def decode(data: bytes, trusted: bool = False) -> Any:
+    """
+    Decode a query or an expression tree encoded with :func:`encode`.
+
+    :param trusted: Skip validating the nodes. Only use it for payloads that
+        were encoded by the SDK, since the nodes are built as they are.
+    :type trusted: bool
+
+    :raises InvalidPayload: If the payload is not a valid encoding.
+    :raises InvalidExpression: If a node in the payload is not valid.
+
+    """
+    try:
+        return _decode(data, trusted)
+    except (IndexError, KeyError, TypeError, UnicodeDecodeError, ValueError) as e:
+        raise InvalidPayload(f"invalid payload: {e!r}") from e
+
+
+def reduce(value: Union[Query, Expression]) -> Tuple[Any, ...]:
+    """
+    The implementation of ``__reduce__`` for queries and expressions, which
+    pickles them with this encoding. Subclasses that the encoding doesn't know
+    about are pickled with the values of their fields instead.
+    """
+    value_type = type(value)
+    if value_type is Query or value_type in _NODE_CODES:
+        return (_decode_trusted, (encode(value),))
+    state = {f.name: getattr(value, f.name) for f in fields(cast(Any, value))}
+    return (_restore, (value_type, state))
+
+
+def _decode_trusted(data: bytes) -> Any:
+    return decode(data, trusted=True)
+
+
+def _restore(value_type: type, state: Mapping[str, Any]) -> Any:
+    value: Any = object.__new__(value_type)
+    for name, field_value in state.items():
+        object.__setattr__(value, name, field_value)
+    return value
+
+
+_JSON_SCALARS = frozenset({str, int, float, bool, type(None)})
+_DICT_NODE_TYPES = {node_type.__name__: node_type for node_type in NODE_TYPES}
+_DICT_ENUM_TYPES = {enum_type.__name__: enum_type for enum_type in ENUM_TYPES}
+
+_datetime_re = LazyPattern(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}", re.ASCII)
+_date_re = LazyPattern(r"\d{4}-\d\d-\d\d", re.ASCII)
+
+
+def _to_dict(value: Any) -> Any:
+    value_type: type = type(value)
+    if value_type in _JSON_SCALARS:
+        return value
+    elif value_type in _NODE_CODES:
+        encoded = {"type": value_type.__name__}
+        for name in _node_fields(value_type)[0]:
+            field = getattr(value, name)
+            if type(field) not in _JSON_SCALARS:
+                field = _to_dict(field)
+            encoded[name] = field
+        return encoded
+    elif value_type is list:
+        if _JSON_SCALARS.issuperset(map(type, value)):
+            return list(value)
+        return list(map(_to_dict, value))
+    elif value_type is tuple:
+        return {"type": "tuple", "items": _to_dict(list(value))}
+    elif value_type in _ENUM_CODES:
+        return {"type": value_type.__name__, "value": value.value}
+    elif value_type is datetime:
+        offset = value.utcoffset()
+        if value.tzinfo is not None and (
+            offset is None
+            or type(value.tzinfo) is not timezone
+            or value.tzname() != timezone(offset).tzname(value)
+        ):
+            raise TypeError(f"{value!r}: only fixed UTC offsets can be converted")
+        return {
+            "type": "datetime",
+            "value": value.replace(tzinfo=None).isoformat(timespec="microseconds"),
+            "offset": None if offset is None else offset // _MICROSECOND,
+        }
+    elif value_type is date:
+        return {"type": "date", "value": value.isoformat()}
+    elif value_type is bytes:
+        from base64 import b64encode
+
+        return {"type": "bytes", "value": b64encode(value).decode("ascii")}
+    elif value_type is Query:
+        encoded = {"type": "Query"}
+        for name in _QUERY_FIELDS:
+            encoded[name] = _to_dict(getattr(value, name))
+        return encoded
+    raise TypeError(f"{value!r} of type {value_type.__name__} can't be converted")
+
+
+def to_dict(value: Union[Query, Expression]) -> Dict[str, Any]:
+    """
+    Convert a query or an expression tree to a dict that can be serialized as
+    JSON, and converted back with :func:`from_dict`. Every node, and every value
+    that JSON has no type for, e.g. tuples and datetimes, is a dict with a
+    ``type`` key::
+
+        >>> to_dict(Column("tags[release]"))
+        {'type': 'Column', 'name': 'tags[release]', 'subscriptable': 'tags', 'key': 'release'}
+
+    :raises TypeError: If the tree contains a value that can't be converted,
+        e.g. a datetime with a time zone that isn't a fixed UTC offset.
+
+    """
+    encoded: Dict[str, Any] = _to_dict(value)
+    return encoded
+
+
+def _from_dict(data: Any, trusted: bool) -> Any:
+    data_type: type = type(data)
+    if data_type is list:
+        if _JSON_SCALARS.issuperset(map(type, data)):
+            return list(data)
+        return [_from_dict(item, trusted) for item in data]
+    elif data_type is not dict:
+        if data_type not in _JSON_SCALARS:
+            raise InvalidPayload(f"unexpected value of type {data_type.__name__}")
+        return data
+
+    value_type = data["type"]
+    node_type = _DICT_NODE_TYPES.get(value_type)
+    if node_type is not None:
+        names, init = _node_fields(node_type)
+        node: Any
+        if trusted:
+            node = object.__new__(node_type)
+            for name in names:
+                object.__setattr__(node, name, _from_dict(data[name], trusted))
+        else:
+            node = node_type(
+                **{
+                    name: _from_dict(data[name], trusted)
+                    for name, i in zip(names, init)
+                    if i
+                }
+            )
+        return node
+    elif value_type == "tuple":
+        return tuple(_from_dict(data["items"], trusted))
+    elif value_type == "datetime":
+        text = data["value"]
+        if not _datetime_re.fullmatch(text):
+            raise InvalidPayload(f"invalid datetime {text!r}")
+        offset = data["offset"]
+        return datetime(
+            int(text[0:4]),
+            int(text[5:7]),
+            int(text[8:10]),
+            int(text[11:13]),
+            int(text[14:16]),
+            int(text[17:19]),
+            int(text[20:26]),
+            None if offset is None else timezone(offset * _MICROSECOND),
+        )
+    elif value_type == "date":
+        text = data["value"]
+        if not _date_re.fullmatch(text):
+            raise InvalidPayload(f"invalid date {text!r}")
+        return date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+    elif value_type == "bytes":
+        from base64 import b64decode
+
+        return b64decode(data["value"], validate=True)
+    elif value_type in _DICT_ENUM_TYPES:
+        enum_type: Any = _DICT_ENUM_TYPES[value_type]
+        return enum_type(data["value"])
+    elif value_type == "Query":
+        values = {
+            name: _from_dict(value, trusted)
+            for name, value in data.items()
+            if name != "type"
+        }
+        return _build_query(values, trusted)
+    raise InvalidPayload(f"unknown type {value_type!r}")
+
+
+def from_dict(data: Mapping[str, Any], trusted: bool = False) -> Any:
+    """
+    Convert a dict created by :func:`to_dict`, e.g. one loaded from JSON, back
+    to a query or an expression tree. The clauses of a query that are not in
+    the dict are left unset.
+
+    :param trusted: Skip validating the nodes. Only use it for dicts that were
+        created by the SDK, since the nodes are built as they are.
+    :type trusted: bool
+
+    :raises InvalidPayload: If the dict is not a valid conversion.
+    :raises InvalidExpression: If a node in the dict is not valid.
+    :raises InvalidQuery: If a clause of a query is not valid.
+
+    """
+    if type(data) is not dict:
+        raise InvalidPayload("the value must be a dict")
+    try:
+        return _from_dict(data, trusted)
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidPayload(f"invalid dict: {e!r}") from e
@@ -9,7 +9,9 @@ from snuba_sdk.expressions import (
     Function,
     InvalidExpression,
     is_scalar,
+    Param,
     ScalarType,
+    slotted,
 )
 
 
@@ -28,14 +30,33 @@ class Op(Enum):
     IS_NOT_NULL = "IS NOT NULL"
 
 
-@dataclass(frozen=True)
+UNARY_OPERATORS = frozenset([Op.IS_NULL, Op.IS_NOT_NULL])
+
+
+@slotted
+@dataclass(frozen=True, eq=False)
 class Condition(Expression):
+    """
+    A condition on the rows of a query, e.g. ``Condition(Column("a"), Op.EQ, 1)``.
+
+    :param lhs: The expression on the left of the operator.
+    :type lhs: Union[Column, CurriedFunction, Function]
+    :param op: The operator.
+    :type op: Op
+    :param rhs: The value on the right of the operator, None for the unary
+        operators.
+    :type rhs: Optional[Union[Column, CurriedFunction, Function, Param, ScalarType]]
+
+    :raises InvalidExpression: If the condition is not valid.
+
+    """
+
     lhs: Union[Column, CurriedFunction, Function]
     op: Op
-    rhs: Optional[Union[Column, CurriedFunction, Function, ScalarType]] = None
+    rhs: Optional[Union[Column, CurriedFunction, Function, Param, ScalarType]] = None
 
     def is_unary(self) -> bool:
-        return self.op in set([Op.IS_NULL, Op.IS_NOT_NULL])
+        return self.op in UNARY_OPERATORS
 
     def validate(self) -> None:
         if not isinstance(self.lhs, (Column, CurriedFunction, Function)):
@@ -54,7 +75,7 @@ class Condition(Expression):
                 )
 
         if not isinstance(
-            self.rhs, (Column, CurriedFunction, Function)
+            self.rhs, (Column, CurriedFunction, Function, Param)
         ) and not is_scalar(self.rhs):
             raise InvalidExpression(
                 f"invalid condition: RHS of a condition must be a Column, CurriedFunction, Function or Scalar not {type(self.rhs)}"
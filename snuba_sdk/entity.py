@@ -1,25 +1,38 @@
-import re
 from dataclasses import dataclass
 from typing import Optional, Union
 
-from snuba_sdk.expressions import Expression
+from snuba_sdk.expressions import Expression, NamePattern, slotted
 
 
-entity_name_re = re.compile(r"^[a-zA-Z_]+$")
+entity_name_re = NamePattern(r"^[a-zA-Z_]+$")
 
 
 class InvalidEntity(Exception):
     pass
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Entity(Expression):
+    """
+    The entity a query is run on, e.g. ``events``.
+
+    :param name: The name of the entity.
+    :type name: str
+    :param sample: The fraction of the rows to sample if a float, or the number
+        of rows if an integer.
+    :type sample: Optional[Union[int, float]]
+
+    :raises InvalidEntity: If the name or the sample is not valid.
+
+    """
+
     name: str
     sample: Optional[Union[int, float]] = None
 
     def validate(self) -> None:
         # TODO: There should be a whitelist of entity names at some point
-        if not isinstance(self.name, str) or not entity_name_re.match(self.name):
+        if not isinstance(self.name, str) or not entity_name_re.is_valid(self.name):
             raise InvalidEntity(f"{self.name} is not a valid entity name")
 
         if self.sample is not None:
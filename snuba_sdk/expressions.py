@@ -1,9 +1,31 @@
+import _thread
 import re
-from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
+import sys
+import weakref
+from abc import ABC, ABCMeta, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, MISSING
 from datetime import date, datetime
 from enum import Enum
-from typing import Any, List, Optional, Sequence, Set, Union
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Match,
+    Optional,
+    Pattern,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from snuba_sdk.snuba import check_array_type, is_aggregation_function
 
@@ -12,16 +34,378 @@ class InvalidExpression(Exception):
     pass
 
 
-class Expression(ABC):
+class _SlotDefault:
+    """
+    Stands in for the slot of a field that has a default value, between the
+    creation of the class and :func:`slotted`. The dataclass decorator reads the
+    default from the class, and fields that are not set when the instance is
+    created, e.g. those with ``init=False``, read it from the class as well.
+    Instances are read and written through the slot itself.
+    """
+
+    __slots__ = ("slot", "default", "inherited")
+
+    def __init__(self, slot: Any, default: Any, inherited: bool) -> None:
+        self.slot = slot
+        self.default = default
+        self.inherited = inherited
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        if instance is not None:
+            try:
+                return self.slot.__get__(instance, owner)
+            except AttributeError:
+                pass
+        if self.default is MISSING:
+            raise AttributeError(self.slot.__name__)
+        return self.default
+
+    def __set__(self, instance: Any, value: Any) -> None:
+        self.slot.__set__(instance, value)
+
+    def __delete__(self, instance: Any) -> None:
+        self.slot.__delete__(instance)
+
+
+class SlottedMeta(ABCMeta):
+    """
+    Creates the subclasses of Expression with a ``__slots__`` entry for each of
+    the fields they declare, so their instances don't carry a ``__dict__``.
+    Each class is only created once, instead of being recreated with slots
+    after the dataclass decorator ran. A class can declare ``__slots__`` of its
+    own for attributes that are not fields, such as a cached value, and the
+    slots of its fields are added to them.
+
+    The slots of fields with a default are wrapped in a :class:`_SlotDefault`,
+    so the dataclass decorator can read and replace the default without hiding
+    the slot. :func:`slotted` then puts the bare slots back, which are faster to
+    read, but classes that are not decorated with it work the same.
+    """
+
+    def __new__(
+        mcls,
+        name: str,
+        bases: Tuple[type, ...],
+        namespace: Dict[str, Any],
+        **kwargs: Any,
+    ) -> "SlottedMeta":
+        annotations = namespace.get("__annotations__")
+        if not annotations:
+            return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+        inherited = {
+            slot: klass.__dict__[slot]
+            for base in reversed(bases)
+            for klass in reversed(base.__mro__)
+            for slot in klass.__dict__.get("__slots__", ())
+        }
+        declared = tuple(namespace.get("__slots__", ()))
+        values = {n: namespace.pop(n) for n in annotations if n in namespace}
+        namespace["__slots__"] = declared + tuple(
+            n for n in annotations if n not in inherited and n not in declared
+        )
+        cls = super().__new__(mcls, name, bases, namespace, **kwargs)
+
+        for field_name, value in values.items():
+            slot = inherited.get(field_name) or cls.__dict__[field_name]
+            if isinstance(slot, _SlotDefault):
+                slot = slot.slot
+            wrapper = _SlotDefault(slot, value, field_name in inherited)
+            type.__setattr__(cls, field_name, wrapper)
+        return cls
+
+    def __setattr__(cls, name: str, value: Any) -> None:
+        wrapper = cls.__dict__.get(name)
+        if isinstance(wrapper, _SlotDefault):
+            wrapper.default = value
+        else:
+            super().__setattr__(name, value)
+
+    def __delattr__(cls, name: str) -> None:
+        wrapper = cls.__dict__.get(name)
+        if isinstance(wrapper, _SlotDefault):
+            wrapper.default = MISSING
+        else:
+            super().__delattr__(name)
+
+
+class Expression(ABC, metaclass=SlottedMeta):
+    # Expressions are dataclasses with a slotted layout, see SlottedMeta.
+    __slots__ = ("__weakref__", "_fingerprint")
+    _fingerprint: bytes
+
     def __post_init__(self) -> None:
-        self.validate()
+        if _deferred.depth:
+            _pending[id(self)] = self
+        else:
+            self.validate()
 
     @abstractmethod
     def validate(self) -> None:
         raise NotImplementedError
 
+    @property
+    def fingerprint(self) -> bytes:
+        """
+        A digest of the structure of the expression, computed once and built
+        from the fingerprints of its children. Two expressions have the same
+        fingerprint if and only if they are equal, so it can be used as a cache
+        key. Fields that are not compared, e.g. the alias of a function, are
+        not part of the fingerprint.
+        """
+        try:
+            return self._fingerprint
+        except AttributeError:
+            fingerprint = _fingerprint_node(self)
+            object.__setattr__(self, "_fingerprint", fingerprint)
+            return fingerprint
+
+    # The dataclasses are declared with eq=False so they use these instead.
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, Expression):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    # Slotted instances have no __dict__ for pickle and copy to fill. They are
+    # pickled with the compact encoding of snuba_sdk.codec instead.
+    def __reduce__(self) -> Tuple[Any, ...]:
+        from snuba_sdk.codec import reduce
+
+        return reduce(self)
+
+
+# threading.local is this class, but importing threading costs more than the
+# rest of the module, while _thread is always loaded.
+class _Deferred(_thread._local):
+    depth = 0
+
+
+_deferred = _Deferred()
+
+# Nodes built inside deferred_validation that haven't been validated yet, keyed
+# on their id. They are held weakly, so nodes that are never used are dropped.
+_pending: "weakref.WeakValueDictionary[int, Expression]" = weakref.WeakValueDictionary()
 
-# For type hinting
+
+@contextmanager
+def deferred_validation() -> Iterator[None]:
+    """
+    Don't validate the expressions built inside this context when they are
+    created. Instead they are validated when they are first needed: queries
+    that contain them validate them, in a single pass over the query, the
+    first time the query is validated or serialized. The errors raised are the
+    same as if the expressions had been validated when they were created.
+
+    The mode is per thread, and contexts can be nested.
+    """
+    _deferred.depth += 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+
+
+def validate_tree(node: Expression) -> None:
+    """
+    Validate the expressions in the tree under node that were built inside
+    deferred_validation and haven't been validated yet. The children of a node
+    are validated before the node itself, as they would have been when they
+    were built. This is a no-op if there are no pending expressions.
+
+    :raises InvalidExpression: If any of the expressions is not valid.
+
+    """
+    if not _pending:
+        return
+
+    # Iterative post-order traversal, so deep trees don't hit the recursion limit
+    stack: List[Tuple[Any, bool]] = [(node, False)]
+    while stack:
+        value, visited = stack.pop()
+        if visited:
+            pending = _pending.get(id(value))
+            if pending is not None:
+                pending.validate()
+                del _pending[id(value)]
+            continue
+
+        value_type: type = type(value)
+        if value_type in _scalar_type_set:
+            continue
+        elif value_type is list or value_type is tuple:
+            # Skip lists of scalars, e.g. large IN lists, in a single pass
+            if not _scalar_type_set.issuperset(map(type, value)):
+                stack.extend((child, False) for child in reversed(value))
+        else:
+            names = _child_fields(value_type)
+            if names:
+                stack.append((value, True))
+                stack.extend((getattr(value, name), False) for name in reversed(names))
+
+
+def tree_aliases(node: Any) -> Tuple[Optional[str], ...]:
+    """
+    The aliases of the functions in the tree under node, which can also be a
+    list of expressions, in depth first order.
+    Aliases are not part of the fingerprint, so together they tell apart trees
+    that are equal but are not printed the same way.
+    """
+    aliases: List[Optional[str]] = []
+    stack: List[Any] = [node]
+    while stack:
+        value = stack.pop()
+        value_type: type = type(value)
+        if value_type in _scalar_type_set:
+            continue
+        elif value_type is list or value_type is tuple:
+            if not _scalar_type_set.issuperset(map(type, value)):
+                stack.extend(reversed(value))
+        else:
+            if isinstance(value, CurriedFunction):
+                aliases.append(value.alias)
+            names = _child_fields(value_type)
+            stack.extend(getattr(value, name) for name in reversed(names))
+    return tuple(aliases)
+
+
+@lru_cache(maxsize=None)
+def _child_fields(value_type: type) -> Tuple[str, ...]:
+    # The fields of an expression that can contain other expressions
+    if not issubclass(value_type, Expression):
+        return ()
+    return tuple(f.name for f in fields(cast(Any, value_type)) if f.compare)
+
+
+TType = TypeVar("TType", bound=type)
+
+
+def slotted(cls: TType) -> TType:
+    """
+    Class decorator, applied on top of ``@dataclass(frozen=True)``, that
+    finishes the ``__slots__`` layout that :class:`SlottedMeta` gave the class
+    when it was created, by replacing the wrappers of the fields that have a
+    default with the bare slots. The generated ``__init__`` keeps its own copy
+    of the defaults, except for fields with ``init=False``: it expects to read
+    those from the class, so they are returned by ``__getattr__`` until they
+    are set.
+    """
+    if not isinstance(cls, SlottedMeta):
+        raise TypeError(f"{cls.__name__} must be created by SlottedMeta")
+
+    init_defaults = {
+        f.name: f.default
+        for f in fields(cast(Any, cls))
+        if not f.init and f.default is not MISSING
+    }
+    for name, wrapper in list(cls.__dict__.items()):
+        if not isinstance(wrapper, _SlotDefault):
+            continue
+        if wrapper.inherited:
+            # The slot of a field of a base class is found on the base
+            type.__delattr__(cls, name)
+        else:
+            type.__setattr__(cls, name, wrapper.slot)
+
+    if init_defaults:
+
+        def __getattr__(self: Any, name: str) -> Any:
+            try:
+                return init_defaults[name]
+            except KeyError:
+                raise AttributeError(
+                    f"'{type(self).__name__}' object has no attribute '{name}'"
+                ) from None
+
+        setattr(cls, "__getattr__", __getattr__)
+
+    return cls
+
+
+def _write_sized(update: Callable[[bytes], None], tag: bytes, data: bytes) -> None:
+    update(b"%s%d:%s" % (tag, len(data), data))
+
+
+def _write_value(update: Callable[[bytes], None], value: Any) -> None:
+    # Every value is prefixed with a tag for its type, so values that compare
+    # equal in Python but are rendered differently, e.g. 1, 1.0 and True, or a
+    # list and a tuple, have different fingerprints.
+    if isinstance(value, Expression):
+        update(b"X")
+        update(value.fingerprint)
+    elif value is None:
+        update(b"N")
+    elif isinstance(value, Enum):
+        _write_sized(update, b"M", f"{type(value).__qualname__}.{value.name}".encode())
+    elif isinstance(value, bool):
+        update(b"T" if value else b"F")
+    elif isinstance(value, int):
+        _write_sized(update, b"I", str(value).encode())
+    elif isinstance(value, float):
+        _write_sized(update, b"R", repr(value).encode())
+    elif isinstance(value, str):
+        _write_sized(update, b"S", value.encode("utf-8", "surrogatepass"))
+    elif isinstance(value, bytes):
+        _write_sized(update, b"B", value)
+    elif isinstance(value, datetime):
+        _write_sized(update, b"D", value.isoformat().encode())
+    elif isinstance(value, date):
+        _write_sized(update, b"d", value.isoformat().encode())
+    elif isinstance(value, (list, tuple)):
+        update(b"%s%d:" % (b"L" if isinstance(value, list) else b"U", len(value)))
+        if all(type(v) is int for v in value):
+            # Fast path for the common case of a large IN list
+            _write_sized(update, b"i", ",".join(map(str, value)).encode())
+        else:
+            for v in value:
+                _write_value(update, v)
+    elif is_array_array(value):
+        _write_sized(update, b"A" + value.typecode.encode(), value.tobytes())
+    elif is_numeric_array(value):
+        _write_sized(update, b"Z" + value.dtype.str.encode(), value.tobytes())
+    else:
+        raise TypeError(f"can't fingerprint a value of type {type(value).__name__}")
+
+
+@lru_cache(maxsize=None)
+def _fingerprint_header(node_type: Type[Any]) -> Tuple[bytes, Tuple[str, ...]]:
+    # A Function is a CurriedFunction without initializers, and the two compare
+    # equal, so they share a tag.
+    if issubclass(node_type, CurriedFunction):
+        node_type = CurriedFunction
+    tag = f"{node_type.__module__}.{node_type.__qualname__}".encode()
+    # Fields that are not passed to __init__, e.g. the key of a Column, are set
+    # by validate, which may not have run yet inside deferred_validation. They
+    # are derived from the other fields, so they are left out.
+    names = tuple(f.name for f in fields(node_type) if f.compare and f.init)
+    return b"%d:%s" % (len(tag), tag), names
+
+
+def fingerprint_of(header: bytes, values: Sequence[Any]) -> bytes:
+    """
+    A 16 byte digest of a sequence of values. The values can be expressions,
+    scalars or sequences of those.
+    """
+    # Imported when first used, to keep hashlib out of the import of the SDK
+    from hashlib import blake2b
+
+    hasher = blake2b(header, digest_size=16)
+    for value in values:
+        _write_value(hasher.update, value)
+    return hasher.digest()
+
+
+def _fingerprint_node(node: Expression) -> bytes:
+    header, names = _fingerprint_header(type(node))
+    return fingerprint_of(header, [getattr(node, name) for name in names])
+
+
+# For type hinting. One dimensional NumPy arrays of numbers are also accepted as
+# sequences, see is_numeric_array.
 ScalarLiteralType = Union[None, bool, str, bytes, float, int, date, datetime]
 ScalarSequenceType = Sequence[ScalarLiteralType]
 ScalarType = Union[ScalarLiteralType, ScalarSequenceType]
@@ -50,17 +434,25 @@ class InvalidArray(Exception):
         )
 
 
+_scalar_types = tuple(Scalar)
+_scalar_type_set = frozenset(Scalar)
+
+
 def is_literal(value: Any) -> bool:
     """
     Allow simple scalar types but not lists/tuples.
     """
-    return isinstance(value, tuple(Scalar))
+    return isinstance(value, _scalar_types)
 
 
 def is_scalar(value: Any) -> bool:
-    if isinstance(value, tuple(Scalar)):
+    if isinstance(value, _scalar_types):
         return True
     elif isinstance(value, tuple):
+        # Fast path for the common case of a flat tuple, e.g. a large IN list:
+        # check the exact type of every element in one pass.
+        if _scalar_type_set.issuperset(map(type, value)):
+            return True
         if not all(is_scalar(v) for v in value):
             raise InvalidExpression("tuple must contain only scalar values")
         return True
@@ -69,24 +461,171 @@ def is_scalar(value: Any) -> bool:
             raise InvalidArray(value)
 
         return True
+    elif is_numeric_array(value):
+        return True
 
     return False
 
 
-alias_re = re.compile(r"^[a-zA-Z](\w|\.)+$")
+# Integer and floating point typecodes of array.array
+_numeric_typecodes = frozenset("bBhHiIlLqQfd")
+
+
+def is_array_array(value: Any) -> bool:
+    """
+    Check if the value is an array.array. The array module is not imported by
+    the SDK when it is imported: if it hasn't been imported already, the value
+    can't be an array.array.
+    """
+    module = sys.modules.get("array")
+    return module is not None and isinstance(value, module.array)
+
+
+def is_numeric_array(value: Any) -> bool:
+    """
+    Check if the value is a one dimensional array.array or NumPy array of
+    numbers. These are treated the same as a list of numbers, but are checked
+    using their type rather than one element at a time. NumPy is not imported
+    by the SDK: if it hasn't been imported already, the value can't be a NumPy
+    array.
+    """
+    if is_array_array(value):
+        return value.typecode in _numeric_typecodes
+
+    numpy = sys.modules.get("numpy")
+    return (
+        numpy is not None
+        and isinstance(value, numpy.ndarray)
+        and value.ndim == 1
+        and value.dtype.kind in "iuf"
+    )
+
+
+class LazyPattern:
+    """
+    A regular expression that is only compiled the first time it is used, so
+    importing the SDK doesn't pay for compiling patterns that are never used.
+    It can be used in place of the compiled pattern.
+    """
+
+    __slots__ = ("pattern", "flags", "_compiled")
+
+    def __init__(self, pattern: str, flags: int = 0) -> None:
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled: Optional[Pattern[str]] = None
+
+    @property
+    def compiled(self) -> Pattern[str]:
+        if self._compiled is None:
+            self._compiled = re.compile(self.pattern, self.flags)
+        return self._compiled
+
+    def match(self, string: str) -> Optional[Match[str]]:
+        return self.compiled.match(string)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.compiled, name)
+
+
+# The number of names remembered by each NamePattern. Queries tend to use the
+# same few hundred column, function and alias names over and over.
+NAME_CACHE_SIZE = 1024
+
+_name_patterns: "weakref.WeakSet[NamePattern]" = weakref.WeakSet()
 
-column_name_re = re.compile(r"^[a-zA-Z](\w|\.|:)*(\[([a-zA-Z](\w|\.|:)*)\])?$")
+
+class NamePattern(LazyPattern):
+    """
+    A pattern that names are validated against. The outcome for the most
+    recently used names is kept in a bounded LRU cache, so validating a name
+    that was seen before doesn't run the regex again. The size of the cache is
+    NAME_CACHE_SIZE, see set_name_cache_size to change it.
+    """
+
+    __slots__ = ("_is_valid", "__weakref__")
+
+    def __init__(self, pattern: str, flags: int = 0) -> None:
+        super().__init__(pattern, flags)
+        self._is_valid: Optional[Callable[[str], bool]] = None
+        _name_patterns.add(self)
+
+    def is_valid(self, name: str) -> bool:
+        if self._is_valid is None:
+            match = self.compiled.match
+            self._is_valid = lru_cache(maxsize=NAME_CACHE_SIZE)(
+                lambda name: match(name) is not None
+            )
+        return self._is_valid(name)
+
+    def cache_info(self) -> Tuple[int, int, int]:
+        """
+        The number of cache hits, cache misses and names in the cache.
+        """
+        if self._is_valid is None:
+            return (0, 0, 0)
+        info = self._is_valid.cache_info()  # type: ignore
+        return (info.hits, info.misses, info.currsize)
+
+    def cache_clear(self) -> None:
+        self._is_valid = None
+
+
+def set_name_cache_size(size: int) -> None:
+    """
+    Change the number of names remembered by each NamePattern. This clears
+    the caches and their counters.
+    """
+    global NAME_CACHE_SIZE
+    NAME_CACHE_SIZE = size
+    for pattern in _name_patterns:
+        pattern.cache_clear()
+
+
+alias_re = NamePattern(r"^[a-zA-Z](\w|\.)+$")
+
+column_name_re = NamePattern(r"^[a-zA-Z](\w|\.|:)*(\[([a-zA-Z](\w|\.|:)*)\])?$")
 # In theory the function matcher should be the same as the column one.
 # However legacy API sends curried functions as raw strings, and it
 # wasn't worth it to import an entire parsing grammar into the SDK
 # just to accomodate that one case. Instead, allow it for now and
 # once that use case is eliminated we can remove this.
-function_name_re = re.compile(r"^[a-zA-Z](\w|[().,]| |\[|\])+$")
+function_name_re = NamePattern(r"^[a-zA-Z](\w|[().,]| |\[|\])+$")
+param_name_re = NamePattern(r"^[a-zA-Z_]\w*$")
+
+
+@slotted
+@dataclass(frozen=True, eq=False)
+class Param(Expression):
+    """
+    A named placeholder for a literal value, used to build a query template
+    with :meth:`snuba_sdk.query.Query.prepare`. A Param can be used anywhere a
+    scalar is allowed in a Condition or a function, and as the value of a
+    Limit, Offset or Granularity. A query containing a Param can be validated
+    but it can't be serialized until a value has been bound to the Param.
+
+    :param name: The name used to bind a value to the Param.
+    :type name: str
+
+    :raises InvalidExpression: If the name is not a valid identifier.
+
+    """
+
+    name: str
+
+    def validate(self) -> None:
+        if not isinstance(self.name, str) or not param_name_re.is_valid(self.name):
+            raise InvalidExpression(
+                f"parameter name '{self.name}' must be a valid identifier"
+            )
 
 
 def _validate_int_literal(
-    name: str, literal: int, minn: Optional[int], maxn: Optional[int]
+    name: str, literal: Union[int, Param], minn: Optional[int], maxn: Optional[int]
 ) -> None:
+    if isinstance(literal, Param):
+        # Checked when a value is bound to the parameter
+        return
     if not isinstance(literal, int):
         raise InvalidExpression(f"{name} '{literal}' must be an integer")
     if minn is not None and literal < minn:
@@ -95,32 +634,79 @@ def _validate_int_literal(
         raise InvalidExpression(f"{name} '{literal}' is capped at {maxn:,}")
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Limit(Expression):
-    limit: int
+    """
+    The maximum number of rows returned by a query.
+
+    :param limit: The number of rows, or a Param bound to it later.
+    :type limit: Union[int, Param]
+
+    :raises InvalidExpression: If the limit is not an integer between 1 and
+        10,000.
+
+    """
+
+    limit: Union[int, Param]
 
     def validate(self) -> None:
         _validate_int_literal("limit", self.limit, 1, 10000)
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Offset(Expression):
-    offset: int
+    """
+    The number of rows skipped before the rows returned by a query.
+
+    :param offset: The number of rows, or a Param bound to it later.
+    :type offset: Union[int, Param]
+
+    :raises InvalidExpression: If the offset is not a non-negative integer.
+
+    """
+
+    offset: Union[int, Param]
 
     def validate(self) -> None:
         _validate_int_literal("offset", self.offset, 0, None)
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Granularity(Expression):
-    granularity: int
+    """
+    The granularity, in seconds, of the time buckets a query is run on.
+
+    :param granularity: The number of seconds, or a Param bound to it later.
+    :type granularity: Union[int, Param]
+
+    :raises InvalidExpression: If the granularity is not a positive integer.
+
+    """
+
+    granularity: Union[int, Param]
 
     def validate(self) -> None:
         _validate_int_literal("granularity", self.granularity, 1, None)
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class BooleanFlag(Expression):
+    """
+    A flag of the query that is either on or off, e.g. totals or debug.
+
+    :param value: Whether the flag is set.
+    :type value: bool
+    :param name: The name of the flag, used in error messages.
+    :type name: str
+
+    :raises InvalidExpression: If the value is not a boolean.
+
+    """
+
     value: bool = False
     name: str = ""
 
@@ -135,27 +721,48 @@ class BooleanFlag(Expression):
         return str(self.value)
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Totals(BooleanFlag):
+    """
+    Whether to return the totals of the aggregates along with the results.
+    """
+
     name: str = "totals"
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Consistent(BooleanFlag):
+    """
+    Whether the query must be run on a consistent replica.
+    """
+
     name: str = "consistent"
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Turbo(BooleanFlag):
+    """
+    Whether the query can be run on sampled data.
+    """
+
     name: str = "turbo"
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Debug(BooleanFlag):
+    """
+    Whether Snuba should return debugging information with the results.
+    """
+
     name: str = "debug"
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Column(Expression):
     """
     A representation of a single column in the database. Columns are
@@ -180,7 +787,7 @@ class Column(Expression):
         if not isinstance(self.name, str):
             raise InvalidExpression(f"column '{self.name}' must be a string")
             self.name = str(self.name)
-        if not column_name_re.match(self.name):
+        if not column_name_re.is_valid(self.name):
             raise InvalidExpression(
                 f"column '{self.name}' is empty or contains invalid characters"
             )
@@ -194,28 +801,55 @@ class Column(Expression):
             super().__setattr__("key", key)
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class CurriedFunction(Expression):
+    """
+    A function call, e.g. ``count()`` or ``quantile(0.5)(duration)``. The
+    initializers are the parameters of a parametric function, which are
+    given before its arguments.
+
+    :param function: The name of the function.
+    :type function: str
+    :param initializers: The parameters of a parametric function.
+    :type initializers: Optional[Sequence[Union[ScalarLiteralType, Column, Param]]]
+    :param parameters: The arguments of the function.
+    :type parameters: Optional[Sequence[Union[ScalarType, Column, CurriedFunction, Function, Param]]]
+    :param alias: The name the result of the function is given in the query.
+    :type alias: Optional[str]
+
+    :raises InvalidExpression: If the name, the alias or any of the
+        arguments is not valid.
+
+    """
+
+    # Set by is_aggregate the first time it is called. It is a slot rather than
+    # a field, so it isn't part of fields(), asdict() or the repr.
+    __slots__ = ("_aggregate",)
+
     function: str
-    initializers: Optional[Sequence[Union[ScalarLiteralType, Column]]] = None
+    initializers: Optional[Sequence[Union[ScalarLiteralType, Column, Param]]] = None
     parameters: Optional[
-        Sequence[Union[ScalarType, Column, "CurriedFunction", "Function"]]
+        Sequence[Union[ScalarType, Column, "CurriedFunction", "Function", Param]]
     ] = None
-    alias: Optional[str] = None
+    # The alias is not used to compare equality
+    alias: Optional[str] = field(default=None, compare=False)
 
     def is_aggregate(self) -> bool:
-        if is_aggregation_function(self.function):
-            return True
-
-        if self.parameters is not None:
-            for param in self.parameters:
-                if (
-                    isinstance(param, (CurriedFunction, Function))
-                    and param.is_aggregate()
-                ):
-                    return True
-
-        return False
+        """
+        Whether this function, or any function in its parameters, is an
+        aggregate. Since the node can't change this is computed once, from the
+        flags of the functions in its parameters.
+        """
+        try:
+            aggregate: bool = getattr(self, "_aggregate")
+        except AttributeError:
+            aggregate = is_aggregation_function(self.function) or any(
+                isinstance(param, CurriedFunction) and param.is_aggregate()
+                for param in self.parameters or ()
+            )
+            object.__setattr__(self, "_aggregate", aggregate)
+        return aggregate
 
     def validate(self) -> None:
         if not isinstance(self.function, str):
@@ -224,7 +858,7 @@ class CurriedFunction(Expression):
             # TODO: Have a whitelist of valid functions to check, maybe even with more
             # specific parameter type checking
             raise InvalidExpression("function cannot be empty")
-        if not function_name_re.match(self.function):
+        if not function_name_re.is_valid(self.function):
             raise InvalidExpression(
                 f"function '{self.function}' contains invalid characters"
             )
@@ -235,7 +869,7 @@ class CurriedFunction(Expression):
                     f"initializers of function {self.function} must be a Sequence"
                 )
             elif not all(
-                isinstance(param, Column) or is_literal(param)
+                isinstance(param, (Column, Param)) or is_literal(param)
                 for param in self.initializers
             ):
                 raise InvalidExpression(
@@ -247,7 +881,7 @@ class CurriedFunction(Expression):
                 raise InvalidExpression(
                     f"alias '{self.alias}' of function {self.function} must be None or a non-empty string"
                 )
-            if not alias_re.match(self.alias):
+            if not alias_re.is_valid(self.alias):
                 raise InvalidExpression(
                     f"alias '{self.alias}' of function {self.function} contains invalid characters"
                 )
@@ -259,28 +893,23 @@ class CurriedFunction(Expression):
                 )
             for param in self.parameters:
                 if not isinstance(
-                    param, (Column, CurriedFunction, Function)
+                    param, (Column, CurriedFunction, Function, Param)
                 ) and not is_scalar(param):
                     assert not isinstance(param, bytes)  # mypy
                     raise InvalidExpression(
                         f"parameter '{param}' of function {self.function} is an invalid type"
                     )
 
-    def __eq__(self, other: object) -> bool:
-        # Don't use the alias to compare equality
-        if not isinstance(other, CurriedFunction):
-            return False
-
-        return (
-            self.function == other.function
-            and self.initializers == other.initializers
-            and self.parameters == other.parameters
-        )
 
-
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class Function(CurriedFunction):
-    initializers: Optional[Sequence[Union[ScalarLiteralType, Column]]] = field(
+    """
+    A function call that is not parametric, e.g. ``count()``. It is a
+    CurriedFunction without initializers.
+    """
+
+    initializers: Optional[Sequence[Union[ScalarLiteralType, Column, Param]]] = field(
         init=False, default=None
     )
 
@@ -290,8 +919,22 @@ class Direction(Enum):
     DESC = "DESC"
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class OrderBy(Expression):
+    """
+    An expression the results of a query are sorted by.
+
+    :param exp: The expression to sort by.
+    :type exp: Union[Column, CurriedFunction, Function]
+    :param direction: Whether to sort in ascending or descending order.
+    :type direction: Direction
+
+    :raises InvalidExpression: If the expression or the direction is not
+        valid.
+
+    """
+
     exp: Union[Column, CurriedFunction, Function]
     direction: Direction
 
@@ -304,8 +947,21 @@ class OrderBy(Expression):
             raise InvalidExpression("OrderBy direction must be a Direction")
 
 
-@dataclass(frozen=True)
+@slotted
+@dataclass(frozen=True, eq=False)
 class LimitBy(Expression):
+    """
+    The maximum number of rows returned for each value of a column.
+
+    :param column: The column the rows are grouped by.
+    :type column: Column
+    :param count: The number of rows for each value, at most 10,000.
+    :type count: int
+
+    :raises InvalidExpression: If the column or the count is not valid.
+
+    """
+
     column: Column
     count: int
 
@@ -316,3 +972,77 @@ class LimitBy(Expression):
             raise InvalidExpression(
                 "LimitBy count must be a positive integer (max 10,000)"
             )
+
+
+TExpression = TypeVar("TExpression", bound=Expression)
+
+# Interned nodes, keyed on their type and the values of their fields. The nodes
+# are only referenced weakly, so they are freed once nothing else uses them.
+_interned: "weakref.WeakValueDictionary[Hashable, Expression]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+@lru_cache(maxsize=None)
+def _init_fields(node_type: Type[Any]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple((f.name, f.default) for f in fields(node_type) if f.init)
+
+
+def _intern_key(value: Any) -> Hashable:
+    # The type is part of the key, since e.g. 1, 1.0 and True are all equal but
+    # are not translated the same way.
+    if isinstance(value, Expression):
+        return (
+            type(value),
+            tuple(
+                _intern_key(getattr(value, name))
+                for name, _ in _init_fields(type(value))
+            ),
+        )
+    elif isinstance(value, (list, tuple)):
+        return (type(value), tuple(_intern_key(v) for v in value))
+
+    hash(value)  # Raises TypeError for values that can't be interned
+    return (type(value), value)
+
+
+def interned(node_type: Type[TExpression], *args: Any, **kwargs: Any) -> TExpression:
+    """
+    Return a node of the given type built with the given arguments. Nodes that
+    are built often with the same arguments, e.g. ``Column("project_id")``, are
+    only validated the first time: while any reference to that node is alive,
+    calls with structurally equal arguments return the same instance.
+
+    Since the same instance is shared, the lists passed as parameters of the
+    node must never be modified.
+
+    :param node_type: The class of the node, e.g. Column or Function.
+    :type node_type: Type[Expression]
+
+    :raises InvalidExpression: If the node is not valid.
+
+    """
+    init_fields = _init_fields(node_type)
+    values = list(args)
+    for name, default in init_fields[len(args) :]:
+        values.append(kwargs.pop(name, default))
+
+    if kwargs or len(values) > len(init_fields) or MISSING in values:
+        # Let the constructor raise the appropriate error
+        return node_type(*args, **kwargs)
+
+    try:
+        key = (node_type, _intern_key(values))
+    except TypeError:
+        # Unhashable values, e.g. NumPy arrays
+        return node_type(*values)
+
+    node = _interned.get(key)
+    if node is None:
+        node = node_type(*values)
+        # Interned nodes are shared, so they are always validated up front
+        validate_tree(node)
+        _interned[key] = node
+
+    assert isinstance(node, node_type)
+    return node
@@ -1,5 +1,7 @@
+import re
 from datetime import datetime
-from typing import Any, Mapping, Sequence
+from functools import lru_cache
+from typing import Any, Hashable, Mapping, Optional, Sequence, Tuple
 
 from snuba_sdk.conditions import Condition, Op
 from snuba_sdk.entity import Entity
@@ -7,15 +9,65 @@ from snuba_sdk.expressions import (
     Column,
     Direction,
     Function,
+    LazyPattern,
     LimitBy,
     OrderBy,
+    validate_tree,
 )
-from snuba_sdk.query import Query
+from snuba_sdk.query import Query, QueryBuilder
 from snuba_sdk.query_visitors import InvalidQuery
 
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# The shortest and longest strings that strptime can match with DATETIME_FORMAT,
+# e.g. "2021-1-2T3:4:5.6" and "2021-01-02T03:04:05.000006".
+_MIN_DATETIME_LENGTH = 16
+_MAX_DATETIME_LENGTH = 26
+
+# Timestamps in the format written by datetime.isoformat(), which is what is
+# almost always sent, are parsed without strptime. Any other string that could
+# match DATETIME_FORMAT is left to strptime, so the same strings are accepted.
+iso_datetime_re = LazyPattern(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}", re.ASCII)
+
+# The number of strings remembered by parse_datetime. The same timestamps, e.g.
+# the from_date and to_date of a batch of queries, are usually parsed repeatedly.
+DATETIME_CACHE_SIZE = 1024
+
+
+def _maybe_datetime(value: str) -> bool:
+    # A cheap check that rules out most strings that aren't timestamps
+    return (
+        _MIN_DATETIME_LENGTH <= len(value) <= _MAX_DATETIME_LENGTH and value[4] == "-"
+    )
+
+
+@lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _parse_datetime(date_str: str) -> Optional[datetime]:
+    if not _maybe_datetime(date_str):
+        return None
+
+    try:
+        if iso_datetime_re.fullmatch(date_str):
+            return datetime(
+                int(date_str[0:4]),
+                int(date_str[5:7]),
+                int(date_str[8:10]),
+                int(date_str[11:13]),
+                int(date_str[14:16]),
+                int(date_str[17:19]),
+                int(date_str[20:26]),
+            )
+        return datetime.strptime(date_str, DATETIME_FORMAT)
+    except ValueError:
+        return None
+
 
 def parse_datetime(date_str: str) -> datetime:
-    return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%f")
+    parsed = _parse_datetime(date_str)
+    if parsed is None:
+        # Raise the same error as strptime would
+        return datetime.strptime(date_str, DATETIME_FORMAT)
+    return parsed
 
 
 def parse_scalar(value: Any) -> Any:
@@ -24,21 +76,72 @@ def parse_scalar(value: Any) -> Any:
     elif isinstance(value, tuple):
         return tuple(map(parse_scalar, value))
 
-    if isinstance(value, str):
-        try:
-            date_scalar = parse_datetime(value)
+    if isinstance(value, str) and _maybe_datetime(value):
+        date_scalar = _parse_datetime(value)
+        if date_scalar is not None:
             return date_scalar
-        except ValueError:
-            return value
 
     return value
 
 
+# The number of expressions remembered by parse_exp. Legacy bodies use the
+# same few columns and aggregations over and over.
+EXPRESSION_CACHE_SIZE = 1024
+
+
+def _exp_key(value: Any) -> Hashable:
+    # The type is part of the key, since e.g. 1, 1.0 and True are all equal but
+    # don't produce the same expression.
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(map(_exp_key, value)))
+    hash(value)  # Raises TypeError for values that can't be cached
+    return (type(value), value)
+
+
+def _exp_value(key: Any) -> Any:
+    value_type, value = key
+    if value_type is list or value_type is tuple:
+        return value_type(map(_exp_value, value))
+    return value
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _parse_cached_exp(key: Hashable) -> Any:
+    exp = _parse_exp(_exp_value(key))
+    # The expression is shared by every body that uses it, so it is validated
+    # before it is cached, even when validation is deferred.
+    validate_tree(exp)
+    return exp
+
+
+def parse_exp_cache_info() -> Tuple[int, int, int]:
+    """
+    The number of cache hits, cache misses and expressions in the cache of
+    parse_exp.
+    """
+    info = _parse_cached_exp.cache_info()
+    return (info.hits, info.misses, info.currsize)
+
+
 def parse_exp(value: Any) -> Any:
+    """
+    Parse a column or function from a legacy body. Since the Columns and
+    Functions returned are immutable, the ones parsed from the same value are
+    cached and shared.
+    """
+    if not isinstance(value, (str, list)):
+        return parse_scalar(value)
+
+    try:
+        key = _exp_key(value)
+    except TypeError:
+        return _parse_exp(value)
+    return _parse_cached_exp(key)
+
+
+def _parse_exp(value: Any) -> Any:
     if isinstance(value, str):
         return Column(value)
-    if not isinstance(value, list):
-        return parse_scalar(value)
 
     alias = value[2] if len(value) > 2 else None
 
@@ -57,7 +160,7 @@ def parse_exp(value: Any) -> Any:
 def json_to_snql(body: Mapping[str, Any], entity: str) -> Query:
     dataset = body.get("dataset", "")
     sample = body.get("sample")
-    query = Query(dataset, Entity(entity, sample))
+    query = QueryBuilder(dataset, Entity(entity, sample))
 
     selected_columns = list(map(parse_exp, body.get("selected_columns", [])))
     for a in body.get("aggregations", []):
@@ -67,13 +170,13 @@ def json_to_snql(body: Mapping[str, Any], entity: str) -> Query:
     if arrayjoin:
         selected_columns.append(Function("arrayJoin", [Column(arrayjoin)], arrayjoin))
 
-    query = query.set_select(selected_columns)
+    query.set_select(selected_columns)
 
     groupby = body.get("groupby", [])
     if groupby and not isinstance(groupby, list):
         groupby = [groupby]
 
-    query = query.set_groupby(list(map(parse_exp, groupby)))
+    query.set_groupby(list(map(parse_exp, groupby)))
 
     conditions = []
     for cond in body.get("conditions", []):
@@ -107,7 +210,7 @@ def json_to_snql(body: Mapping[str, Any], entity: str) -> Query:
                 Condition(Column("started"), op, parse_datetime(date_str))
             )
 
-    query = query.set_where(conditions)
+    query.set_where(conditions)
 
     having = []
     for cond in body.get("having", []):
@@ -116,7 +219,7 @@ def json_to_snql(body: Mapping[str, Any], entity: str) -> Query:
 
         having.append(Condition(parse_exp(cond[0]), Op(cond[1]), parse_scalar(cond[2])))
 
-    query = query.set_having(having)
+    query.set_having(having)
 
     order_by = body.get("orderby")
     if order_by:
@@ -132,12 +235,12 @@ def json_to_snql(body: Mapping[str, Any], entity: str) -> Query:
 
             order_bys.append(OrderBy(parse_exp(o), direction))
 
-        query = query.set_orderby(order_bys)
+        query.set_orderby(order_bys)
 
     limitby = body.get("limitby")
     if limitby:
         limit, name = limitby
-        query = query.set_limitby(LimitBy(Column(name), int(limit)))
+        query.set_limitby(LimitBy(Column(name), int(limit)))
 
     extras = (
         "limit",
@@ -150,6 +253,16 @@ def json_to_snql(body: Mapping[str, Any], entity: str) -> Query:
     )
     for extra in extras:
         if body.get(extra) is not None:
-            query = getattr(query, f"set_{extra}")(body.get(extra))
+            getattr(query, f"set_{extra}")(body.get(extra))
+
+    return query.build()
+
+
+if __name__ == "__main__":
+    # The command is in legacy_stream, so importing this module doesn't pay for
+    # the streaming API. Kept so python -m snuba_sdk.legacy still works.
+    import sys
+
+    from snuba_sdk.legacy_stream import main
 
-    return query
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Translates request logs of legacy Snuba bodies to SnQL in bulk, with
+:func:`translate_jsonl` or from the command line::
+
+    python -m snuba_sdk.legacy_stream --entity events bodies.jsonl.gz
+
+Each body is translated with :func:`snuba_sdk.legacy.json_to_snql`. This is
+kept out of :mod:`snuba_sdk.legacy`, so translating single bodies doesn't pay
+for importing it.
+"""
+
+import sys
+import time
+from typing import (
+    Any,
+    BinaryIO,
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from snuba_sdk.legacy import json_to_snql
+
+
+class TranslatedBody(NamedTuple):
+    """
+    The outcome of translating one line of a JSONL stream of legacy bodies:
+    the SnQL body for Snuba, as returned by :meth:`Query.snuba`, or the error
+    that prevented the translation. The line number starts at 1.
+    """
+
+    line: int
+    snql: Optional[str]
+    error: Optional[str]
+
+
+# The number of lines sent to a worker process at once, which amortizes the
+# cost of sending them over. Each worker has at most two batches in flight.
+STREAM_BATCH_SIZE = 256
+
+
+def read_jsonl(stream: BinaryIO) -> Iterator[bytes]:
+    """
+    Yield the lines of a JSONL stream one at a time. The stream is
+    decompressed as it is read if it is gzipped.
+    """
+    import gzip
+    import io
+
+    reader: Any = stream
+    if not hasattr(reader, "peek"):
+        reader = io.BufferedReader(reader)
+    if reader.peek(2)[:2] == b"\x1f\x8b":
+        reader = gzip.GzipFile(fileobj=reader)
+    yield from reader
+
+
+def _translate_line(line: bytes, entity: str) -> Tuple[Optional[str], Optional[str]]:
+    import json
+
+    try:
+        return json_to_snql(json.loads(line), entity).snuba(), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _translate_batch(
+    lines: Sequence[bytes], entity: str
+) -> List[Tuple[Optional[str], Optional[str]]]:
+    return [_translate_line(line, entity) for line in lines]
+
+
+def translate_jsonl(
+    lines: Iterable[bytes],
+    entity: str,
+    workers: Optional[int] = None,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[TranslatedBody]:
+    """
+    Translate a stream of JSONL lines, each one a legacy body, with
+    :func:`json_to_snql`. The translations are yielded in the order of the
+    lines, and a line that can't be translated yields its error instead of
+    stopping the stream. Blank lines are skipped.
+
+    The lines are translated by a pool of ``workers`` processes, which
+    defaults to the number of CPUs, or in this process if ``workers`` is 0.
+    Only a few batches of lines are read ahead of the translations that have
+    been yielded, so the memory used doesn't depend on the size of the stream.
+    """
+    if workers is None:
+        import os
+
+        workers = os.cpu_count() or 1
+
+    numbered = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+    if workers == 0:
+        for number, line in numbered:
+            yield TranslatedBody(number, *_translate_line(line, entity))
+        return
+
+    from collections import deque
+    from concurrent.futures import Future, ProcessPoolExecutor
+    from itertools import islice
+
+    pending: Deque[Tuple[List[int], "Future[Any]"]] = deque()
+    with ProcessPoolExecutor(workers) as executor:
+        while True:
+            while len(pending) < 2 * workers:
+                batch = list(islice(numbered, batch_size))
+                if not batch:
+                    break
+                numbers = [number for number, _ in batch]
+                future = executor.submit(
+                    _translate_batch, [line for _, line in batch], entity
+                )
+                pending.append((numbers, future))
+
+            if not pending:
+                return
+
+            numbers, future = pending.popleft()
+            for number, (snql, error) in zip(numbers, future.result()):
+                yield TranslatedBody(number, snql, error)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Translate a JSONL file of legacy bodies to SnQL::
+
+        python -m snuba_sdk.legacy_stream --entity events bodies.jsonl.gz > snql.jsonl
+
+    Each line of the input that isn't blank produces one line of output, in
+    the same order, with its line number and either the Snuba body or the
+    error that prevented the translation::
+
+        {"line": 1, "body": {"dataset": "events", "query": "MATCH ..."}}
+        {"line": 2, "error": "InvalidQuery: ..."}
+
+    The errors are also written to stderr, followed by a summary of the
+    throughput. Returns the exit status, which is 1 if any of the bodies
+    couldn't be translated.
+    """
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        prog="python -m snuba_sdk.legacy_stream",
+        description="Translate a JSONL file of legacy Snuba bodies to SnQL.",
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="JSONL file, optionally gzipped, or - to read stdin (the default)",
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="output file, or - for stdout"
+    )
+    parser.add_argument(
+        "-e", "--entity", required=True, help="entity that the bodies query"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes, 0 to translate in this process "
+        "(default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=STREAM_BATCH_SIZE,
+        help=f"lines sent to a worker at once (default: {STREAM_BATCH_SIZE})",
+    )
+    args = parser.parse_args(argv)
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    translated = errors = 0
+    start = time.perf_counter()
+    try:
+        for body in translate_jsonl(
+            read_jsonl(source), args.entity, args.workers, args.batch_size
+        ):
+            # The Snuba body is already JSON, so it is written as is
+            if body.snql is not None:
+                output.write(f'{{"line": {body.line}, "body": {body.snql}}}\n')
+                translated += 1
+            else:
+                error = json.dumps(body.error)
+                output.write(f'{{"line": {body.line}, "error": {error}}}\n')
+                sys.stderr.write(f"line {body.line}: {body.error}\n")
+                errors += 1
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if args.output != "-":
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    total = translated + errors
+    rate = total / elapsed if elapsed > 0 else 0.0
+    sys.stderr.write(
+        f"translated {translated:,} of {total:,} bodies ({errors:,} errors) "
+        f"in {elapsed:.2f}s, {rate:,.1f} bodies/s\n"
+    )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    # Run main from the imported module rather than __main__, so the worker
+    # processes can find the functions they are sent.
+    from snuba_sdk.legacy_stream import main as stream_main
+
+    sys.exit(stream_main())
@@ -0,0 +1,621 @@
+"""
+Parses the SnQL produced by :class:`snuba_sdk.query_visitors.Printer` back into
+a Query, e.g. to analyse or replay the queries in a request log. Only the
+subset of SnQL that the SDK emits is supported::
+
+    query = parse_query(str(original), dataset="discover")
+    assert str(query) == str(original)
+
+The query is split into tokens by a single pass over its characters, and the
+tokens are parsed by a recursive descent parser. The keywords of the clauses
+are only recognized where a clause can start, after a complete item, so
+columns and aliases can be named like a keyword, e.g. ``SELECT BY BY BY``.
+
+Some values are printed the same way as another value or as a function, and
+are parsed as the one that is printed that way:
+
+- Bytes are printed like the string they decode to, and are parsed as that
+  string. The parsed query is not equal to the original, since a str and
+  bytes are not equal.
+- The Printer doesn't escape backslashes, so a string can print the same way
+  as another one: ``\\'`` and ``\\n`` are parsed as a quote and a newline,
+  unless they follow another backslash.
+- Calls to ``tuple``, ``array`` and ``toDateTime`` are parsed as the value
+  they print where a value is expected, i.e. in the parameters of a function
+  and on the right hand side of a condition.
+- Infinite and NaN floats are printed as ``inf``, ``-inf`` and ``nan``, and
+  are parsed as floats where a value is expected, as ClickHouse does.
+
+The parsed query is printed the same way as the original either way. The one
+exception is a string that ends with a backslash: the backslash is printed
+right before the closing quote, which it escapes, so the query can't be
+parsed.
+"""
+
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import (
+    Any,
+    Dict,
+    List,
+    Mapping,
+    NoReturn,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from snuba_sdk.conditions import Condition, Op, UNARY_OPERATORS
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    Consistent,
+    CurriedFunction,
+    Debug,
+    Direction,
+    Function,
+    Granularity,
+    InvalidArray,
+    InvalidExpression,
+    is_scalar,
+    LazyPattern,
+    Limit,
+    LimitBy,
+    Offset,
+    OrderBy,
+    Totals,
+    Turbo,
+    validate_tree,
+)
+from snuba_sdk.query import Query
+
+
+class InvalidSnQL(Exception):
+    pass
+
+
+# The number of column names whose parsed Column is kept and shared by the
+# queries that use it. Queries in a log tend to repeat the same few hundred.
+PARSE_CACHE_SIZE = 4096
+
+# The kinds of token. Symbols, e.g. "(" or "<=", are their own kind, so they
+# are checked for with a single comparison. The tokens of a query always end
+# with an _END token.
+_NAME = 0
+_STRING = 1
+_NUMBER = 2
+_END = 3
+# A list of integers between parentheses, e.g. the right hand side of a large
+# IN condition. It is read as one token, as reading its numbers one by one is
+# most of the time it takes to parse such a query.
+_INTEGERS = 4
+
+_NAME_START = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_")
+_NUMBER_START = frozenset("-0123456789")
+# The ASCII characters of names, e.g. tags[sentry:release], and numbers. Names
+# can also contain other letters, like \w in the name regexes, so non-ASCII
+# characters are left to the validation of the node the name is in.
+_WORD_CHARS = _NAME_START | frozenset("0123456789.:[]")
+# Replaces the ASCII characters that end a name or a number with a space, so
+# the end of any of them is found with one find in the translated query.
+_WORD_ENDS = str.maketrans(
+    {chr(code): " " for code in range(128) if chr(code) not in _WORD_CHARS}
+)
+_SPACES = frozenset(" \n\r\t")
+# The Printer escapes the quotes and newlines in a string that don't follow a
+# backslash, and writes the backslashes as they are. The escapes are undone the
+# same way, so the string is printed the same way again.
+_ESCAPES = {"'": "'", "n": "\n"}
+escape_re = LazyPattern(r"(?<!\\)\\(['n])")
+
+datetime_re = LazyPattern(r"\d{4}-\d\d-\d\d(?:T\d\d:\d\d:\d\d(?:\.\d{6})?)?", re.ASCII)
+
+# The clauses in the order that the Printer writes them. LIMIT n BY column is
+# told apart from LIMIT n by the BY after the count.
+_CLAUSES = (
+    "MATCH",
+    "SELECT",
+    "BY",
+    "WHERE",
+    "HAVING",
+    "ORDER BY",
+    "LIMIT BY",
+    "LIMIT",
+    "OFFSET",
+    "GRANULARITY",
+    "TOTALS",
+)
+_CLAUSE_ORDER = {keyword: index for index, keyword in enumerate(_CLAUSES)}
+# The first word of each keyword that can start a clause after the MATCH
+_CLAUSE_WORDS = frozenset(keyword.split()[0] for keyword in _CLAUSES[1:])
+
+_SYMBOL_OPERATORS = {op.value: op for op in Op if not op.value[0].isalpha()}
+_WORD_OPERATORS: Mapping[Tuple[str, ...], Op] = {
+    tuple(op.value.split()): op for op in Op if op.value[0].isalpha()
+}
+_KEYWORD_VALUES = {"NULL": None, "TRUE": True, "FALSE": False}
+_FLOAT_VALUES = {"inf": float("inf"), "nan": float("nan")}
+_FLAGS = {"True": True, "False": False}
+
+
+def _unescape(text: str) -> str:
+    return str(escape_re.sub(lambda match: _ESCAPES[match.group(1)], text))
+
+
+def _tokenize(snql: str) -> Tuple[List[Union[int, str]], List[Any]]:
+    """
+    Split a query into the kinds and values of its tokens in one pass over its
+    characters. The values of string and number tokens are the parsed values.
+    Names, numbers and strings are skipped over with a single find each, and
+    so is the space the Printer writes after them.
+    """
+    kinds: List[Union[int, str]] = []
+    values: List[Any] = []
+    add_kind = kinds.append
+    add_value = values.append
+    find_word_end = snql.translate(_WORD_ENDS).find
+    name_start = _NAME_START
+    number_start = _NUMBER_START
+    spaces = _SPACES
+    end = len(snql)
+    pos = 0
+    while pos < end:
+        char = snql[pos]
+        if char == " ":
+            pos += 1
+        elif char in name_start:
+            start = pos
+            pos = find_word_end(" ", pos)
+            if pos < 0:
+                pos = end
+            add_kind(_NAME)
+            add_value(snql[start:pos])
+            if snql[pos : pos + 1] == " ":
+                pos += 1
+        elif char in "(),":
+            add_kind(char)
+            add_value(char)
+            pos += 1
+            if char == "(" and snql[pos : pos + 1] in number_start:
+                close = snql.find(")", pos)
+                text = snql[pos:close]
+                if close > 0 and text.replace(", ", "").replace("-", "").isdigit():
+                    try:
+                        integers = list(map(int, text.split(", ")))
+                    except ValueError:
+                        pass
+                    else:
+                        add_kind(_INTEGERS)
+                        add_value(integers)
+                        pos = close
+            elif char == "," and snql[pos : pos + 1] == " ":
+                pos += 1
+        elif char in number_start:
+            start = pos
+            pos = find_word_end(" ", pos + 1)
+            if pos < 0:
+                pos = end
+            elif snql[pos - 1] in "eE" and snql[pos] in "+-":
+                # The sign of the exponent, e.g. 1e-07
+                pos = find_word_end(" ", pos + 1)
+                if pos < 0:
+                    pos = end
+            text = snql[start:pos]
+            try:
+                if text.lstrip("-").isdigit():
+                    number: Union[int, float] = int(text)
+                elif "_" not in text:
+                    number = float(text)
+                else:
+                    raise ValueError(text)
+            except ValueError:
+                raise InvalidSnQL(f"invalid number '{text}' in '{snql}'")
+            add_kind(_NUMBER)
+            add_value(number)
+            if snql[pos : pos + 1] == " ":
+                pos += 1
+        elif char == "'":
+            start = pos + 1
+            quote = snql.find("'", start)
+            # A quote after a backslash is part of the string
+            while quote > 0 and snql[quote - 1] == "\\":
+                quote = snql.find("'", quote + 1)
+            if quote < 0:
+                raise InvalidSnQL(f"unterminated string at {pos} in '{snql}'")
+            text = snql[start:quote]
+            add_kind(_STRING)
+            add_value(_unescape(text) if "\\" in text else text)
+            pos = quote + 1
+            if snql[pos : pos + 1] == " ":
+                pos += 1
+        elif char in spaces:
+            pos += 1
+        elif char in "=<>!":
+            if snql[pos + 1 : pos + 2] == "=" and char != "=":
+                char += "="
+            elif char == "!":
+                raise InvalidSnQL(f"unexpected '!' at {pos} in '{snql}'")
+            add_kind(char)
+            add_value(char)
+            pos += len(char)
+        else:
+            raise InvalidSnQL(f"unexpected '{char}' at {pos} in '{snql}'")
+
+    add_kind(_END)
+    add_value(None)
+    return kinds, values
+
+
+# datetime.fromisoformat is much faster than slicing, but needs Python 3.7
+_fromisoformat = getattr(datetime, "fromisoformat", None)
+
+
+def _parse_datetime(value: str) -> Union[date, datetime, None]:
+    if not datetime_re.fullmatch(value):
+        return None
+    if len(value) == 10:
+        return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    if _fromisoformat is not None:
+        parsed: datetime = _fromisoformat(value)
+        return parsed
+    return datetime(
+        int(value[0:4]),
+        int(value[5:7]),
+        int(value[8:10]),
+        int(value[11:13]),
+        int(value[14:16]),
+        int(value[17:19]),
+        int(value[20:26]) if len(value) > 19 else 0,
+    )
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_column(name: str) -> Column:
+    column = Column(name)
+    # The column is shared by every query that uses it, so it is validated
+    # before it is cached, even when validation is deferred.
+    validate_tree(column)
+    return column
+
+
+def parse_cache_info() -> Tuple[int, int, int]:
+    """
+    The number of cache hits, cache misses and columns in the cache of parsed
+    columns.
+    """
+    info = _parse_column.cache_info()
+    return info.hits, info.misses, info.currsize
+
+
+_INT_CLAUSES: Mapping[str, Any] = {
+    "LIMIT": Limit,
+    "OFFSET": Offset,
+    "GRANULARITY": Granularity,
+}
+
+
+class _Parser:
+    """
+    A recursive descent parser over the tokens of a query.
+    """
+
+    def __init__(self, snql: str) -> None:
+        self.snql = snql
+        self.kinds, self.values = _tokenize(snql)
+        self.pos = 0
+
+    def error(self, message: str) -> NoReturn:
+        raise InvalidSnQL(f"{message} in '{self.snql}'")
+
+    def found(self) -> str:
+        kind = self.kinds[self.pos]
+        if kind == _END:
+            return "the end of the query"
+        if kind == _INTEGERS:
+            return "a list of numbers"
+        value = self.values[self.pos]
+        return repr(value) if kind == _STRING else f"'{value}'"
+
+    def is_word(self, word: str) -> bool:
+        return self.kinds[self.pos] == _NAME and word == self.values[self.pos]
+
+    def expect(self, symbol: str) -> None:
+        if self.kinds[self.pos] != symbol:
+            self.error(f"expected '{symbol}' but found {self.found()}")
+        self.pos += 1
+
+    def expect_word(self, word: str) -> None:
+        if not self.is_word(word):
+            self.error(f"expected {word} but found {self.found()}")
+        self.pos += 1
+
+    def name(self) -> str:
+        if self.kinds[self.pos] != _NAME:
+            self.error(f"expected a name but found {self.found()}")
+        name: str = self.values[self.pos]
+        self.pos += 1
+        return name
+
+    def query(self, dataset: str, flags: Mapping[str, Any]) -> Query:
+        fields: Dict[str, Any] = {"dataset": dataset}
+        fields.update(flags)
+        self.expect_word("MATCH")
+        fields["match"] = self.entity()
+
+        last = _CLAUSE_ORDER["MATCH"]
+        while self.kinds[self.pos] != _END:
+            keyword = self.clause_keyword()
+            if keyword == "LIMIT":
+                count = self.integer(keyword)
+                if self.is_word("BY"):
+                    self.pos += 1
+                    keyword = "LIMIT BY"
+            order = _CLAUSE_ORDER[keyword]
+            if order <= last:
+                self.error(f"unexpected {keyword} clause")
+            last = order
+
+            if keyword == "SELECT":
+                fields["select"] = self.expressions()
+            elif keyword == "BY":
+                fields["groupby"] = self.expressions()
+            elif keyword == "WHERE":
+                fields["where"] = self.conditions()
+            elif keyword == "HAVING":
+                fields["having"] = self.conditions()
+            elif keyword == "ORDER BY":
+                fields["orderby"] = self.orderbys()
+            elif keyword == "LIMIT BY":
+                column = self.expression()
+                if not isinstance(column, Column):
+                    self.error("LIMIT BY must be followed by a column")
+                fields["limitby"] = LimitBy(column, count)
+            elif keyword == "LIMIT":
+                fields["limit"] = Limit(count)
+            elif keyword == "TOTALS":
+                flag = self.values[self.pos]
+                if self.kinds[self.pos] != _NAME or flag not in _FLAGS:
+                    self.error("TOTALS must be followed by True or False")
+                self.pos += 1
+                fields["totals"] = Totals(_FLAGS[flag])
+            else:
+                fields[keyword.lower()] = _INT_CLAUSES[keyword](self.integer(keyword))
+
+        return Query(**fields)
+
+    def clause_keyword(self) -> str:
+        keyword = self.values[self.pos]
+        if self.kinds[self.pos] != _NAME or keyword not in _CLAUSE_WORDS:
+            self.error(f"expected a clause but found {self.found()}")
+        self.pos += 1
+        if keyword == "ORDER":
+            self.expect_word("BY")
+            return "ORDER BY"
+        return str(keyword)
+
+    def integer(self, keyword: str) -> int:
+        value = self.values[self.pos]
+        if self.kinds[self.pos] != _NUMBER or not isinstance(value, int):
+            self.error(f"{keyword} must be followed by an integer")
+        self.pos += 1
+        return int(value)
+
+    def entity(self) -> Entity:
+        self.expect("(")
+        name = self.name()
+        sample = None
+        if self.is_word("SAMPLE"):
+            self.pos += 1
+            if self.kinds[self.pos] != _NUMBER:
+                self.error(f"expected a sample rate but found {self.found()}")
+            sample = self.values[self.pos]
+            self.pos += 1
+        self.expect(")")
+        return Entity(name, sample)
+
+    def expressions(self) -> List[Any]:
+        items = [self.expression()]
+        while self.kinds[self.pos] == ",":
+            self.pos += 1
+            items.append(self.expression())
+        return items
+
+    def conditions(self) -> List[Condition]:
+        items = [self.condition()]
+        while self.is_word("AND"):
+            self.pos += 1
+            items.append(self.condition())
+        return items
+
+    def orderbys(self) -> List[OrderBy]:
+        items = [self.orderby()]
+        while self.kinds[self.pos] == ",":
+            self.pos += 1
+            items.append(self.orderby())
+        return items
+
+    def arguments(self) -> List[Any]:
+        # The caller checked that the next token is a "("
+        kinds = self.kinds
+        self.pos += 1
+        values: List[Any] = []
+        if kinds[self.pos] == ")":
+            self.pos += 1
+            return values
+        if kinds[self.pos] == _INTEGERS:
+            values = self.values[self.pos]
+            self.pos += 1
+            self.expect(")")
+            return values
+        while True:
+            values.append(self.value())
+            kind = kinds[self.pos]
+            if kind == ")":
+                self.pos += 1
+                return values
+            if kind != ",":
+                self.error(f"expected ',' or ')' but found {self.found()}")
+            self.pos += 1
+
+    def expression(self, as_value: bool = False) -> Any:
+        kinds = self.kinds
+        pos = self.pos
+        if kinds[pos] != _NAME:
+            self.error(f"expected a column or function but found {self.found()}")
+        name = self.values[pos]
+        self.pos = pos = pos + 1
+        if kinds[pos] != "(":
+            return _parse_column(name)
+
+        parameters = self.arguments()
+        initializers = None
+        if kinds[self.pos] == "(":
+            initializers, parameters = parameters, self.arguments()
+        alias = None
+        if self.is_word("AS"):
+            self.pos += 1
+            alias = self.name()
+
+        if initializers is not None:
+            return CurriedFunction(name, initializers, parameters, alias)
+        if as_value and alias is None:
+            value = self.function_value(name, parameters)
+            if value is not self:
+                return value
+        return Function(name, parameters, alias)
+
+    def function_value(self, name: str, parameters: List[Any]) -> Any:
+        # Scalars that are printed as a function call. Returns the parser
+        # itself if the call is not one of them.
+        if name == "toDateTime":
+            if len(parameters) == 1 and isinstance(parameters[0], str):
+                parsed = _parse_datetime(parameters[0])
+                if parsed is not None:
+                    return parsed
+        elif name == "array" or name == "tuple":
+            value = parameters if name == "array" else tuple(parameters)
+            try:
+                if is_scalar(value):
+                    return value
+            except (InvalidArray, InvalidExpression):
+                pass
+        return self
+
+    def value(self) -> Any:
+        pos = self.pos
+        kind = self.kinds[pos]
+        value = self.values[pos]
+        if kind == _STRING or kind == _NUMBER:
+            self.pos = pos + 1
+            return value
+        elif kind == _NAME and self.kinds[pos + 1] != "(":
+            if value in _KEYWORD_VALUES:
+                self.pos = pos + 1
+                return _KEYWORD_VALUES[value]
+            elif value in _FLOAT_VALUES:
+                self.pos = pos + 1
+                return _FLOAT_VALUES[value]
+        return self.expression(as_value=True)
+
+    def operator(self) -> Op:
+        pos = self.pos
+        kind = self.kinds[pos]
+        if kind in _SYMBOL_OPERATORS:
+            self.pos = pos + 1
+            return _SYMBOL_OPERATORS[kind]
+        if kind == _NAME:
+            for length in (1, 2, 3):
+                op = _WORD_OPERATORS.get(tuple(self.values[pos : pos + length]))
+                if op is not None:
+                    self.pos = pos + length
+                    return op
+        self.error(f"expected an operator but found {self.found()}")
+
+    def condition(self) -> Condition:
+        lhs = self.expression()
+        op = self.operator()
+        if op in UNARY_OPERATORS:
+            return Condition(lhs, op)
+        return Condition(lhs, op, self.value())
+
+    def orderby(self) -> OrderBy:
+        exp = self.expression()
+        if not (self.is_word("ASC") or self.is_word("DESC")):
+            self.error(f"expected ASC or DESC but found {self.found()}")
+        direction = Direction(self.values[self.pos])
+        self.pos += 1
+        return OrderBy(exp, direction)
+
+
+def _parse_clauses(dataset: str, snql: str, flags: Mapping[str, Any]) -> Query:
+    return _Parser(snql).query(dataset, flags)
+
+
+_FLAG_TYPES = {"consistent": Consistent, "turbo": Turbo, "debug": Debug}
+
+
+def parse_query(snql: str, dataset: Optional[str] = None) -> Query:
+    """
+    Parse a query printed by ``str(query)`` or ``query.print()``.
+
+    :param snql: The SnQL query.
+    :type snql: str
+    :param dataset: The dataset of the query. It can be left out if the query
+        was pretty printed, since the dataset is in its header.
+    :type dataset: Optional[str]
+
+    :raises InvalidSnQL: If the query can't be parsed.
+    :raises InvalidExpression: If an expression in the query is not valid.
+
+    """
+    flags: Dict[str, Any] = {}
+    if snql.startswith("--"):
+        # The header written by the pretty printer, e.g. -- DATASET: discover
+        lines = snql.split("\n")
+        for index, line in enumerate(lines):
+            if not line.startswith("-- "):
+                break
+            key, _, value = line[3:].partition(": ")
+            key = key.lower()
+            if key == "dataset":
+                dataset = dataset or value
+            elif key in _FLAG_TYPES and value in _FLAGS:
+                flags[key] = _FLAG_TYPES[key](_FLAGS[value])
+            else:
+                raise InvalidSnQL(f"invalid header '{line}'")
+        snql = "\n".join(lines[index:])
+
+    if dataset is None:
+        raise InvalidSnQL("the dataset of the query is required")
+    return _parse_clauses(dataset, snql, flags)
+
+
+def parse_snuba(body: Union[str, Mapping[str, Any]]) -> Query:
+    """
+    Parse the body of a request to Snuba, as created by ``query.snuba()``,
+    either as JSON or as a dict.
+
+    :raises InvalidSnQL: If the body or the query in it can't be parsed.
+    :raises InvalidExpression: If an expression in the query is not valid.
+
+    """
+    if isinstance(body, str):
+        import json  # Imported when first used, to keep the SDK import cheap
+
+        try:
+            body = json.loads(body)
+        except ValueError as e:
+            raise InvalidSnQL(f"invalid body: {e}") from e
+
+    if not isinstance(body, Mapping) or not isinstance(body.get("query"), str):
+        raise InvalidSnQL("the body must contain a query")
+    dataset = body.get("dataset")
+    if not isinstance(dataset, str):
+        raise InvalidSnQL("the body must contain a dataset")
+
+    flags: Dict[str, Any] = {}
+    for key, flag_type in _FLAG_TYPES.items():
+        if key in body:
+            flags[key] = flag_type(body[key])
+    return _parse_clauses(dataset, body["query"], flags)
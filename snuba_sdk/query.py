@@ -1,5 +1,20 @@
 from dataclasses import dataclass, fields, replace
-from typing import Any, List, Optional, Sequence, Union
+from operator import is_
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    IO,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from snuba_sdk.conditions import Condition
 from snuba_sdk.entity import Entity
@@ -8,16 +23,30 @@ from snuba_sdk.expressions import (
     Consistent,
     CurriedFunction,
     Debug,
+    fingerprint_of,
     Function,
     Granularity,
     Limit,
     LimitBy,
     Offset,
     OrderBy,
+    Param,
     Totals,
+    tree_aliases,
     Turbo,
 )
-from snuba_sdk.query_visitors import InvalidQuery, Printer, Translator, Validator
+from snuba_sdk.query_visitors import (
+    _escape_json,
+    InvalidQuery,
+    Printer,
+    StreamingTranslator,
+    TemplatePrinter,
+    Translator,
+    Validator,
+)
+from snuba_sdk.visitors import Renderer
+
+T = TypeVar("T")
 
 
 def list_type(vals: Sequence[Any], type_classes: Sequence[Any]) -> bool:
@@ -26,10 +55,64 @@ def list_type(vals: Sequence[Any], type_classes: Sequence[Any]) -> bool:
     )
 
 
+def _same_items(cached: Tuple[Any, ...], items: Tuple[Any, ...]) -> bool:
+    return len(cached) == len(items) and all(map(is_, cached, items))
+
+
+# The checks done by the set functions of Query and QueryBuilder, and by the
+# codec on the clauses of an untrusted payload. Each one returns the clause if
+# it is valid, and raises InvalidQuery otherwise.
+
+
+def check_match(match: Entity) -> Entity:
+    if not isinstance(match, Entity):
+        raise InvalidQuery(f"{match} must be a valid Entity")
+    return match
+
+
+def check_select(select: Sequence[Any]) -> Sequence[Any]:
+    if not list_type(select, (Column, CurriedFunction, Function)) or not select:
+        raise InvalidQuery(
+            "select clause must be a non-empty list of Column and/or Function"
+        )
+    return select
+
+
+def check_groupby(groupby: Sequence[Any]) -> Sequence[Any]:
+    if not list_type(groupby, (Column, CurriedFunction, Function)):
+        raise InvalidQuery("groupby clause must be a list of Column and/or Function")
+    return groupby
+
+
+def check_where(conditions: Sequence[Condition]) -> Sequence[Condition]:
+    if not list_type(conditions, (Condition,)):
+        raise InvalidQuery("where clause must be a list of Condition")
+    return conditions
+
+
+def check_having(conditions: Sequence[Condition]) -> Sequence[Condition]:
+    if not list_type(conditions, (Condition,)):
+        raise InvalidQuery("having clause must be a list of Condition")
+    return conditions
+
+
+def check_orderby(orderby: Sequence[OrderBy]) -> Sequence[OrderBy]:
+    if not list_type(orderby, (OrderBy,)):
+        raise InvalidQuery("orderby clause must be a list of OrderBy")
+    return orderby
+
+
+def check_limitby(limitby: LimitBy) -> LimitBy:
+    if not isinstance(limitby, LimitBy):
+        raise InvalidQuery("limitby clause must be a LimitBy")
+    return limitby
+
+
 PRINTER = Printer()
 PRETTY_PRINTER = Printer(pretty=True)
 VALIDATOR = Validator()
 TRANSLATOR = Translator()
+STREAMING_TRANSLATOR = StreamingTranslator()
 
 
 @dataclass(frozen=True)
@@ -40,6 +123,13 @@ class Query:
     instantiate a Query that is invalid. Any of the translation functions will
     validate the query before translating them, so the query must be valid before
     they are called.
+
+    Since the query can't change, the outcome of the validation and the output
+    of the translation functions are cached on the query. Copies made by the
+    set functions share the output of the individual clauses they have in
+    common with the original, so e.g. paginating with set_offset only renders
+    the OFFSET clause again. The set functions copy the lists they are given,
+    so changing a list afterwards doesn't change the query.
     """
 
     # These must be listed in the order that they must appear in the SnQL query.
@@ -74,64 +164,111 @@ class Query:
         if not isinstance(self.match, Entity):
             raise InvalidQuery("queries must have a valid Entity")
 
+    def _cached(self, key: str, build: Callable[[], T]) -> T:
+        # The cache lives outside of the dataclass fields, so it is ignored by
+        # the generated __eq__, __repr__ and replace.
+        cache: Optional[Dict[str, Any]] = self.__dict__.get("_cache")
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, "_cache", cache)
+
+        if key not in cache:
+            cache[key] = build()
+        value: T = cache[key]
+        return value
+
+    def _cached_clause(
+        self, visitor: type, field: str, clause: Any, visit: Callable[[Any], T]
+    ) -> T:
+        clauses: Dict[Tuple[type, str], Tuple[Any, Any, Any]] = self._cached(
+            "clauses", dict
+        )
+        key = (visitor, field)
+        cached = clauses.get(key)
+        # The items of a list clause are kept too, so a list that was changed
+        # in place after it was visited is visited again
+        items = tuple(clause) if type(clause) is list else None
+        if (
+            cached is not None
+            and cached[0] is clause
+            and (items is None or _same_items(cached[1], items))
+        ):
+            value: T = cached[2]
+            return value
+
+        result = visit(clause)
+        clauses[key] = (clause, items, result)
+        return result
+
     def _replace(self, field: str, value: Any) -> "Query":
         new = replace(self, **{field: value})
+        # Share the visited clauses with the new query. The entries are keyed on
+        # the identity of the clause, so the new query only uses the ones for
+        # the clauses it has in common with this one, and the clauses it visits
+        # are available to this query and any other copies made from it.
+        object.__setattr__(new, "_cache", {"clauses": self._cached("clauses", dict)})
         return new
 
+    @property
+    def fingerprint(self) -> bytes:
+        """
+        A digest of the structure of the query, built from the fingerprints of
+        its clauses. Two queries have the same fingerprint if and only if they
+        are equal, so it can be used as a cache key.
+        """
+        return self._cached(
+            "fingerprint",
+            lambda: fingerprint_of(
+                b"Query", [getattr(self, name) for name in self.get_fields()]
+            ),
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Queries are pickled with the compact encoding of snuba_sdk.codec. Only
+        # the clauses are encoded, the cached output is rebuilt if needed.
+        from snuba_sdk.codec import reduce
+
+        return reduce(self)
+
     def get_fields(self) -> Sequence[str]:
         self_fields = fields(self)  # Verified the order in the Python source
         return tuple(f.name for f in self_fields)
 
     def set_match(self, match: Entity) -> "Query":
-        if not isinstance(match, Entity):
-            raise InvalidQuery(f"{match} must be a valid Entity")
-        return self._replace("match", match)
+        return self._replace("match", check_match(match))
 
     def set_select(
         self, select: Sequence[Union[Column, CurriedFunction, Function]]
     ) -> "Query":
-        if not list_type(select, (Column, CurriedFunction, Function)) or not select:
-            raise InvalidQuery(
-                "select clause must be a non-empty list of Column and/or Function"
-            )
-        return self._replace("select", select)
+        return self._replace("select", list(check_select(select)))
 
     def set_groupby(
         self, groupby: Sequence[Union[Column, CurriedFunction, Function]]
     ) -> "Query":
-        if not list_type(groupby, (Column, CurriedFunction, Function)):
-            raise InvalidQuery(
-                "groupby clause must be a list of Column and/or Function"
-            )
-        return self._replace("groupby", groupby)
+        return self._replace("groupby", list(check_groupby(groupby)))
 
     def set_where(self, conditions: Sequence[Condition]) -> "Query":
-        if not list_type(conditions, (Condition,)):
-            raise InvalidQuery("where clause must be a list of Condition")
-        return self._replace("where", conditions)
+        return self._replace("where", list(check_where(conditions)))
 
     def set_having(self, conditions: Sequence[Condition]) -> "Query":
-        if not list_type(conditions, (Condition,)):
-            raise InvalidQuery("having clause must be a list of Condition")
-        return self._replace("having", conditions)
+        return self._replace("having", list(check_having(conditions)))
 
     def set_orderby(self, orderby: Sequence[OrderBy]) -> "Query":
-        if not list_type(orderby, (OrderBy,)):
-            raise InvalidQuery("orderby clause must be a list of OrderBy")
-        return self._replace("orderby", orderby)
+        return self._replace("orderby", list(check_orderby(orderby)))
 
     def set_limitby(self, limitby: LimitBy) -> "Query":
-        if not isinstance(limitby, LimitBy):
-            raise InvalidQuery("limitby clause must be a LimitBy")
-        return self._replace("limitby", limitby)
+        return self._replace("limitby", check_limitby(limitby))
 
-    def set_limit(self, limit: int) -> "Query":
+    def set_limit(self, limit: Union[int, Param]) -> "Query":
         return self._replace("limit", Limit(limit))
 
-    def set_offset(self, offset: int) -> "Query":
+    def set_offset(self, offset: Union[int, Param]) -> "Query":
         return self._replace("offset", Offset(offset))
 
-    def set_granularity(self, granularity: int) -> "Query":
+    def set_granularity(self, granularity: Union[int, Param]) -> "Query":
         return self._replace("granularity", Granularity(granularity))
 
     def set_totals(self, totals: bool) -> "Query":
@@ -147,16 +284,287 @@ class Query:
         return self._replace("debug", Debug(debug))
 
     def validate(self) -> None:
-        VALIDATOR.visit(self)
+        error = self._cached("validate", self._validation_error)
+        if error is not None:
+            raise error.with_traceback(None)
+
+    def _validation_error(self) -> Optional[Exception]:
+        try:
+            VALIDATOR.visit(self)
+        except Exception as e:
+            return e
+        return None
 
     def __str__(self) -> str:
         self.validate()
-        return PRINTER.visit(self)
+        return self._cached("str", lambda: PRINTER.visit(self))
 
     def print(self) -> str:
         self.validate()
-        return PRETTY_PRINTER.visit(self)
+        return self._cached("print", lambda: PRETTY_PRINTER.visit(self))
 
     def snuba(self) -> str:
         self.validate()
-        return TRANSLATOR.visit(self)
+        return self._cached("snuba", lambda: TRANSLATOR.visit(self))
+
+    def write_snuba(self, out: IO[str]) -> int:
+        """
+        Write the body of the request to Snuba to a file-like object, e.g. a
+        file or a socket wrapped with ``socket.makefile("w", encoding="ascii")``.
+        The body is the same as :meth:`snuba` returns, but unless that was
+        already called, it is written in chunks as it is rendered and is not
+        cached, so the whole body is never held in memory.
+
+        :returns: The number of characters written.
+        :raises InvalidQuery: If the query is not valid.
+
+        """
+        self.validate()
+        cache: Dict[str, Any] = self.__dict__.get("_cache") or {}
+        if "snuba" in cache:
+            out.write(cache["snuba"])
+            return len(cache["snuba"])
+        return STREAMING_TRANSLATOR.write(self, out)
+
+    def prepare(self) -> "PreparedQuery":
+        """
+        Validate and compile this query into a template, where each Param is
+        a slot that a value is bound to when the template is rendered.
+
+        :raises InvalidQuery: If the query is not valid.
+
+        """
+        return self._cached("prepare", lambda: PreparedQuery(self))
+
+
+class QueryBuilder:
+    """
+    A mutable counterpart of Query, for building a query out of many clauses.
+    It has the same set functions as Query, which check their arguments the
+    same way, but they update the builder in place instead of each returning a
+    new copy of the query::
+
+        builder = QueryBuilder("discover", Entity("events"))
+        builder.set_select([Column("event_id")])
+        builder.set_limit(10)
+        query = builder.build()
+
+    The set functions return the builder, so they can also be chained.
+    """
+
+    def __init__(self, dataset: str, match: Entity) -> None:
+        self._fields: Dict[str, Any] = {"dataset": dataset, "match": match}
+
+    def set_match(self, match: Entity) -> "QueryBuilder":
+        self._fields["match"] = check_match(match)
+        return self
+
+    def set_select(
+        self, select: Sequence[Union[Column, CurriedFunction, Function]]
+    ) -> "QueryBuilder":
+        self._fields["select"] = list(check_select(select))
+        return self
+
+    def set_groupby(
+        self, groupby: Sequence[Union[Column, CurriedFunction, Function]]
+    ) -> "QueryBuilder":
+        self._fields["groupby"] = list(check_groupby(groupby))
+        return self
+
+    def set_where(self, conditions: Sequence[Condition]) -> "QueryBuilder":
+        self._fields["where"] = list(check_where(conditions))
+        return self
+
+    def set_having(self, conditions: Sequence[Condition]) -> "QueryBuilder":
+        self._fields["having"] = list(check_having(conditions))
+        return self
+
+    def set_orderby(self, orderby: Sequence[OrderBy]) -> "QueryBuilder":
+        self._fields["orderby"] = list(check_orderby(orderby))
+        return self
+
+    def set_limitby(self, limitby: LimitBy) -> "QueryBuilder":
+        self._fields["limitby"] = check_limitby(limitby)
+        return self
+
+    def set_limit(self, limit: Union[int, Param]) -> "QueryBuilder":
+        self._fields["limit"] = Limit(limit)
+        return self
+
+    def set_offset(self, offset: Union[int, Param]) -> "QueryBuilder":
+        self._fields["offset"] = Offset(offset)
+        return self
+
+    def set_granularity(self, granularity: Union[int, Param]) -> "QueryBuilder":
+        self._fields["granularity"] = Granularity(granularity)
+        return self
+
+    def set_totals(self, totals: bool) -> "QueryBuilder":
+        self._fields["totals"] = Totals(totals)
+        return self
+
+    def set_consistent(self, consistent: bool) -> "QueryBuilder":
+        self._fields["consistent"] = Consistent(consistent)
+        return self
+
+    def set_turbo(self, turbo: bool) -> "QueryBuilder":
+        self._fields["turbo"] = Turbo(turbo)
+        return self
+
+    def set_debug(self, debug: bool) -> "QueryBuilder":
+        self._fields["debug"] = Debug(debug)
+        return self
+
+    def build(self) -> Query:
+        """
+        Create a Query with the clauses set so far. The builder can still be
+        used afterwards, and changing it doesn't affect the queries it built.
+
+        :raises InvalidQuery: If the dataset or the entity is not valid.
+
+        """
+        return Query(**self._fields)
+
+
+class PreparedQuery:
+    """
+    A query that has been validated and compiled once, with named Params in
+    place of some of its literal values. Rendering it only needs to check and
+    stringify the values bound to the Params, so it is much cheaper than
+    building and serializing a new Query each time::
+
+        prepared = (
+            Query("discover", Entity("events"))
+            .set_select([Column("event_id")])
+            .set_where([Condition(Column("project_id"), Op.EQ, Param("project"))])
+            .set_limit(Param("limit"))
+            .prepare()
+        )
+        body = prepared.snuba(project=1, limit=10)
+
+    """
+
+    def __init__(self, query: Query) -> None:
+        query.validate()
+        printer = TemplatePrinter()
+        template = printer.visit(query)
+        slots = printer.template.slots
+
+        parts = template.split("\x00")
+        if len(parts) != 2 * len(slots) + 1:
+            raise InvalidQuery("queries containing NUL characters can't be prepared")
+
+        self.query = query
+        self.slots: Sequence[Tuple[str, Renderer]] = [
+            slots[int(index)] for index in parts[1::2]
+        ]
+        self.params = frozenset(name for name, _ in self.slots)
+        self.segments: Sequence[str] = parts[0::2]
+
+        # JSON escaping works character by character, so each segment can be
+        # escaped ahead of time and the bound values escaped on their own.
+        self.json_prefix, self.json_suffix = Translator._envelope(query)
+        self.json_segments: Sequence[str] = [
+            _escape_json(segment) for segment in self.segments
+        ]
+
+    def _render(
+        self, segments: Sequence[str], escape: bool, values: Mapping[str, Any]
+    ) -> List[str]:
+        if values.keys() != self.params:
+            missing = ", ".join(sorted(self.params - values.keys()))
+            unknown = ", ".join(sorted(values.keys() - self.params))
+            if missing:
+                raise InvalidQuery(f"missing values for parameters: {missing}")
+            raise InvalidQuery(f"unknown parameters: {unknown}")
+
+        chunks = [segments[0]]
+        for (name, render), segment in zip(self.slots, segments[1:]):
+            rendered = render(values[name])
+            chunks.append(_escape_json(rendered) if escape else rendered)
+            chunks.append(segment)
+        return chunks
+
+    def bind(self, **values: Any) -> str:
+        """
+        Render the query in SnQL with the given values, the same as ``str()``
+        would on the query with the values in place of the Params.
+
+        :raises InvalidQuery: If a value is missing or not expected.
+        :raises InvalidExpression: If a value is not valid for its Param.
+
+        """
+        return "".join(self._render(self.segments, False, values))
+
+    def snuba(self, **values: Any) -> str:
+        """
+        Render the body of the request to send to Snuba with the given values,
+        the same as :meth:`Query.snuba` would on the query with the values in
+        place of the Params.
+
+        :raises InvalidQuery: If a value is missing or not expected.
+        :raises InvalidExpression: If a value is not valid for its Param.
+
+        """
+        chunks = self._render(self.json_segments, True, values)
+        return f"{self.json_prefix}{''.join(chunks)}{self.json_suffix}"
+
+
+# The number of queries sent to a worker process at once by compile_many.
+COMPILE_BATCH_SIZE = 64
+
+
+def _compile_batch(queries: Sequence[Query]) -> List[str]:
+    return [query.snuba() for query in queries]
+
+
+def compile_many(
+    queries: Iterable[Query],
+    workers: Optional[int] = None,
+    batch_size: int = COMPILE_BATCH_SIZE,
+) -> List[str]:
+    """
+    Validate and translate many queries, returning the output of
+    :meth:`Query.snuba` for each one, in the same order. Identical queries are
+    only compiled once, and the distinct ones are compiled in batches by a
+    pool of ``workers`` processes, which defaults to the number of CPUs. With
+    ``workers=0``, or if there is only one batch to compile, they are compiled
+    in this process.
+
+    :raises InvalidQuery: If any of the queries is not valid.
+
+    """
+    keys: List[Hashable] = []
+    unique: Dict[Hashable, int] = {}
+    distinct: List[Query] = []
+    for query in queries:
+        # Aliases are not part of the fingerprint, but they are in the output
+        clauses = [getattr(query, name) for name in query.get_fields()]
+        key = (query.fingerprint, tree_aliases(clauses))
+        keys.append(key)
+        if key not in unique:
+            unique[key] = len(distinct)
+            distinct.append(query)
+
+    if workers is None:
+        import os
+
+        workers = os.cpu_count() or 1
+
+    if workers == 0 or len(distinct) <= batch_size:
+        compiled = _compile_batch(distinct)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        batches = [
+            distinct[start : start + batch_size]
+            for start in range(0, len(distinct), batch_size)
+        ]
+        with ProcessPoolExecutor(workers) as executor:
+            compiled = [
+                body
+                for batch in executor.map(_compile_batch, batches)
+                for body in batch
+            ]
+
+    return [compiled[unique[key]] for key in keys]
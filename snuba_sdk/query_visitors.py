@@ -1,11 +1,15 @@
-import json
 from abc import ABC, abstractmethod
 from typing import (
+    Any,
     Generic,
+    IO,
+    Iterator,
     Mapping,
     MutableMapping,
     Optional,
     Sequence,
+    Tuple,
+    Type,
     TYPE_CHECKING,
     TypeVar,
     Union,
@@ -21,14 +25,23 @@ from snuba_sdk.expressions import (
     Expression,
     Function,
     Granularity,
+    is_array_array,
+    is_numeric_array,
+    is_scalar,
     Limit,
     LimitBy,
     Offset,
     OrderBy,
     Totals,
     Turbo,
+    validate_tree,
+)
+from snuba_sdk.visitors import (
+    _join_homogeneous,
+    _stringify_scalar,
+    TemplateTranslation,
+    Translation,
 )
-from snuba_sdk.visitors import Translation
 
 if TYPE_CHECKING:
     # Import the module due to sphinx autodoc problems
@@ -44,11 +57,23 @@ QVisited = TypeVar("QVisited")
 
 
 class QueryVisitor(ABC, Generic[QVisited]):
+    # If True, the result of visiting each clause is cached on the query, keyed
+    # on the identity of the clause. Queries derived with the set functions keep
+    # the results of the clauses they share with the original query, so only
+    # the clauses that changed are visited again. This must only be enabled for
+    # visitors whose clause results depend on nothing but the clause itself.
+    cache_clauses = False
+
     def visit(self, query: "query.Query") -> QVisited:
         fields = query.get_fields()
         returns = {}
         for field in fields:
-            returns[field] = getattr(self, f"_visit_{field}")(getattr(query, field))
+            visit = getattr(self, f"_visit_{field}")
+            clause = getattr(query, field)
+            if self.cache_clauses:
+                returns[field] = query._cached_clause(type(self), field, clause, visit)
+            else:
+                returns[field] = visit(clause)
 
         return self._combine(query, returns)
 
@@ -124,6 +149,8 @@ class QueryVisitor(ABC, Generic[QVisited]):
 
 
 class Printer(QueryVisitor[str]):
+    cache_clauses = True
+
     def __init__(self, pretty: bool = False) -> None:
         self.translator = Translation()
         self.pretty = pretty
@@ -221,7 +248,15 @@ class Translator(Printer):
         super().__init__(False)
 
     def _combine(self, query: "query.Query", returns: Mapping[str, str]) -> str:
+        import json  # Imported when first used, to keep the SDK import cheap
+
         formatted_query = super()._combine(query, returns)
+        return json.dumps(self._body(query, formatted_query))
+
+    @staticmethod
+    def _body(
+        query: "query.Query", formatted_query: str
+    ) -> MutableMapping[str, Union[str, bool]]:
         body: MutableMapping[str, Union[str, bool]] = {
             "dataset": query.dataset,
             "query": formatted_query,
@@ -233,10 +268,219 @@ class Translator(Printer):
         if query.debug:
             body["debug"] = query.debug.value
 
-        return json.dumps(body)
+        return body
+
+    @staticmethod
+    def _envelope(query: "query.Query") -> Tuple[str, str]:
+        # The JSON of the body up to and after the (escaped) query, so the query
+        # can be written between them.
+        import json
+
+        body = json.dumps(Translator._body(query, ""))
+        query_start = body.index('"query": ""') + len('"query": "')
+        return body[:query_start], body[query_start:]
+
+
+def _escape_json(value: str) -> str:
+    import json
+
+    # This matches the escaping done by json.dumps, without the quotes
+    escaped: str = json.encoder.encode_basestring_ascii(value)
+    return escaped[1:-1]
+
+
+class TemplatePrinter(Printer):
+    """
+    Prints a query containing Params as a compact template, see
+    :class:`snuba_sdk.visitors.TemplateTranslation` for the format.
+    """
+
+    # The slots are recorded as the clauses are visited, so they can't be cached
+    cache_clauses = False
+
+    def __init__(self) -> None:
+        super().__init__(False)
+        self.template = TemplateTranslation()
+        self.translator = self.template
+
+
+# The number of elements of a list or tuple in a condition that the streaming
+# visitors render into one chunk.
+STREAM_BATCH_SIZE = 1024
+
+
+class StreamingPrinter(QueryVisitor[Iterator[str]]):
+    """
+    Prints a query the same way as :class:`Printer`, as an iterator of chunks
+    instead of one string. Each chunk holds at most one expression, and the
+    lists and tuples that conditions compare against are rendered
+    STREAM_BATCH_SIZE elements at a time, so the printed query is never held
+    in memory as a whole. See :meth:`write` to write it to a file or socket.
+    """
+
+    def __init__(self, pretty: bool = False) -> None:
+        self.translator = Translation()
+        self.pretty = pretty
+
+    def write(self, query: "query.Query", out: IO[str]) -> int:
+        """
+        Write the chunks to a file-like object, returning the number of
+        characters written. The query should be validated first: if it is not
+        valid, the chunks before the invalid expression are already written.
+        """
+        written = 0
+        for chunk in self.visit(query):
+            out.write(chunk)
+            written += len(chunk)
+        return written
+
+    def _combine(
+        self, query: "query.Query", returns: Mapping[str, Iterator[str]]
+    ) -> Iterator[str]:
+        # These fields are encoded outside of the SQL
+        to_skip = ("dataset", "consistent", "turbo", "debug")
+        if self.pretty:
+            for skip in to_skip:
+                value = "".join(returns[skip])
+                if value:
+                    yield f"-- {skip.upper()}: {value}\n"
+
+        # The clauses are generators, so an empty clause is only known to be
+        # empty once its first chunk is asked for.
+        separator = ""
+        for clause in query.get_fields():
+            if clause in to_skip:
+                continue
+            chunks = returns[clause]
+            first = next(chunks, None)
+            if first is not None:
+                yield separator + first
+                yield from chunks
+                separator = "\n" if self.pretty else " "
+
+    def _items(
+        self, keyword: str, separator: str, items: Optional[Sequence[Expression]]
+    ) -> Iterator[str]:
+        prefix = f"{keyword} "
+        for item in items or ():
+            if isinstance(item, Condition) and _is_sequence(item.rhs):
+                yield from self._sequence_condition(prefix, item)
+            else:
+                yield prefix + self.translator.visit(item)
+            prefix = separator
+
+    def _sequence_condition(self, prefix: str, cond: Condition) -> Iterator[str]:
+        values: Any = cond.rhs
+        name = "tuple" if isinstance(values, tuple) else "array"
+        lhs = self.translator.visit(cond.lhs)
+        yield f"{prefix}{lhs} {cond.op.value} {name}("
+
+        checked = False
+        for start in range(0, len(values), STREAM_BATCH_SIZE):
+            batch = values[start : start + STREAM_BATCH_SIZE]
+            if start:
+                yield ", "
+            if not isinstance(values, (list, tuple)):
+                # array.array yields Python numbers directly, NumPy arrays are
+                # converted a batch at a time.
+                elements = batch if is_array_array(batch) else batch.tolist()
+                yield ", ".join(map(str, elements))
+                continue
+
+            joined = _join_homogeneous(batch)
+            if joined is None:
+                if not checked:
+                    is_scalar(values)  # Throws on an invalid array or tuple
+                    checked = True
+                joined = ", ".join([_stringify_scalar(v) for v in batch])
+            yield joined
+        yield ")"
+
+    def _visit_dataset(self, dataset: str) -> Iterator[str]:
+        yield dataset
+
+    def _visit_match(self, match: Entity) -> Iterator[str]:
+        yield f"MATCH {self.translator.visit(match)}"
+
+    def _visit_select(
+        self, select: Optional[Sequence[Union[Column, CurriedFunction, Function]]]
+    ) -> Iterator[str]:
+        return self._items("SELECT", ", ", select)
+
+    def _visit_groupby(
+        self, groupby: Optional[Sequence[Union[Column, CurriedFunction, Function]]]
+    ) -> Iterator[str]:
+        return self._items("BY", ", ", groupby)
+
+    def _visit_where(self, where: Optional[Sequence[Condition]]) -> Iterator[str]:
+        return self._items("WHERE", " AND ", where)
+
+    def _visit_having(self, having: Optional[Sequence[Condition]]) -> Iterator[str]:
+        return self._items("HAVING", " AND ", having)
+
+    def _visit_orderby(self, orderby: Optional[Sequence[OrderBy]]) -> Iterator[str]:
+        return self._items("ORDER BY", ", ", orderby)
+
+    def _visit_limitby(self, limitby: Optional[LimitBy]) -> Iterator[str]:
+        return self._items("LIMIT", "", [limitby] if limitby is not None else None)
+
+    def _visit_limit(self, limit: Optional[Limit]) -> Iterator[str]:
+        return self._items("LIMIT", "", [limit] if limit is not None else None)
+
+    def _visit_offset(self, offset: Optional[Offset]) -> Iterator[str]:
+        return self._items("OFFSET", "", [offset] if offset is not None else None)
+
+    def _visit_granularity(self, granularity: Optional[Granularity]) -> Iterator[str]:
+        return self._items(
+            "GRANULARITY", "", [granularity] if granularity is not None else None
+        )
+
+    def _visit_totals(self, totals: Totals) -> Iterator[str]:
+        return self._items("TOTALS", "", [totals] if totals else None)
+
+    def _visit_consistent(self, consistent: Consistent) -> Iterator[str]:
+        return iter([str(consistent)] if consistent else [])
+
+    def _visit_turbo(self, turbo: Turbo) -> Iterator[str]:
+        return iter([str(turbo)] if turbo else [])
+
+    def _visit_debug(self, debug: Debug) -> Iterator[str]:
+        return iter([str(debug)] if debug else [])
+
+
+def _is_sequence(value: Any) -> bool:
+    return isinstance(value, (list, tuple)) or is_numeric_array(value)
+
+
+class StreamingTranslator(StreamingPrinter):
+    """
+    Renders the body of the request to Snuba the same way as
+    :class:`Translator`, as an iterator of chunks. The chunks of the query are
+    JSON escaped one at a time and placed between the other fields of the body,
+    so neither the query nor its escaped copy is held in memory as a whole.
+    The body is ASCII, so it can be written to a socket wrapped with
+    ``socket.makefile("w", encoding="ascii")``.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(False)
+
+    def _combine(
+        self, query: "query.Query", returns: Mapping[str, Iterator[str]]
+    ) -> Iterator[str]:
+        import json  # Imported when first used, to keep the SDK import cheap
+
+        escape = json.encoder.encode_basestring_ascii
+        prefix, suffix = Translator._envelope(query)
+        yield prefix
+        for chunk in super()._combine(query, returns):
+            yield escape(chunk)[1:-1]
+        yield suffix
 
 
 class Validator(QueryVisitor[None]):
+    cache_clauses = True
+
     def _combine(self, query: "query.Query", returns: Mapping[str, None]) -> None:
         # TODO: Contextual validations:
         # - Must have certain conditions (project, timestamp, organization etc.)
@@ -244,18 +488,15 @@ class Validator(QueryVisitor[None]):
         if query.select is None or len(query.select) == 0:
             raise InvalidQuery("query must have at least one column in select")
 
+        # Expressions hash on their fingerprint, so the membership checks
+        # below are set lookups rather than scans of the other clause.
+        select = set(query.select)
+
         # - limit by must be a field in select
-        if query.limitby is not None:
-            found = False
-            for s in query.select:
-                if s == query.limitby.column:
-                    found = True
-                    break
-
-            if not found:
-                raise InvalidQuery(
-                    f"{query.limitby.column} in limitby clause is missing from select clause"
-                )
+        if query.limitby is not None and query.limitby.column not in select:
+            raise InvalidQuery(
+                f"{query.limitby.column} in limitby clause is missing from select clause"
+            )
 
         # Top level functions in the select clause must have an alias
         non_aggregates = []
@@ -279,8 +520,9 @@ class Validator(QueryVisitor[None]):
                     "groupby must be included if there are aggregations in the select"
                 )
 
+            groupby = set(query.groupby)
             for group_exp in non_aggregates:
-                if group_exp not in query.groupby:
+                if group_exp not in groupby:
                     raise InvalidQuery(f"{group_exp} missing from the groupby")
 
         if query.totals and not query.groupby:
@@ -289,53 +531,77 @@ class Validator(QueryVisitor[None]):
     def _visit_dataset(self, dataset: str) -> None:
         pass
 
-    def _visit_match(self, match: Entity) -> None:
-        match.validate()
-
-    def __list_validate(self, values: Optional[Sequence[Expression]]) -> None:
+    # The expressions are validated when they are created, so only the ones
+    # built with deferred validation are validated here. The type of each
+    # clause is still checked, since a query can be created with any values.
+    def __validate(
+        self, clause: str, value: Any, types: Tuple[Type[Expression], ...]
+    ) -> None:
+        if not isinstance(value, types):
+            names = " or ".join(t.__name__ for t in types)
+            raise InvalidQuery(f"{clause} clause must be a {names}, not {value!r}")
+        validate_tree(value)
+
+    def __list_validate(
+        self,
+        clause: str,
+        values: Optional[Sequence[Any]],
+        types: Tuple[Type[Expression], ...],
+    ) -> None:
         if values is not None:
+            if not isinstance(values, Sequence) or isinstance(values, str):
+                raise InvalidQuery(
+                    f"{clause} clause must be a sequence, not {values!r}"
+                )
             for v in values:
-                v.validate()
+                self.__validate(clause, v, types)
+
+    def _visit_match(self, match: Entity) -> None:
+        self.__validate("match", match, (Entity,))
 
     def _visit_select(
         self, select: Optional[Sequence[Union[Column, CurriedFunction, Function]]]
     ) -> None:
-        self.__list_validate(select)
+        self.__list_validate("select", select, (Column, CurriedFunction, Function))
 
     def _visit_groupby(
         self, groupby: Optional[Sequence[Union[Column, CurriedFunction, Function]]]
     ) -> None:
-        self.__list_validate(groupby)
+        self.__list_validate("groupby", groupby, (Column, CurriedFunction, Function))
 
     def _visit_where(self, where: Optional[Sequence[Condition]]) -> None:
-        self.__list_validate(where)
+        self.__list_validate("where", where, (Condition,))
 
     def _visit_having(self, having: Optional[Sequence[Condition]]) -> None:
-        self.__list_validate(having)
+        self.__list_validate("having", having, (Condition,))
 
     def _visit_orderby(self, orderby: Optional[Sequence[OrderBy]]) -> None:
-        self.__list_validate(orderby)
+        self.__list_validate("orderby", orderby, (OrderBy,))
 
     def _visit_limitby(self, limitby: Optional[LimitBy]) -> None:
-        limitby.validate() if limitby is not None else None
+        if limitby is not None:
+            self.__validate("limitby", limitby, (LimitBy,))
 
     def _visit_limit(self, limit: Optional[Limit]) -> None:
-        limit.validate() if limit is not None else None
+        if limit is not None:
+            self.__validate("limit", limit, (Limit,))
 
     def _visit_offset(self, offset: Optional[Offset]) -> None:
-        offset.validate() if offset is not None else None
+        if offset is not None:
+            self.__validate("offset", offset, (Offset,))
 
     def _visit_granularity(self, granularity: Optional[Granularity]) -> None:
-        granularity.validate() if granularity is not None else None
+        if granularity is not None:
+            self.__validate("granularity", granularity, (Granularity,))
 
     def _visit_totals(self, totals: Totals) -> None:
-        totals.validate()
+        self.__validate("totals", totals, (Totals,))
 
     def _visit_consistent(self, consistent: Consistent) -> None:
-        consistent.validate()
+        self.__validate("consistent", consistent, (Consistent,))
 
     def _visit_turbo(self, turbo: Turbo) -> None:
-        turbo.validate()
+        self.__validate("turbo", turbo, (Turbo,))
 
     def _visit_debug(self, debug: Debug) -> None:
-        debug.validate()
+        self.__validate("debug", debug, (Debug,))
@@ -1,5 +1,18 @@
+import collections.abc
 import numbers
-from typing import Any, List, Optional
+from functools import lru_cache
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 # This is supposed to enumerate the functions snuba supports (with their
 # validator) so we can keep control of the functions snuba
@@ -8,103 +21,322 @@ from typing import Any, List, Optional
 # At this point it is just listing some of them used during query
 # processing, so we can keep the list in one place only.
 
+
+if TYPE_CHECKING:
+    _FunctionInfoFields = Tuple[str, bool, bool, int, Optional[int], Tuple[str, ...]]
+else:
+    _FunctionInfoFields = tuple
+
+
+class FunctionInfo(_FunctionInfoFields):
+    """
+    What is known about a function supported by Snuba.
+
+    :param name: The full name of the function, including any combinators.
+    :type name: str
+    :param aggregate: Whether this is an aggregate function.
+    :type aggregate: bool
+    :param parametric: Whether the function takes parameters before its
+        arguments, e.g. ``quantile(0.5)(duration)``.
+    :type parametric: bool
+    :param min_args: The minimum number of arguments.
+    :type min_args: int
+    :param max_args: The maximum number of arguments, or None if unbounded.
+    :type max_args: Optional[int]
+    :param combinators: The combinator suffixes applied to the base function,
+        in the order they are applied, e.g. ``("If", "Merge")`` for
+        ``countIfMerge``.
+    :type combinators: Tuple[str, ...]
+
+    """
+
+    # A tuple subclass written out rather than a NamedTuple, which generates
+    # its methods when the module is imported. The typing constructs in this
+    # module are only evaluated by type checkers, for the same reason.
+    __slots__ = ()
+
+    def __new__(
+        cls,
+        name: str,
+        aggregate: bool,
+        parametric: bool = False,
+        min_args: int = 1,
+        max_args: Optional[int] = 1,
+        combinators: Tuple[str, ...] = (),
+    ) -> "FunctionInfo":
+        return tuple.__new__(
+            cls, (name, aggregate, parametric, min_args, max_args, combinators)
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"FunctionInfo(name={self[0]!r}, aggregate={self[1]!r}, "
+            f"parametric={self[2]!r}, min_args={self[3]!r}, "
+            f"max_args={self[4]!r}, combinators={self[5]!r})"
+        )
+
+    @property
+    def name(self) -> str:
+        return self[0]
+
+    @property
+    def aggregate(self) -> bool:
+        return self[1]
+
+    @property
+    def parametric(self) -> bool:
+        return self[2]
+
+    @property
+    def min_args(self) -> int:
+        return self[3]
+
+    @property
+    def max_args(self) -> Optional[int]:
+        return self[4]
+
+    @property
+    def combinators(self) -> Tuple[str, ...]:
+        return self[5]
+
+
+# The minimum and maximum number of arguments (None if unbounded), and whether
+# the function is parametric. The FunctionInfo is only built when the function
+# is looked up, which keeps the import of this module cheap.
+if TYPE_CHECKING:
+    _Signature = Tuple[int, Optional[int], bool]
+
+_VARIADIC = None
+_ONE_ARG: "_Signature" = (1, 1, False)
+_TWO_ARGS: "_Signature" = (2, 2, False)
+_PARAMETRIC_ONE_ARG: "_Signature" = (1, 1, True)
+_PARAMETRIC_TWO_ARGS: "_Signature" = (2, 2, True)
+
 # Please keep them sorted alphabetically in two groups:
 # Standard and Snuba specific.
-_AGGREGATION_FUNCTIONS_BASE = {
+_AGGREGATE_FUNCTIONS: "Dict[str, _Signature]" = {
     # Base
-    "count",
-    "min",
-    "max",
-    "sum",
-    "avg",
-    "any",
-    "stddevPop",
-    "stddevSamp",
-    "varPop",
-    "varSamp",
-    "covarPop",
-    "covarSamp",
+    "count": (0, 1, False),
+    "min": _ONE_ARG,
+    "max": _ONE_ARG,
+    "sum": _ONE_ARG,
+    "avg": _ONE_ARG,
+    "any": _ONE_ARG,
+    "stddevPop": _ONE_ARG,
+    "stddevSamp": _ONE_ARG,
+    "varPop": _ONE_ARG,
+    "varSamp": _ONE_ARG,
+    "covarPop": _TWO_ARGS,
+    "covarSamp": _TWO_ARGS,
     # Snuba Specific
-    "anyHeavy",
-    "anyLast",
-    "argMin",
-    "argMax",
-    "avgWeighted",
-    "topK",
-    "topKWeighted",
-    "groupArray",
-    "groupUniqArray",
-    "groupArrayInsertAt",
-    "groupArrayMovingAvg",
-    "groupArrayMovingSum",
-    "groupBitAnd",
-    "groupBitOr",
-    "groupBitXor",
-    "groupBitmap",
-    "groupBitmapAnd",
-    "groupBitmapOr",
-    "groupBitmapXor",
-    "sumWithOverflow",
-    "sumMap",
-    "minMap",
-    "maxMap",
-    "skewSamp",
-    "skewPop",
-    "kurtSamp",
-    "kurtPop",
-    "uniq",
-    "uniqExact",
-    "uniqCombined",
-    "uniqCombined64",
-    "uniqHLL12",
-    "quantile",
-    "quantiles",
-    "quantileExact",
-    "quantileExactLow",
-    "quantileExactHigh",
-    "quantileExactWeighted",
-    "quantileTiming",
-    "quantileTimingWeighted",
-    "quantileDeterministic",
-    "quantileTDigest",
-    "quantileTDigestWeighted",
-    "simpleLinearRegression",
-    "stochasticLinearRegression",
-    "stochasticLogisticRegression",
-    "categoricalInformationValue",
+    "anyHeavy": _ONE_ARG,
+    "anyLast": _ONE_ARG,
+    "argMin": _TWO_ARGS,
+    "argMax": _TWO_ARGS,
+    "avgWeighted": _TWO_ARGS,
+    "topK": _PARAMETRIC_ONE_ARG,
+    "topKWeighted": _PARAMETRIC_TWO_ARGS,
+    "groupArray": _PARAMETRIC_ONE_ARG,
+    "groupUniqArray": _PARAMETRIC_ONE_ARG,
+    "groupArrayInsertAt": _PARAMETRIC_TWO_ARGS,
+    "groupArrayMovingAvg": _PARAMETRIC_ONE_ARG,
+    "groupArrayMovingSum": _PARAMETRIC_ONE_ARG,
+    "groupBitAnd": _ONE_ARG,
+    "groupBitOr": _ONE_ARG,
+    "groupBitXor": _ONE_ARG,
+    "groupBitmap": _ONE_ARG,
+    "groupBitmapAnd": _ONE_ARG,
+    "groupBitmapOr": _ONE_ARG,
+    "groupBitmapXor": _ONE_ARG,
+    "sumWithOverflow": _ONE_ARG,
+    "sumMap": (2, _VARIADIC, False),
+    "minMap": (2, _VARIADIC, False),
+    "maxMap": (2, _VARIADIC, False),
+    "skewSamp": _ONE_ARG,
+    "skewPop": _ONE_ARG,
+    "kurtSamp": _ONE_ARG,
+    "kurtPop": _ONE_ARG,
+    "uniq": (1, _VARIADIC, False),
+    "uniqExact": (1, _VARIADIC, False),
+    "uniqCombined": (1, _VARIADIC, True),
+    "uniqCombined64": (1, _VARIADIC, True),
+    "uniqHLL12": (1, _VARIADIC, False),
+    "quantile": _PARAMETRIC_ONE_ARG,
+    "quantiles": _PARAMETRIC_ONE_ARG,
+    "quantileExact": _PARAMETRIC_ONE_ARG,
+    "quantileExactLow": _PARAMETRIC_ONE_ARG,
+    "quantileExactHigh": _PARAMETRIC_ONE_ARG,
+    "quantileExactWeighted": _PARAMETRIC_TWO_ARGS,
+    "quantileTiming": _PARAMETRIC_ONE_ARG,
+    "quantileTimingWeighted": _PARAMETRIC_TWO_ARGS,
+    "quantileDeterministic": _PARAMETRIC_TWO_ARGS,
+    "quantileTDigest": _PARAMETRIC_ONE_ARG,
+    "quantileTDigestWeighted": _PARAMETRIC_TWO_ARGS,
+    "simpleLinearRegression": _TWO_ARGS,
+    "stochasticLinearRegression": (2, _VARIADIC, True),
+    "stochasticLogisticRegression": (2, _VARIADIC, True),
+    "categoricalInformationValue": (2, _VARIADIC, False),
     # Parametric
-    "histogram",
-    "sequenceMatch",
-    "sequenceCount",
-    "windowFunnel",
-    "retention",
-    "uniqUpTo",
-    "sumMapFiltered",
+    "histogram": _PARAMETRIC_ONE_ARG,
+    "sequenceMatch": (2, 33, True),
+    "sequenceCount": (2, 33, True),
+    "windowFunnel": (2, 33, True),
+    "retention": (1, 32, False),
+    "uniqUpTo": _PARAMETRIC_ONE_ARG,
+    "sumMapFiltered": _PARAMETRIC_TWO_ARGS,
 }
 
-_AGGREGATION_SUFFIXES = {
-    "",
-    "If",
-    "Array",
-    "SampleState",
-    "State",
-    "Merge",
-    "MergeState",
-    "ForEach",
-    "OrDefault",
-    "OrNull",
-    "Resample",
+# How each combinator changes the signature of the function it is applied to:
+# the number of arguments it adds (e.g. the condition of -If), the arguments
+# that replace those of the function (e.g. -Merge takes a single state), and
+# whether it makes the function parametric.
+_COMBINATORS: "Dict[str, Tuple[int, Optional[Tuple[int, int]], bool]]" = {
+    "If": (1, None, False),
+    "Array": (0, None, False),
+    "Distinct": (0, None, False),
+    "ForEach": (0, None, False),
+    "Merge": (0, (1, 1), False),
+    "MergeState": (0, (1, 1), False),
+    "OrDefault": (0, None, False),
+    "OrNull": (0, None, False),
+    "Resample": (1, None, True),
+    "SampleState": (0, None, False),
+    "SimpleState": (0, None, False),
+    "State": (0, None, False),
 }
 
-AGGREGATION_FUNCTIONS = {
-    f"{f_name}{suffix}"
-    for f_name in _AGGREGATION_FUNCTIONS_BASE
-    for suffix in _AGGREGATION_SUFFIXES
-}
+
+class _SuffixTrie:
+    """
+    A trie of the reversed words, used to find all the words that are a suffix
+    of a string in a single pass over the end of the string.
+    """
+
+    def __init__(self, words: Iterable[str]) -> None:
+        self.root: Dict[str, Any] = {}
+        for word in words:
+            node = self.root
+            for char in reversed(word):
+                node = node.setdefault(char, {})
+            node[""] = word
+
+    def suffixes_of(self, value: str) -> List[str]:
+        """
+        The words that are a suffix of value, longest first.
+        """
+        found = []
+        node = self.root
+        for char in reversed(value):
+            child: Optional[Dict[str, Any]] = node.get(char)
+            if child is None:
+                break
+            node = child
+            if "" in node:
+                found.append(node[""])
+        found.reverse()
+        return found
+
+
+@lru_cache(maxsize=1)
+def _combinator_suffixes() -> _SuffixTrie:
+    return _SuffixTrie(_COMBINATORS)
+
+
+def _apply_combinator(info: FunctionInfo, suffix: str) -> FunctionInfo:
+    extra_args, args, parametric = _COMBINATORS[suffix]
+    min_args, max_args = args or (info.min_args, info.max_args)
+    return FunctionInfo(
+        name=f"{info.name}{suffix}",
+        aggregate=info.aggregate,
+        parametric=info.parametric or parametric,
+        min_args=min_args + extra_args,
+        max_args=None if max_args is None else max_args + extra_args,
+        combinators=info.combinators + (suffix,),
+    )
+
+
+FUNCTION_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=FUNCTION_CACHE_SIZE)
+def function_info(func_name: str) -> Optional[FunctionInfo]:
+    """
+    Look up a function in the catalog. Aggregate functions can have any chain
+    of combinators, e.g. ``uniqStateIf`` or ``countIfMerge``: the combinators
+    are stripped from the end of the name until a known function is found.
+
+    :param func_name: The name of the function.
+    :type func_name: str
+
+    :returns: The metadata of the function, or None if it isn't known.
+
+    """
+    signature = _AGGREGATE_FUNCTIONS.get(func_name)
+    if signature is not None:
+        min_args, max_args, parametric = signature
+        return FunctionInfo(func_name, True, parametric, min_args, max_args)
+
+    for suffix in _combinator_suffixes().suffixes_of(func_name):
+        inner = function_info(func_name[: -len(suffix)])
+        if inner is not None and inner.aggregate:
+            return _apply_combinator(inner, suffix)
+
+    return None
 
 
 def is_aggregation_function(func_name: str) -> bool:
-    return func_name in AGGREGATION_FUNCTIONS
+    info = function_info(func_name)
+    return info is not None and info.aggregate
+
+
+if TYPE_CHECKING:
+    _StringSet = AbstractSet[str]
+else:
+    _StringSet = collections.abc.Set
+
+
+class _AggregationFunctions(_StringSet):
+    """
+    The names of the aggregate functions, with at most one combinator. The
+    names are only listed the first time the set is used, so the import of
+    this module doesn't pay for them.
+    """
+
+    __slots__ = ("_names",)
+
+    def __init__(self) -> None:
+        self._names: Optional[FrozenSet[str]] = None
+
+    @property
+    def names(self) -> FrozenSet[str]:
+        if self._names is None:
+            self._names = frozenset(
+                f"{f_name}{suffix}"
+                for f_name in _AGGREGATE_FUNCTIONS
+                for suffix in ("", *_COMBINATORS)
+            )
+        return self._names
+
+    def __contains__(self, value: object) -> bool:
+        return value in self.names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __repr__(self) -> str:
+        return f"AGGREGATION_FUNCTIONS({set(self.names)!r})"
+
+
+# Kept for the code that used the set before the catalog was added. Use
+# function_info or is_aggregation_function instead, which also recognize
+# chains of combinators.
+AGGREGATION_FUNCTIONS: "AbstractSet[str]" = _AggregationFunctions()
+
+
+_NUMERIC_TYPES = frozenset({int, float})
 
 
 def check_array_type(pot_array: List[Any]) -> bool:
@@ -113,6 +345,15 @@ def check_array_type(pot_array: List[Any]) -> bool:
     - An array must contain all the same data type, or NULL
     - An array can nest arrays, but those arrays must all hold the same data type
     """
+    # Fast path for flat arrays, e.g. large IN lists: if every element has the
+    # same type (ignoring NULLs and treating ints and floats as the same type)
+    # the array is valid, and there is no need to look at each element.
+    types = set(map(type, pot_array))
+    types.discard(type(None))
+    if types <= _NUMERIC_TYPES:
+        return True
+    elif len(types) == 1 and not issubclass(next(iter(types)), list):
+        return True
 
     def find_base(value: Any) -> Optional[str]:
         if value is None:
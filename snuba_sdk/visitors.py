@@ -1,7 +1,19 @@
-import re
 from abc import ABC, abstractmethod
 from datetime import date, datetime
-from typing import Generic, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from snuba_sdk.entity import Entity
 from snuba_sdk.conditions import Condition
@@ -11,24 +23,27 @@ from snuba_sdk.expressions import (
     CurriedFunction,
     Debug,
     Expression,
-    Function,
     Granularity,
     InvalidExpression,
+    is_array_array,
+    is_literal,
+    is_numeric_array,
     is_scalar,
+    LazyPattern,
     Limit,
     LimitBy,
     Offset,
     OrderBy,
-    Scalar,
+    Param,
+    ScalarLiteralType,
     ScalarType,
     Totals,
     Turbo,
 )
 
-
 # validation regexes
-unescaped_quotes = re.compile(r"(?<!\\)'")
-unescaped_newline = re.compile(r"(?<!\\)\n")
+unescaped_quotes = LazyPattern(r"(?<!\\)'")
+unescaped_newline = LazyPattern(r"(?<!\\)\n")
 
 
 def _stringify_scalar(value: ScalarType) -> str:
@@ -58,48 +73,141 @@ def _stringify_scalar(value: ScalarType) -> str:
     elif isinstance(value, date):
         return f"toDateTime('{value.isoformat()}')"
     elif isinstance(value, list):
-        is_scalar(value)  # Throws on an invalid array
-        return f"array({', '.join([_stringify_scalar(v) for v in value])})"
+        joined = _join_homogeneous(value)
+        if joined is None:
+            is_scalar(value)  # Throws on an invalid array
+            joined = ", ".join([_stringify_scalar(v) for v in value])
+        return f"array({joined})"
     elif isinstance(value, tuple):
-        is_scalar(value)  # Throws on an invalid tuple
-        return f"tuple({', '.join([_stringify_scalar(v) for v in value])})"
+        joined = _join_homogeneous(value)
+        if joined is None:
+            is_scalar(value)  # Throws on an invalid tuple
+            joined = ", ".join([_stringify_scalar(v) for v in value])
+        return f"tuple({joined})"
+    elif is_numeric_array(value):
+        # array.array yields Python numbers directly. For NumPy, converting the
+        # whole array at once is much faster than stringifying its scalars one
+        # by one.
+        elements = value if is_array_array(value) else value.tolist()  # type: ignore
+        return f"array({', '.join(map(str, elements))})"
 
     raise InvalidExpression(f"'{value}' is not a valid scalar")
 
 
+_NUMERIC_TYPES = frozenset({int, float})
+
+
+def _join_homogeneous(values: Sequence[Any]) -> Optional[str]:
+    """
+    Stringify a sequence that holds only numbers or only strings in one pass,
+    which is much faster than stringifying each element on its own. Returns
+    None if the sequence holds anything else, or strings that need escaping.
+    """
+    types = set(map(type, values))
+    if types <= _NUMERIC_TYPES:
+        return ", ".join(map(str, values))
+    elif types == {str}:
+        concatenated = "".join(values)
+        if "'" not in concatenated and "\n" not in concatenated:
+            return "'" + "', '".join(values) + "'"
+
+    return None
+
+
 TVisited = TypeVar("TVisited")
 
 
+# A handler is either the name of a method on the visitor, or a function that
+# takes the visitor and the node.
+Handler = Union[str, Callable[[Any, Any], Any]]
+
+
 class ExpressionVisitor(ABC, Generic[TVisited]):
+    """
+    Visits an Expression by dispatching on the type of the node. Handlers are
+    looked up by the exact type of the node and cached, falling back to the
+    handlers registered for its base classes. Visitors that support new types
+    of node can register handlers for them with :meth:`register` or by
+    defining their own ``_handlers`` mapping.
+    """
+
+    _handlers: Mapping[Type[Any], Handler] = {
+        Column: "_visit_column",
+        CurriedFunction: "_visit_curried_function",
+        Entity: "_visit_entity",
+        Condition: "_visit_condition",
+        OrderBy: "_visit_orderby",
+        Limit: lambda v, node: v._visit_int_literal(node.limit),
+        Offset: lambda v, node: v._visit_int_literal(node.offset),
+        LimitBy: "_visit_limitby",
+        Granularity: lambda v, node: v._visit_int_literal(node.granularity),
+        Totals: "_visit_totals",
+        Consistent: "_visit_consistent",
+        Turbo: "_visit_turbo",
+        Debug: "_visit_debug",
+        Param: "_visit_param",
+    }
+    _dispatch: Dict[Type[Any], Callable[[Any, Any], Any]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if "_handlers" not in cls.__dict__:
+            cls._handlers = {}
+        cls._dispatch = {}
+
+    @classmethod
+    def register(cls, node_type: Type[Any], handler: Handler) -> None:
+        """
+        Register a handler for a type of node on this visitor and its subclasses.
+
+        :param node_type: The class of the node. Subclasses of it are handled too,
+            unless they have a handler of their own.
+        :type node_type: Type[Any]
+        :param handler: The name of the method to call with the node, or a function
+            that takes the visitor and the node.
+        :type handler: Union[str, Callable[[Any, Any], Any]]
+
+        """
+        if "_handlers" not in cls.__dict__:
+            cls._handlers = {}
+        handlers = dict(cls._handlers)
+        handlers[node_type] = handler
+        cls._handlers = handlers
+        cls._clear_dispatch()
+
+    @classmethod
+    def _clear_dispatch(cls) -> None:
+        cls._dispatch.clear()
+        for subclass in cls.__subclasses__():
+            subclass._clear_dispatch()
+
+    @classmethod
+    def _resolve(cls, node_type: Type[Any]) -> Callable[[Any, Any], Any]:
+        for base in node_type.__mro__:
+            for visitor in cls.__mro__:
+                handler = visitor.__dict__.get("_handlers", {}).get(base)
+                if handler is None:
+                    continue
+
+                resolved: Callable[[Any, Any], Any] = (
+                    getattr(cls, handler) if isinstance(handler, str) else handler
+                )
+                cls._dispatch[node_type] = resolved
+                return resolved
+
+        raise KeyError(node_type)
+
     def visit(self, node: Expression) -> TVisited:
-        if isinstance(node, Column):
-            return self._visit_column(node)
-        elif isinstance(node, (CurriedFunction, Function)):
-            return self._visit_curried_function(node)
-        elif isinstance(node, Entity):
-            return self._visit_entity(node)
-        elif isinstance(node, Condition):
-            return self._visit_condition(node)
-        elif isinstance(node, OrderBy):
-            return self._visit_orderby(node)
-        elif isinstance(node, Limit):
-            return self._visit_int_literal(node.limit)
-        elif isinstance(node, Offset):
-            return self._visit_int_literal(node.offset)
-        elif isinstance(node, LimitBy):
-            return self._visit_limitby(node)
-        elif isinstance(node, Granularity):
-            return self._visit_int_literal(node.granularity)
-        elif isinstance(node, Totals):
-            return self._visit_totals(node)
-        elif isinstance(node, Consistent):
-            return self._visit_consistent(node)
-        elif isinstance(node, Turbo):
-            return self._visit_turbo(node)
-        elif isinstance(node, Debug):
-            return self._visit_debug(node)
-
-        assert False, f"Unhandled Expression: {node}"
+        try:
+            handler = self._dispatch[type(node)]
+        except KeyError:
+            try:
+                handler = self._resolve(type(node))
+            except KeyError:
+                assert False, f"Unhandled Expression: {node}"
+
+        result: TVisited = handler(self, node)
+        return result
 
     @abstractmethod
     def _visit_column(self, column: Column) -> TVisited:
@@ -110,7 +218,7 @@ class ExpressionVisitor(ABC, Generic[TVisited]):
         raise NotImplementedError
 
     @abstractmethod
-    def _visit_int_literal(self, literal: int) -> TVisited:
+    def _visit_int_literal(self, literal: Union[int, Param]) -> TVisited:
         raise NotImplementedError
 
     @abstractmethod
@@ -145,6 +253,13 @@ class ExpressionVisitor(ABC, Generic[TVisited]):
     def _visit_debug(self, debug: Debug) -> TVisited:
         raise NotImplementedError
 
+    @abstractmethod
+    def _visit_param(self, param: Param) -> TVisited:
+        raise NotImplementedError
+
+
+_EXPRESSION_TYPES = (Column, CurriedFunction, Param)
+
 
 class Translation(ExpressionVisitor[str]):
     def _visit_column(self, column: Column) -> str:
@@ -154,29 +269,37 @@ class Translation(ExpressionVisitor[str]):
         alias = "" if func.alias is None else f" AS {func.alias}"
         initialize_clause = ""
         if func.initializers is not None:
-            initializers = []
-            for initer in func.initializers:
-                if isinstance(initer, Column):
-                    initializers.append(self.visit(initer))
-                elif isinstance(initer, tuple(Scalar)):
-                    initializers.append(_stringify_scalar(initer))
-
+            initializers = [
+                self._visit_initializer(func, initer) for initer in func.initializers
+            ]
             initialize_clause = f"({', '.join(initializers)})"
 
         param_clause = ""
         if func.parameters is not None:
-            params = []
-            for param in func.parameters:
-                if isinstance(param, (Column, CurriedFunction, Function)):
-                    params.append(self.visit(param))
-                elif is_scalar(param):
-                    params.append(_stringify_scalar(param))
-
+            # The parameters were checked when the function was validated, so
+            # anything that isn't an expression must be a scalar.
+            params = [
+                (
+                    self.visit(param)
+                    if isinstance(param, _EXPRESSION_TYPES)
+                    else _stringify_scalar(param)
+                )
+                for param in func.parameters
+            ]
             param_clause = f"({', '.join(params)})"
 
         return f"{func.function}{initialize_clause}{param_clause}{alias}"
 
-    def _visit_int_literal(self, literal: int) -> str:
+    def _visit_initializer(
+        self, func: CurriedFunction, initer: Union[ScalarLiteralType, Column, Param]
+    ) -> str:
+        if isinstance(initer, (Column, Param)):
+            return self.visit(initer)
+        return _stringify_scalar(initer)
+
+    def _visit_int_literal(self, literal: Union[int, Param]) -> str:
+        if isinstance(literal, Param):
+            return self.visit(literal)
         return f"{literal:d}"
 
     def _visit_entity(self, entity: Entity) -> str:
@@ -189,15 +312,13 @@ class Translation(ExpressionVisitor[str]):
         return f"({entity.name}{sample_clause})"
 
     def _visit_condition(self, cond: Condition) -> str:
-        rhs = None
         if cond.is_unary():
             rhs = ""
-        elif isinstance(cond.rhs, (Column, CurriedFunction, Function)):
+        elif isinstance(cond.rhs, _EXPRESSION_TYPES):
             rhs = f" {self.visit(cond.rhs)}"
-        elif is_scalar(cond.rhs):
+        else:
             rhs = f" {_stringify_scalar(cond.rhs)}"
 
-        assert rhs is not None
         return f"{self.visit(cond.lhs)} {cond.op.value}{rhs}"
 
     def _visit_orderby(self, orderby: OrderBy) -> str:
@@ -217,3 +338,72 @@ class Translation(ExpressionVisitor[str]):
 
     def _visit_debug(self, debug: Debug) -> str:
         return str(debug)
+
+    def _visit_param(self, param: Param) -> str:
+        raise InvalidExpression(
+            f"parameter '{param.name}' must be bound to a value before the query can be serialized"
+        )
+
+
+# Renders the value bound to a parameter, raising if the value is not valid
+Renderer = Callable[[Any], str]
+
+
+def _int_literal_renderer(
+    node_type: Type[Union[Limit, Offset, Granularity]],
+) -> Renderer:
+    def render(value: Any) -> str:
+        node_type(value)  # Validates the value the same way as the node does
+        return f"{value:d}"
+
+    return render
+
+
+def _initializer_renderer(function: str) -> Renderer:
+    def render(value: Any) -> str:
+        # Initializers are literals, a sequence is not valid in their place
+        if not is_literal(value):
+            raise InvalidExpression(
+                f"initializers to function {function} must be a scalar or column"
+            )
+        return _stringify_scalar(value)
+
+    return render
+
+
+class TemplateTranslation(Translation):
+    """
+    Translates expressions that contain Params into a template. Each Param is
+    replaced by a NUL delimited index into ``slots``, which records the name of
+    the Param and how a value bound to it must be rendered.
+    """
+
+    _handlers = {
+        Limit: lambda v, node: v._visit_int_param(node, node.limit),
+        Offset: lambda v, node: v._visit_int_param(node, node.offset),
+        Granularity: lambda v, node: v._visit_int_param(node, node.granularity),
+    }
+
+    def __init__(self) -> None:
+        self.slots: List[Tuple[str, Renderer]] = []
+
+    def _slot(self, name: str, render: Renderer) -> str:
+        self.slots.append((name, render))
+        return f"\x00{len(self.slots) - 1}\x00"
+
+    def _visit_int_param(
+        self, node: Union[Limit, Offset, Granularity], literal: Union[int, Param]
+    ) -> str:
+        if isinstance(literal, Param):
+            return self._slot(literal.name, _int_literal_renderer(type(node)))
+        return self._visit_int_literal(literal)
+
+    def _visit_initializer(
+        self, func: CurriedFunction, initer: Union[ScalarLiteralType, Column, Param]
+    ) -> str:
+        if isinstance(initer, Param):
+            return self._slot(initer.name, _initializer_renderer(func.function))
+        return super()._visit_initializer(func, initer)
+
+    def _visit_param(self, param: Param) -> str:
+        return self._slot(param.name, _stringify_scalar)
@@ -0,0 +1,45 @@
+import pytest
+from typing import Dict, List
+
+from benchmarks.harness import (
+    Benchmark,
+    Result,
+    find_regressions,
+    load_benchmarks,
+    measure,
+)
+
+
+def smoke_benchmarks() -> List[Benchmark]:
+    # The first benchmark of each phase that isn't slow, which is the small
+    # case for the phases that run on every query of the corpus.
+    picked: Dict[str, Benchmark] = {}
+    for bench in load_benchmarks():
+        if not bench.slow:
+            picked.setdefault(bench.phase, bench)
+    return list(picked.values())
+
+
+@pytest.mark.parametrize("bench", smoke_benchmarks(), ids=lambda b: b.name)
+def test_benchmarks_run(bench: Benchmark) -> None:
+    result = measure(bench, min_time=0)
+    assert result.runs == 1
+    assert result.peak_memory >= 0
+
+
+def test_find_regressions() -> None:
+    baseline = {
+        "printing:small": {"per_second": 1000.0, "peak_memory": 1000},
+        "printing:typical": {"per_second": 1000.0, "peak_memory": 1000},
+    }
+    results = [
+        Result("printing:small", "printing", 800, 1.0, 1200),
+        Result("printing:typical", "printing", 700, 1.0, 1300),
+        Result("printing:new", "printing", 1, 1.0, 1),
+    ]
+
+    assert find_regressions(results, baseline, 0.5) == []
+    assert find_regressions(results, baseline, 0.25) == [
+        "printing:typical: 700.0/s is below 750.0/s",
+        "printing:typical: peak memory 1,300B is above 1,250B",
+    ]
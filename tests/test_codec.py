@@ -0,0 +1,258 @@
+import json
+import pickle
+import pytest
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Any, Optional
+
+from benchmarks.corpus import QUERIES
+from snuba_sdk.codec import (
+    decode,
+    encode,
+    from_dict,
+    InvalidPayload,
+    MAGIC,
+    to_dict,
+)
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    CurriedFunction,
+    Direction,
+    Function,
+    InvalidExpression,
+    LimitBy,
+    OrderBy,
+    Param,
+    Totals,
+)
+from snuba_sdk.query import Query
+from snuba_sdk.query_visitors import InvalidQuery
+
+
+@pytest.mark.parametrize("name", QUERIES)
+@pytest.mark.parametrize("trusted", [False, True])
+def test_query_round_trip(name: str, trusted: bool) -> None:
+    query = QUERIES[name]()
+    decoded = decode(encode(query), trusted=trusted)
+    assert isinstance(decoded, Query)
+    assert decoded.snuba() == query.snuba()
+
+
+now = datetime(2021, 1, 2, 3, 4, 5, 6)
+value_tests = [
+    pytest.param(Column("tags[release]"), id="column"),
+    pytest.param(
+        CurriedFunction("quantile", [0.5], [Column("duration")], "p50"),
+        id="curried function",
+    ),
+    pytest.param(
+        Function("plus", [-1, 2**40, -(2**70), 1.5, None, True], "total"),
+        id="scalars",
+    ),
+    pytest.param(Condition(Column("timestamp"), Op.GT, now), id="datetime"),
+    pytest.param(
+        Condition(Column("timestamp"), Op.GT, now.replace(tzinfo=timezone.utc)),
+        id="utc datetime",
+    ),
+    pytest.param(
+        Condition(
+            Column("timestamp"),
+            Op.GT,
+            now.replace(tzinfo=timezone(timedelta(hours=-5, minutes=-30))),
+        ),
+        id="offset datetime",
+    ),
+    pytest.param(Condition(Column("day"), Op.EQ, date(2021, 1, 2)), id="date"),
+    pytest.param(Condition(Column("data"), Op.EQ, b"\x00\xffdata"), id="bytes"),
+    pytest.param(
+        Condition(Column("project_id"), Op.IN, list(range(-5, 300))), id="int list"
+    ),
+    pytest.param(
+        Condition(Column("project_id"), Op.IN, tuple(range(0, 2**40, 2**36))),
+        id="int tuple",
+    ),
+    pytest.param(
+        Condition(Column("project_id"), Op.IN, (1, 2, 3, 4, 5, 6, 7, "8")),
+        id="mixed tuple",
+    ),
+    pytest.param(Condition(Column("project_id"), Op.IS_NULL), id="unary condition"),
+    pytest.param(Condition(Column("project_id"), Op.EQ, Param("p")), id="param"),
+    pytest.param(OrderBy(Column("title"), Direction.DESC), id="orderby"),
+    pytest.param(LimitBy(Column("title"), 5), id="limitby"),
+    pytest.param(Entity("events", 0.5), id="entity"),
+    pytest.param(Totals(True), id="flag"),
+    pytest.param(
+        Function("plus", [((1, "a"), [[1, None], [2]], (now.date(), [now]))]),  # type: ignore
+        id="nested arrays",
+    ),
+]
+
+
+@pytest.mark.parametrize("value", value_tests)
+@pytest.mark.parametrize("trusted", [False, True])
+def test_value_round_trip(value: Any, trusted: bool) -> None:
+    decoded = decode(encode(value), trusted=trusted)
+    assert type(decoded) is type(value)
+    assert decoded == value
+    assert repr(decoded) == repr(value)
+
+
+def test_strings_are_shared() -> None:
+    data = encode(Function("plus", [Column("duration")] * 100, "total_duration"))
+    assert data.count(b"duration") == 2
+
+
+class Zone(tzinfo):
+    def utcoffset(self, dt: Optional[datetime]) -> timedelta:
+        return timedelta(hours=1)
+
+    def tzname(self, dt: Optional[datetime]) -> str:
+        return "CET"
+
+    def dst(self, dt: Optional[datetime]) -> timedelta:
+        return timedelta(0)
+
+
+def test_pickled_values() -> None:
+    # Datetimes with a time zone that isn't a fixed offset are pickled
+    value = Condition(Column("timestamp"), Op.GT, now.replace(tzinfo=Zone()))
+    data = encode(value)
+    decoded = decode(data, trusted=True)
+    assert decoded.rhs.tzname() == "CET"
+    assert decoded == value
+
+    with pytest.raises(InvalidPayload, match="only be decoded if trusted"):
+        decode(data)
+
+
+def test_pickle_uses_codec() -> None:
+    query = QUERIES["typical"]()
+    data = pickle.dumps(query)
+    assert encode(query) in data
+    assert pickle.loads(data).snuba() == query.snuba()
+
+
+invalid_payload_tests = [
+    pytest.param(b"", id="empty"),
+    pytest.param(b"XYZ\x01\x00\x00", id="magic"),
+    pytest.param(MAGIC + b"\x02\x00\x00", id="version"),
+    pytest.param(MAGIC + b"\x01\x02\x03ab", id="truncated strings"),
+    pytest.param(MAGIC + b"\x01\x00", id="no value"),
+    pytest.param(MAGIC + b"\x01\x00\x00\x00", id="two values"),
+    pytest.param(MAGIC + b"\x01\x00\x0e\x00", id="missing fields"),
+    pytest.param(MAGIC + b"\x01\x00\x05\x03", id="string index"),
+    pytest.param(MAGIC + b"\x01\x00\xff", id="tag"),
+    pytest.param(MAGIC + b"\x01\x00\x11\x01N", id="pickle"),
+]
+
+
+@pytest.mark.parametrize("data", invalid_payload_tests)
+def test_invalid_payload(data: bytes) -> None:
+    with pytest.raises(InvalidPayload):
+        decode(data)
+
+
+def test_untrusted_payload_is_validated() -> None:
+    data = encode(Column("event_id")).replace(b"event_id", b"event-id")
+    assert decode(data, trusted=True).name == "event-id"
+    with pytest.raises(InvalidExpression, match="column 'event-id' is empty or"):
+        decode(data)
+
+
+@pytest.mark.parametrize("name", QUERIES)
+@pytest.mark.parametrize("trusted", [False, True])
+def test_query_dict_round_trip(name: str, trusted: bool) -> None:
+    query = QUERIES[name]()
+    converted = from_dict(json.loads(json.dumps(to_dict(query))), trusted=trusted)
+    assert converted == query
+    assert converted.snuba() == query.snuba()
+
+
+@pytest.mark.parametrize("value", value_tests)
+@pytest.mark.parametrize("trusted", [False, True])
+def test_value_dict_round_trip(value: Any, trusted: bool) -> None:
+    converted = from_dict(json.loads(json.dumps(to_dict(value))), trusted=trusted)
+    assert type(converted) is type(value)
+    assert converted == value
+    assert repr(converted) == repr(value)
+
+
+def test_to_dict() -> None:
+    assert to_dict(Condition(Column("tags[a]"), Op.IN, (1, now))) == {
+        "type": "Condition",
+        "lhs": {
+            "type": "Column",
+            "name": "tags[a]",
+            "subscriptable": "tags",
+            "key": "a",
+        },
+        "op": {"type": "Op", "value": "IN"},
+        "rhs": {
+            "type": "tuple",
+            "items": [
+                1,
+                {
+                    "type": "datetime",
+                    "value": "2021-01-02T03:04:05.000006",
+                    "offset": None,
+                },
+            ],
+        },
+    }
+
+    with pytest.raises(TypeError, match="only fixed UTC offsets"):
+        to_dict(Condition(Column("timestamp"), Op.GT, now.replace(tzinfo=Zone())))
+
+
+def test_from_dict_defaults() -> None:
+    query = from_dict(
+        {
+            "type": "Query",
+            "dataset": "discover",
+            "match": {"type": "Entity", "name": "events", "sample": None},
+            "select": [{"type": "Column", "name": "event_id"}],
+            "limit": {"type": "Limit", "limit": 10},
+        }
+    )
+    assert query.snuba() == QUERIES["small"]().set_where([]).snuba()
+
+
+column = {"type": "Column", "name": "event_id"}
+entity = {"type": "Entity", "name": "events", "sample": None}
+invalid_dict_tests = [
+    pytest.param([column], InvalidPayload, id="not a dict"),
+    pytest.param({"name": "event_id"}, InvalidPayload, id="no type"),
+    pytest.param({"type": "Table"}, InvalidPayload, id="unknown type"),
+    pytest.param({"type": "Column"}, InvalidPayload, id="missing field"),
+    pytest.param({**column, "name": {1}}, InvalidPayload, id="not json"),
+    pytest.param({"type": "Op", "value": "<>"}, InvalidPayload, id="enum"),
+    pytest.param(
+        {"type": "datetime", "value": "2021-01-02 03:04:05", "offset": None},
+        InvalidPayload,
+        id="datetime",
+    ),
+    pytest.param({"type": "bytes", "value": "!"}, InvalidPayload, id="bytes"),
+    pytest.param({**column, "name": "event-id"}, InvalidExpression, id="column"),
+    pytest.param(
+        {"type": "Query", "dataset": "discover", "match": entity, "select": column},
+        InvalidQuery,
+        id="select",
+    ),
+    pytest.param(
+        {"type": "Query", "dataset": "discover", "match": entity, "limit": 10},
+        InvalidQuery,
+        id="limit",
+    ),
+    pytest.param(
+        {"type": "Query", "dataset": "discover", "match": entity, "other": None},
+        InvalidPayload,
+        id="unknown clause",
+    ),
+]
+
+
+@pytest.mark.parametrize("data, exception", invalid_dict_tests)
+def test_invalid_dict(data: Any, exception: type) -> None:
+    with pytest.raises(exception):
+        from_dict(data)
@@ -1,19 +1,31 @@
+import copy
+import pickle
 import pytest
 import re
-from typing import Any, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
 
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
 from snuba_sdk.expressions import (
+    BooleanFlag,
     Column,
     Consistent,
+    CurriedFunction,
     Debug,
     Direction,
+    Expression,
     Function,
     Granularity,
+    interned,
     InvalidExpression,
     Limit,
     LimitBy,
+    NAME_CACHE_SIZE,
+    NamePattern,
     Offset,
     OrderBy,
+    set_name_cache_size,
     Totals,
     Turbo,
 )
@@ -144,3 +156,146 @@ def test_boolean_flags(name: str, flag: Any) -> None:
     assert flag(False) is not None
     with pytest.raises(InvalidExpression, match=re.escape(f"{name} must be a boolean")):
         flag(0)
+
+
+def test_interned_nodes() -> None:
+    column = interned(Column, "tags[release]")
+    assert column == Column("tags[release]")
+    assert column.subscriptable == "tags"
+    assert interned(Column, name="tags[release]") is column
+
+    function = interned(Function, "uniq", [interned(Column, "event_id")], "ua")
+    assert function is interned(Function, "uniq", [Column("event_id")], alias="ua")
+    assert function is not interned(Function, "uniq", [Column("event_id")])
+    assert function == Function("uniq", [Column("event_id")], "ua")
+
+    # Values that compare equal but are rendered differently are not shared
+    assert interned(Function, "plus", [1, 1]) is not interned(
+        Function, "plus", [1, 1.0]
+    )
+    assert interned(Function, "plus", [1, 1]) is not interned(
+        Function, "plus", [1, True]
+    )
+
+    with pytest.raises(InvalidExpression, match="column '' is empty"):
+        interned(Column, "")
+
+
+slotted_tests = [
+    pytest.param(Column("event_id"), id="column"),
+    pytest.param(Column("tags[release]"), id="subscriptable column"),
+    pytest.param(Function("plus", [Column("duration"), 1], "total"), id="function"),
+    pytest.param(
+        CurriedFunction("quantile", [0.5], [Column("duration")], "p50"),
+        id="curried function",
+    ),
+    pytest.param(Condition(Column("project_id"), Op.IN, (1, 2)), id="condition"),
+    pytest.param(OrderBy(Column("title"), Direction.DESC), id="orderby"),
+    pytest.param(LimitBy(Column("title"), 5), id="limitby"),
+    pytest.param(Entity("events", 0.5), id="entity"),
+    pytest.param(Totals(True), id="flag"),
+]
+
+
+@pytest.mark.parametrize("node", slotted_tests)
+def test_slotted_nodes(node: Any) -> None:
+    assert not hasattr(node, "__dict__")
+    for copied in (pickle.loads(pickle.dumps(node)), copy.copy(node)):
+        assert copied == node
+        assert repr(copied) == repr(node)
+
+    with pytest.raises(AttributeError):
+        node.other = 1
+
+
+def test_slotted_init_false_fields() -> None:
+    column = Column("tags[release]")
+    assert (column.subscriptable, column.key) == ("tags", "release")
+    assert (Column("event_id").subscriptable, Column("event_id").key) == (None, None)
+    assert Function("count", []).initializers is None
+
+
+@dataclass(frozen=True)
+class WeightedNode(Expression):
+    name: str
+    weight: int = 5
+    label: str = field(init=False, default="node")
+
+    def validate(self) -> None:
+        if self.weight < 0:
+            raise InvalidExpression("weight must not be negative")
+
+
+@dataclass(frozen=True)
+class WeightedColumn(Column):
+    weight: int = 5
+
+
+@dataclass(frozen=True)
+class NamedFlag(BooleanFlag):
+    name: str = "named"
+
+
+def test_subclass_defaults() -> None:
+    # Subclasses that are not decorated with slotted still get their defaults
+    assert (WeightedNode("a").weight, WeightedNode("a", 3).weight) == (5, 3)
+    assert WeightedNode("a").label == "node"
+    assert not hasattr(WeightedNode("a"), "__dict__")
+    with pytest.raises(InvalidExpression):
+        WeightedNode("a", -1)
+
+    column = WeightedColumn("tags[release]")
+    assert (column.weight, column.key) == (5, "release")
+    assert WeightedColumn("event_id", 1).key is None
+    assert (NamedFlag(True).name, Totals(True).name) == ("named", "totals")
+
+
+def test_fingerprint() -> None:
+    function = Function("plus", [Column("duration"), [1, 2]], "total")
+    assert function.fingerprint is function.fingerprint
+    assert len(function.fingerprint) == 16
+
+    # The alias is ignored, and a Function is a CurriedFunction
+    same = CurriedFunction("plus", None, [Column("duration"), [1, 2]])
+    assert function.fingerprint == same.fingerprint
+    assert function == same
+    assert hash(function) == hash(same)
+    cache: Dict[CurriedFunction, int] = {function: 1}
+    assert cache[same] == 1
+
+    different = [
+        Function("plus", [Column("duration"), [1, 2.0]]),
+        Function("plus", [Column("duration"), [1, True]]),
+        Function("plus", [Column("duration"), (1, 2)]),
+        Function("plus", [Column("duration"), [1]]),
+        Function("plus", [Column("duration2"), [1, 2]]),
+        CurriedFunction("plus", [1], [Column("duration"), [1, 2]]),
+    ]
+    fingerprints = {f.fingerprint for f in different}
+    assert len(fingerprints) == len(different)
+    assert function.fingerprint not in fingerprints
+    assert all(f != function for f in different)
+
+    # Nodes of different types with the same fields are not equal
+    assert Totals(True) != Consistent(True)
+    assert Column("events") != Entity("events")
+
+
+def test_name_pattern_cache() -> None:
+    pattern = NamePattern(r"^[a-z]+$")
+    assert pattern.cache_info() == (0, 0, 0)
+
+    assert pattern.is_valid("abc")
+    assert pattern.is_valid("abc")
+    assert not pattern.is_valid("ABC")
+    assert not pattern.is_valid("ABC")
+    assert pattern.cache_info() == (2, 2, 2)
+
+    try:
+        set_name_cache_size(1)
+        assert pattern.cache_info() == (0, 0, 0)
+        for name in ("abc", "def", "abc"):
+            assert pattern.is_valid(name)
+        assert pattern.cache_info() == (0, 3, 1)
+    finally:
+        set_name_cache_size(NAME_CACHE_SIZE)
@@ -1,5 +1,6 @@
 import pytest
 import re
+from dataclasses import asdict, fields
 from typing import Any, Callable, Optional
 
 from snuba_sdk.conditions import Op
@@ -223,3 +224,31 @@ def test_curried_functions(
             verify()
     else:
         verify()
+
+
+def test_is_aggregate_is_computed_once() -> None:
+    inner = Function("count", [])
+    outer = Function("plus", [Function("abs", [inner]), 1], "total")
+    assert not Function("plus", [Column("duration"), 1]).is_aggregate()
+    assert outer.is_aggregate()
+
+    # The flags are stored on the nodes, including the ones in the parameters
+    assert getattr(inner, "_aggregate") is True
+    assert getattr(outer, "_aggregate") is True
+    object.__setattr__(inner, "_aggregate", False)
+    assert Function("abs", [inner]).is_aggregate() is False
+    assert outer.is_aggregate() is True
+
+
+def test_is_aggregate_is_not_a_field() -> None:
+    func = Function("count", [Column("a")], "total")
+    func.is_aggregate()
+    assert "_aggregate" not in {f.name for f in fields(func)}
+    assert asdict(func) == {
+        "function": "count",
+        "initializers": None,
+        "parameters": [{"name": "a", "subscriptable": None, "key": None}],
+        "alias": "total",
+    }
+    assert "_aggregate" not in repr(func)
+    assert not hasattr(func, "__dict__")
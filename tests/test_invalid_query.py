@@ -1,10 +1,10 @@
 import pytest
 import re
-from typing import Any, Mapping, Sequence
+from typing import Any, Mapping, Sequence, Union
 
 from snuba_sdk.entity import Entity
 from snuba_sdk.expressions import InvalidExpression
-from snuba_sdk.query import Query
+from snuba_sdk.query import Query, QueryBuilder
 from snuba_sdk.query_visitors import InvalidQuery
 
 
@@ -24,10 +24,20 @@ def test_invalid_query() -> None:
     ):
         Query(dataset="discover", match="events")  # type: ignore
 
+    with pytest.raises(
+        InvalidQuery, match=re.escape("queries must have a valid dataset")
+    ):
+        QueryBuilder("", Entity("events")).build()
 
-def test_invalid_query_set() -> None:
-    query = Query("discover", Entity("events"))
 
+@pytest.mark.parametrize(
+    "query",
+    [
+        pytest.param(Query("discover", Entity("events")), id="query"),
+        pytest.param(QueryBuilder("discover", Entity("events")), id="builder"),
+    ],
+)
+def test_invalid_query_set(query: Union[Query, QueryBuilder]) -> None:
     tests: Mapping[str, Sequence[Any]] = {
         "match": (0, "0 must be a valid Entity"),
         "select": (
@@ -1,8 +1,22 @@
 import pytest
+import re
+from datetime import datetime
 from typing import Any, Mapping, Sequence
 
-from snuba_sdk.legacy import json_to_snql
-
+from snuba_sdk.expressions import (
+    Column,
+    deferred_validation,
+    Function,
+    InvalidExpression,
+)
+from snuba_sdk.legacy import (
+    DATETIME_FORMAT,
+    json_to_snql,
+    parse_datetime,
+    parse_exp,
+    parse_exp_cache_info,
+    parse_scalar,
+)
 
 tests = [
     pytest.param(
@@ -646,3 +660,61 @@ def test_json_to_snuba_for_sessions(
     expected = "\n".join(clauses)
     query = json_to_snql(json_body, "sessions")
     assert query.print() == expected
+
+
+datetime_tests = [
+    pytest.param("2020-10-17T20:51:46.110774", id="isoformat"),
+    pytest.param("2020-1-2T3:4:5.6", id="short fields"),
+    pytest.param("2020-01- 2T03:04:05.1", id="space padded day"),
+    pytest.param("2020-01-02t03:04:05.000006", id="lowercase separator"),
+    pytest.param("\uff12\uff10\uff12\uff10-01-02T03:04:05.000006", id="unicode digits"),
+    pytest.param("2020-02-29T00:00:00.000000", id="leap day"),
+    pytest.param("2021-02-29T00:00:00.000000", id="invalid day"),
+    pytest.param("2020-13-01T00:00:00.000000", id="invalid month"),
+    pytest.param("2020-01-02T24:00:00.000000", id="invalid hour"),
+    pytest.param("2020-01-02T23:59:60.000000", id="leap second"),
+    pytest.param("2020-10-17T20:51:46.110774Z", id="timezone"),
+    pytest.param("2020-10-17T20:51:46.110774\n", id="trailing newline"),
+    pytest.param("2020-10-17 20:51:46.110774", id="space separator"),
+    pytest.param("2_20-10-17T20:51:46.110774", id="underscore"),
+    pytest.param("release-1", id="not a datetime"),
+    pytest.param("", id="empty"),
+]
+
+
+@pytest.mark.parametrize("value", datetime_tests)
+def test_parse_scalar_datetimes(value: str) -> None:
+    try:
+        expected: Any = datetime.strptime(value, DATETIME_FORMAT)
+    except ValueError as e:
+        with pytest.raises(ValueError, match=re.escape(str(e))):
+            parse_datetime(value)
+        expected = value
+
+    for _ in range(2):  # The second one is cached
+        parsed = parse_scalar(value)
+        assert parsed == expected
+        assert type(parsed) is type(expected)
+
+
+def test_parse_exp_cache() -> None:
+    aggregation = ["uniq", ["test_parse_exp"], "test_parse_exp_uniq"]
+    hits, misses, _ = parse_exp_cache_info()
+    parsed = parse_exp(aggregation)
+    assert parsed == Function("uniq", [Column("test_parse_exp")], "test_parse_exp_uniq")
+    # The column and the function are cached
+    assert parse_exp_cache_info()[:2] == (hits, misses + 2)
+
+    assert parse_exp(list(aggregation)) is parsed
+    assert parse_exp("test_parse_exp") is parsed.parameters[0]
+    assert parse_exp_cache_info()[:2] == (hits + 2, misses + 2)
+
+    # Values that are equal but have different types are cached separately
+    assert parse_exp(["plus", [1, 2]]) is not parse_exp(["plus", [1, 2.0]])
+    assert parse_exp(["plus", [1, 2.0]]).parameters == [1, 2.0]
+
+    # Invalid expressions are never cached, even if validation is deferred
+    for _ in range(2):
+        with pytest.raises(InvalidExpression):
+            with deferred_validation():
+                parse_exp(["count()", "", ""])
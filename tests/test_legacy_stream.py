@@ -0,0 +1,74 @@
+import gzip
+import io
+import json
+import pytest
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+from snuba_sdk.legacy import json_to_snql
+from snuba_sdk.legacy_stream import main, read_jsonl, translate_jsonl, TranslatedBody
+from tests.test_legacy import sentry_tests
+
+sentry_bodies: Sequence[Mapping[str, Any]] = [
+    param.values[0] for param in sentry_tests  # type: ignore
+]
+
+
+def _jsonl_bodies() -> bytes:
+    bodies = [json.dumps(body) for body in sentry_bodies]
+    lines = bodies[:2] + ["", "{not json", json.dumps({"dataset": "sessions"})]
+    return "\n".join(lines + bodies[2:]).encode("utf-8")
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_translate_jsonl(workers: int) -> None:
+    data = _jsonl_bodies()
+    for stream in (io.BytesIO(data), io.BytesIO(gzip.compress(data))):
+        translated = list(
+            translate_jsonl(read_jsonl(stream), "sessions", workers, batch_size=2)
+        )
+
+        expected = [json_to_snql(body, "sessions").snuba() for body in sentry_bodies]
+        assert [t.snql for t in translated if t.snql is not None] == expected
+        errors = [t for t in translated if t.error is not None]
+        assert [(t.line, t.snql) for t in errors] == [(4, None), (5, None)]
+        assert errors[0].error is not None
+        assert errors[0].error.startswith("JSONDecodeError: ")
+        assert errors[1] == TranslatedBody(
+            5,
+            None,
+            "InvalidQuery: select clause must be a non-empty list of Column and/or Function",
+        )
+
+
+@pytest.mark.parametrize("output", [None, "snql.jsonl"])
+def test_legacy_cli(tmp_path: Path, capsys: Any, output: Optional[str]) -> None:
+    source = tmp_path / "bodies.jsonl.gz"
+    source.write_bytes(gzip.compress(_jsonl_bodies()))
+    argv = ["--entity", "sessions", "--workers", "0", str(source)]
+    if output is not None:
+        argv += ["--output", str(tmp_path / output)]
+
+    assert main(argv) == 1
+    out, err = capsys.readouterr()
+    if output is not None:
+        out = (tmp_path / output).read_text()
+
+    records = [json.loads(line) for line in out.splitlines()]
+    assert [record["line"] for record in records] == [1, 2, 4, 5] + list(
+        range(6, len(sentry_tests) + 4)
+    )
+    expected = [
+        json.loads(json_to_snql(body, "sessions").snuba()) for body in sentry_bodies
+    ]
+    assert [record["body"] for record in records if "body" in record] == expected
+    assert records[2]["error"].startswith("JSONDecodeError: ")
+    assert records[3] == {
+        "line": 5,
+        "error": "InvalidQuery: select clause must be a non-empty list of Column and/or Function",
+    }
+    assert err.splitlines()[0].startswith("line 4: JSONDecodeError: ")
+    assert err.splitlines()[1].startswith("line 5: InvalidQuery: ")
+    assert err.splitlines()[2].startswith(
+        f"translated {len(sentry_tests)} of {len(sentry_tests) + 2} bodies (2 errors)"
+    )
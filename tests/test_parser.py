@@ -0,0 +1,293 @@
+import json
+import pytest
+from datetime import date, datetime
+from typing import Any, Type
+
+from benchmarks.corpus import QUERIES
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    CurriedFunction,
+    Direction,
+    Function,
+    InvalidExpression,
+    LimitBy,
+    OrderBy,
+)
+from snuba_sdk.parser import (
+    InvalidSnQL,
+    parse_cache_info,
+    parse_query,
+    parse_snuba,
+)
+from snuba_sdk.query import Query
+from tests.test_query_visitors import tests as visitor_tests
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_corpus_round_trip(name: str) -> None:
+    query = QUERIES[name]()
+    parsed = parse_query(str(query), "discover")
+    assert str(parsed) == str(query)
+    assert parsed.snuba() == query.snuba()
+
+
+@pytest.mark.parametrize("query", [test.values[0] for test in visitor_tests])
+def test_printed_round_trip(query: Query) -> None:
+    assert str(parse_query(str(query), query.dataset)) == str(query)
+    assert parse_query(query.print()).print() == query.print()
+    assert parse_snuba(query.snuba()).snuba() == query.snuba()
+    assert parse_snuba(json.loads(query.snuba())).snuba() == query.snuba()
+
+
+def base_query() -> Query:
+    return Query("discover", Entity("events")).set_select([Column("event_id")])
+
+
+value_tests = [
+    pytest.param(
+        Condition(Column("title"), Op.EQ, "a BY b AND c, d"), id="keywords in string"
+    ),
+    pytest.param(Condition(Column("title"), Op.EQ, "it's a\nnew 'line'"), id="escapes"),
+    pytest.param(Condition(Column("title"), Op.IN, ("a)", "(b", ",")), id="tuple"),
+    pytest.param(Condition(Column("project_id"), Op.NOT_IN, [1, 2]), id="not in"),
+    pytest.param(
+        Condition(Column("project_id"), Op.IN, tuple(range(-5, 500))), id="integers"
+    ),
+    pytest.param(Condition(Column("project_id"), Op.IN, (1, 2.5, -3)), id="numbers"),
+    pytest.param(
+        Condition(Function("plus", [-1, 2]), Op.IN, (1, 2)), id="integer arguments"
+    ),
+    pytest.param(Condition(Column("title"), Op.IS_NULL), id="is null"),
+    pytest.param(Condition(Column("title"), Op.IS_NOT_NULL), id="is not null"),
+    pytest.param(Condition(Column("title"), Op.NOT_LIKE, "%a%"), id="not like"),
+    pytest.param(
+        Condition(Column("timestamp"), Op.GTE, datetime(2021, 1, 2, 3, 4, 5)),
+        id="datetime",
+    ),
+    pytest.param(Condition(Column("day"), Op.EQ, date(2021, 1, 2)), id="date"),
+    pytest.param(
+        Condition(Function("plus", [Column("duration"), -1.5e-07]), Op.LT, None),
+        id="function",
+    ),
+    pytest.param(
+        Condition(Column("tags[sentry:release]"), Op.EQ, True), id="subscriptable"
+    ),
+    pytest.param(
+        Condition(Function("array", [1, 2]), Op.EQ, [1, 2]), id="array function"
+    ),
+    pytest.param(
+        Condition(
+            Function("toDateTime", ["2021-01-02T03:04:05"]),
+            Op.LT,
+            Column("timestamp"),
+        ),
+        id="toDateTime function",
+    ),
+]
+
+
+@pytest.mark.parametrize("condition", value_tests)
+def test_condition_values(condition: Condition) -> None:
+    query = base_query().set_where([condition])
+    parsed = parse_query(str(query), "discover")
+    assert parsed.where == [condition]
+    assert str(parsed) == str(query)
+
+
+def test_clauses() -> None:
+    query = (
+        base_query()
+        .set_select(
+            [
+                CurriedFunction("quantile", [0.5], [Column("duration")], "p50"),
+                Function("count", [], "count"),
+                Function("tuple", [Column("a"), 1], "pair"),
+                Column("title"),
+            ]
+        )
+        .set_groupby([Column("title"), Function("tuple", [Column("a"), 1], "pair")])
+        .set_having([Condition(Function("count", []), Op.GT, 1)])
+        .set_orderby([OrderBy(Column("p50"), Direction.DESC)])
+        .set_limitby(LimitBy(Column("title"), 5))
+        .set_limit(10)
+        .set_offset(20)
+        .set_totals(True)
+        .set_debug(True)
+    )
+    for snql in (str(query), query.print()):
+        parsed = parse_query(snql, "discover")
+        assert parsed.select == query.select
+        assert parsed.groupby == query.groupby
+        assert parsed.having == query.having
+        assert parsed.orderby == query.orderby
+        assert parsed.limitby == query.limitby
+        assert parsed.limit == query.limit
+        assert parsed.offset == query.offset
+        assert parsed.totals == query.totals
+    assert parse_query(query.print()).debug == query.debug
+
+
+def test_columns_are_cached() -> None:
+    query = QUERIES["typical"]()
+    first = parse_query(str(query), "discover")
+    _, misses, size = parse_cache_info()
+    second = parse_query(str(query), "discover")
+    assert parse_cache_info()[1:] == (misses, size)
+    assert second.select is not first.select
+    assert second.groupby is not None and first.groupby is not None
+    assert all(a is b for a, b in zip(second.groupby, first.groupby))
+
+    condition = Condition(Column("test_columns_are_cached"), Op.IS_NULL)
+    parse_query(str(query.set_where([condition])), "discover")
+    assert parse_cache_info()[1] == misses + 1
+
+
+keyword_tests = [
+    pytest.param(
+        base_query()
+        .set_select([Column("BY")])
+        .set_groupby([Column("BY")])
+        .set_orderby([OrderBy(Column("BY"), Direction.ASC)]),
+        "MATCH (events) SELECT BY BY BY ORDER BY BY ASC",
+        id="column named BY",
+    ),
+    pytest.param(
+        base_query().set_select([Function("count", [], "LIMIT")]).set_limit(10),
+        "MATCH (events) SELECT count() AS LIMIT LIMIT 10",
+        id="alias named LIMIT",
+    ),
+    pytest.param(
+        base_query()
+        .set_select([Column("ORDER"), Column("AS"), Function("count", [], "AS")])
+        .set_groupby([Column("ORDER"), Column("AS")])
+        .set_orderby([OrderBy(Column("ORDER"), Direction.DESC)]),
+        "MATCH (events) SELECT ORDER, AS, count() AS AS BY ORDER, AS "
+        "ORDER BY ORDER DESC",
+        id="columns named ORDER and AS",
+    ),
+    pytest.param(
+        base_query().set_where(
+            [
+                Condition(Column("AND"), Op.EQ, Column("WHERE")),
+                Condition(Column("IS"), Op.IS_NOT_NULL),
+                Condition(Column("NOT"), Op.NOT_IN, ("AND", "OR")),
+            ]
+        ),
+        "MATCH (events) SELECT event_id WHERE AND = WHERE AND IS IS NOT NULL "
+        "AND NOT NOT IN tuple('AND', 'OR')",
+        id="conditions on keywords",
+    ),
+    pytest.param(
+        base_query()
+        .set_select([Column("LIMIT")])
+        .set_limitby(LimitBy(Column("LIMIT"), 1))
+        .set_limit(5),
+        "MATCH (events) SELECT LIMIT LIMIT 1 BY LIMIT LIMIT 5",
+        id="limit by column named LIMIT",
+    ),
+]
+
+
+@pytest.mark.parametrize("query, snql", keyword_tests)
+def test_keyword_names(query: Query, snql: str) -> None:
+    assert str(query) == snql
+    for printed in (str(query), query.print()):
+        parsed = parse_query(printed, "discover")
+        assert parsed == query
+        assert str(parsed) == snql
+
+
+scalar_tests = [
+    pytest.param(float("inf"), "inf", float("inf"), id="inf"),
+    pytest.param(float("-inf"), "-inf", float("-inf"), id="negative inf"),
+    pytest.param(float("nan"), "nan", float("nan"), id="nan"),
+    pytest.param(b"data", "'data'", "data", id="bytes"),
+    pytest.param("a\\d+", "'a\\d+'", "a\\d+", id="backslash"),
+    pytest.param("\\'", "'\\''", "'", id="backslash and quote"),
+    pytest.param("\\\\'", "'\\\\''", "\\\\'", id="backslashes and quote"),
+    pytest.param("\\n", "'\\n'", "\n", id="backslash and n"),
+    pytest.param("a\\\nb", "'a\\\nb'", "a\\\nb", id="backslash and newline"),
+]
+
+
+@pytest.mark.parametrize("value, printed, parsed_value", scalar_tests)
+def test_scalar_round_trip(value: Any, printed: str, parsed_value: Any) -> None:
+    condition = Condition(Function("plus", [Column("a"), value]), Op.EQ, value)
+    query = base_query().set_where([condition])
+    assert str(query).endswith(f"WHERE plus(a, {printed}) = {printed}")
+
+    # Values that print the same way as another one are parsed as that one, so
+    # the parsed query is printed the same way
+    parsed = parse_query(str(query), "discover")
+    assert parsed.where == [
+        Condition(Function("plus", [Column("a"), parsed_value]), Op.EQ, parsed_value)
+    ]
+    same = type(value) is type(parsed_value) and repr(value) == repr(parsed_value)
+    assert (parsed == query) is same
+    assert str(parsed) == str(query)
+    assert parse_snuba(query.snuba()).snuba() == query.snuba()
+
+
+def test_unescaped_backslash() -> None:
+    # Escape sequences the Printer doesn't write are kept as they are
+    parsed = parse_query(
+        "MATCH (events) SELECT a WHERE b = 'c\\td' AND e = TRUE", "discover"
+    )
+    assert parsed.where == [
+        Condition(Column("b"), Op.EQ, "c\\td"),
+        Condition(Column("e"), Op.EQ, True),
+    ]
+
+
+invalid_tests = [
+    pytest.param("SELECT event_id", InvalidSnQL, id="no match"),
+    pytest.param("MATCH events SELECT event_id", InvalidSnQL, id="entity"),
+    pytest.param("MATCH (1, 2) SELECT event_id", InvalidSnQL, id="entity name"),
+    pytest.param("MATCH (events) SELECT a WHERE b = 1 BY c", InvalidSnQL, id="order"),
+    pytest.param("MATCH (events) SELECT count(a", InvalidSnQL, id="parentheses"),
+    pytest.param("MATCH (events) SELECT a,", InvalidSnQL, id="empty item"),
+    pytest.param("MATCH (events) SELECT a WHERE b <> 1", InvalidSnQL, id="operator"),
+    pytest.param("MATCH (events) SELECT a WHERE b = 'c", InvalidSnQL, id="string"),
+    pytest.param(
+        "MATCH (events) SELECT a WHERE b = 'c\\'", InvalidSnQL, id="trailing backslash"
+    ),
+    pytest.param("MATCH (events) SELECT a LIMIT ten", InvalidSnQL, id="limit"),
+    pytest.param("MATCH (events) SELECT a TOTALS yes", InvalidSnQL, id="totals"),
+    pytest.param(
+        "MATCH (events) SELECT a LIMIT 5 BY count(b) LIMIT 1",
+        InvalidSnQL,
+        id="limit by",
+    ),
+    pytest.param("MATCH (events) SELECT a-b", InvalidSnQL, id="tokens"),
+    pytest.param("MATCH (events) SELECT f(a)", InvalidExpression, id="function"),
+    pytest.param("MATCH (events) SELECT a LIMIT 0", InvalidExpression, id="limit 0"),
+]
+
+
+@pytest.mark.parametrize("snql, exception", invalid_tests)
+def test_invalid_query(snql: str, exception: Type[Exception]) -> None:
+    with pytest.raises(exception):
+        parse_query(snql, "discover")
+
+
+def test_invalid_headers() -> None:
+    with pytest.raises(InvalidSnQL, match="dataset of the query is required"):
+        parse_query("MATCH (events) SELECT a")
+    with pytest.raises(InvalidSnQL, match="invalid header"):
+        parse_query("-- DATASET: discover\n-- TURBO: yes\nMATCH (events) SELECT a")
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        pytest.param("{", id="json"),
+        pytest.param([], id="not a dict"),
+        pytest.param({"dataset": "discover"}, id="no query"),
+        pytest.param({"query": "MATCH (events) SELECT a"}, id="no dataset"),
+    ],
+)
+def test_invalid_body(body: Any) -> None:
+    with pytest.raises(InvalidSnQL):
+        parse_snuba(body)
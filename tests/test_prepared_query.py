@@ -0,0 +1,180 @@
+import pytest
+import re
+from datetime import datetime, timezone
+from typing import Any, Mapping
+
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.expressions import (
+    Column,
+    CurriedFunction,
+    Function,
+    InvalidExpression,
+    Param,
+    ScalarType,
+)
+from snuba_sdk.query import Query
+from snuba_sdk.query_visitors import InvalidQuery
+
+
+def build_query(
+    project: Any, start: Any, title: Any, level: Any, limit: Any, offset: Any
+) -> Query:
+    return (
+        Query("discover", Entity("events"))
+        .set_select(
+            [
+                Column("title"),
+                CurriedFunction("quantile", [level], [Column("duration")], "pct"),
+                Function("count", [], "count"),
+            ]
+        )
+        .set_groupby([Column("title")])
+        .set_where(
+            [
+                Condition(Column("project_id"), Op.IN, project),
+                Condition(Column("timestamp"), Op.GT, start),
+                Condition(Function("lower", [Column("title")]), Op.NEQ, title),
+            ]
+        )
+        .set_limit(limit)
+        .set_offset(offset)
+        .set_consistent(True)
+    )
+
+
+TEMPLATE = build_query(
+    Param("project"),
+    Param("start"),
+    Param("title"),
+    Param("level"),
+    Param("limit"),
+    Param("offset"),
+)
+START = datetime(2021, 1, 2, 3, 4, 5, 6, timezone.utc)
+
+tests = [
+    pytest.param(
+        {
+            "project": [1, 2, 3],
+            "start": START,
+            "title": "error",
+            "level": 0.5,
+            "limit": 10,
+            "offset": 0,
+        },
+        id="basic values",
+    ),
+    pytest.param(
+        {
+            "project": (1,),
+            "start": START,
+            "title": 'it\'s a\nmulti-line "title" é',
+            "level": 0.95,
+            "limit": 10000,
+            "offset": 100,
+        },
+        id="values that need escaping",
+    ),
+]
+
+
+@pytest.mark.parametrize("values", tests)
+def test_prepared_query(values: Mapping[str, Any]) -> None:
+    prepared = TEMPLATE.prepare()
+    assert prepared.params == frozenset(values)
+
+    query = build_query(**values)
+    assert prepared.bind(**values) == str(query)
+    assert prepared.snuba(**values) == query.snuba()
+
+
+def test_repeated_param() -> None:
+    prepared = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where(
+            [
+                Condition(Column("project_id"), Op.EQ, Param("project")),
+                Condition(Column("parent_project_id"), Op.EQ, Param("project")),
+            ]
+        )
+        .prepare()
+    )
+    assert prepared.bind(project=5) == (
+        "MATCH (events) SELECT event_id WHERE project_id = 5 AND parent_project_id = 5"
+    )
+
+
+invalid_tests = [
+    pytest.param(
+        {"limit": 10},
+        InvalidQuery("missing values for parameters: project"),
+        id="missing",
+    ),
+    pytest.param(
+        {"project": 1, "limit": 10, "other": 1},
+        InvalidQuery("unknown parameters: other"),
+        id="unknown",
+    ),
+    pytest.param(
+        {"project": 1, "limit": 100000},
+        InvalidExpression("limit '100000' is capped at 10,000"),
+        id="limit out of range",
+    ),
+    pytest.param(
+        {"project": {1}, "limit": 10},
+        InvalidExpression("'{1}' is not a valid scalar"),
+        id="invalid scalar",
+    ),
+]
+
+
+@pytest.mark.parametrize("values, exception", invalid_tests)
+def test_invalid_bind(values: Mapping[str, ScalarType], exception: Exception) -> None:
+    prepared = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("project_id"), Op.EQ, Param("project"))])
+        .set_limit(Param("limit"))
+        .prepare()
+    )
+    with pytest.raises(type(exception), match=re.escape(str(exception))):
+        prepared.snuba(**values)
+
+
+def test_unbound_query() -> None:
+    TEMPLATE.validate()
+    with pytest.raises(
+        InvalidExpression,
+        match=re.escape(
+            "parameter 'level' must be bound to a value before the query can be serialized"
+        ),
+    ):
+        TEMPLATE.snuba()
+
+    with pytest.raises(
+        InvalidExpression,
+        match=re.escape("parameter name '1a' must be a valid identifier"),
+    ):
+        Param("1a")
+
+
+@pytest.mark.parametrize("level", [[0.5], (0.5,)])
+def test_invalid_initializer(level: Any) -> None:
+    # Initializers are literals, so unlike other parameters they can't be bound
+    # to a sequence, the same as when the function is built with the value
+    prepared = TEMPLATE.prepare()
+    values = {
+        "project": [1],
+        "start": START,
+        "title": "",
+        "level": level,
+        "limit": 1,
+        "offset": 0,
+    }
+    message = "initializers to function quantile must be a scalar or column"
+    with pytest.raises(InvalidExpression, match=re.escape(message)):
+        prepared.bind(**values)
+    with pytest.raises(InvalidExpression, match=re.escape(message)):
+        build_query(**values)
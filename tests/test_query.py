@@ -1,7 +1,10 @@
+import pickle
 import pytest
 import re
+import threading
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional, Sequence, Union
+from unittest import mock
 
 from snuba_sdk.conditions import Condition, Op
 from snuba_sdk.entity import Entity
@@ -9,17 +12,18 @@ from snuba_sdk.expressions import (
     Column,
     CurriedFunction,
     Debug,
+    deferred_validation,
     Direction,
     Function,
     Granularity,
+    InvalidExpression,
     Limit,
     LimitBy,
     Offset,
     OrderBy,
 )
-from snuba_sdk.query import Query
-from snuba_sdk.query_visitors import InvalidQuery
-
+from snuba_sdk.query import compile_many, Query, QueryBuilder
+from snuba_sdk.query_visitors import InvalidQuery, Printer
 
 NOW = datetime(2021, 1, 2, 3, 4, 5, 6, timezone.utc)
 tests = [
@@ -254,6 +258,56 @@ tests = [
         InvalidQuery("totals is only valid with a groupby"),
         id="Totals must have a groupby",
     ),
+    pytest.param(
+        Query(dataset="discover", match=Entity("events"), select=[1]),  # type: ignore
+        InvalidQuery(
+            "select clause must be a Column or CurriedFunction or Function, not 1"
+        ),
+        id="select items must be expressions",
+    ),
+    pytest.param(
+        Query(
+            dataset="discover",
+            match=Entity("events"),
+            select=[Column("title")],
+            where=[Column("title")],  # type: ignore
+        ),
+        InvalidQuery(
+            "where clause must be a Condition, not Column(name='title', subscriptable=None, key=None)"
+        ),
+        id="where items must be conditions",
+    ),
+    pytest.param(
+        Query(
+            dataset="discover",
+            match=Entity("events"),
+            select=(Column("title"),),  # type: ignore
+            where=(Condition(Column("timestamp"), Op.GT, NOW),),  # type: ignore
+        ),
+        None,
+        id="clauses can be tuples",
+    ),
+    pytest.param(
+        Query(
+            dataset="discover",
+            match=Entity("events"),
+            select=Column("title"),  # type: ignore
+        ),
+        InvalidQuery(
+            "select clause must be a sequence, not Column(name='title', subscriptable=None, key=None)"
+        ),
+        id="clauses must be sequences",
+    ),
+    pytest.param(
+        Query(
+            dataset="discover",
+            match=Entity("events"),
+            select=[Column("title")],
+            limit=10,  # type: ignore
+        ),
+        InvalidQuery("limit clause must be a Limit, not 10"),
+        id="limit must be a Limit",
+    ),
 ]
 
 
@@ -265,3 +319,250 @@ def test_query(query: Query, exception: Optional[Exception]) -> None:
         return
 
     query.validate()
+
+
+def test_query_caches_output() -> None:
+    query = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("timestamp"), Op.GT, NOW)])
+        .set_limit(10)
+    )
+
+    assert str(query) is str(query)
+    assert query.print() is query.print()
+    assert query.snuba() is query.snuba()
+
+    # Copies made by the set functions have their own output, but share the
+    # clauses the original already rendered, so only the new clause is visited
+    paginated = query.set_offset(10)
+    with mock.patch.object(
+        Printer, "_visit_where", autospec=True, side_effect=Printer._visit_where
+    ) as visit_where, mock.patch.object(
+        Printer, "_visit_offset", autospec=True, side_effect=Printer._visit_offset
+    ) as visit_offset:
+        assert str(paginated) == f"{query} OFFSET 10"
+    visit_where.assert_not_called()
+    assert visit_offset.call_count == 1
+    assert paginated == query.set_offset(10)
+
+
+def test_query_caches_validation_errors() -> None:
+    query = Query("discover", Entity("events")).set_where(
+        [Condition(Column("timestamp"), Op.GT, NOW)]
+    )
+
+    for _ in range(2):
+        with pytest.raises(
+            InvalidQuery, match="query must have at least one column in select"
+        ):
+            query.snuba()
+
+    assert str(query.set_select([Column("event_id")])).startswith(
+        "MATCH (events) SELECT event_id"
+    )
+
+
+def test_derived_queries_reuse_clauses() -> None:
+    class CountingPrinter(Printer):
+        def __init__(self) -> None:
+            super().__init__()
+            self.visited: List[str] = []
+
+        def _visit_select(
+            self, select: Optional[Sequence[Union[Column, CurriedFunction, Function]]]
+        ) -> str:
+            self.visited.append("select")
+            return super()._visit_select(select)
+
+        def _visit_offset(self, offset: Optional[Offset]) -> str:
+            self.visited.append("offset")
+            return super()._visit_offset(offset)
+
+    printer = CountingPrinter()
+    query = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("timestamp"), Op.GT, NOW)])
+        .set_limit(10)
+    )
+
+    for offset in (0, 10, 20):
+        page = query.set_offset(offset)
+        assert printer.visit(page) == str(page)
+        assert page.print().endswith(f"LIMIT 10\nOFFSET {offset}")
+
+    assert printer.visited == ["select", "offset", "offset", "offset"]
+
+    # A new select list is rendered again, even if it is equal to the old one
+    printer.visit(query.set_offset(0).set_select([Column("event_id")]))
+    assert printer.visited[4:] == ["select", "offset"]
+
+
+def test_changed_clauses_are_rendered_again() -> None:
+    where = [Condition(Column("timestamp"), Op.GT, NOW)]
+    query = Query("discover", Entity("events")).set_select([Column("event_id")])
+    paginated = query.set_where(where).set_limit(10)
+    printed = str(paginated)
+
+    # The set functions copy the list, so changing it doesn't change the query
+    where.append(Condition(Column("title"), Op.EQ, "a"))
+    assert str(paginated.set_offset(10)) == f"{printed} OFFSET 10"
+
+    # A query built with the list shares it, and its copies render the list
+    # again if it was changed after the query was printed
+    built = Query(
+        "discover", Entity("events"), select=[Column("event_id")], where=where
+    )
+    assert str(built).endswith("AND title = 'a'")
+    where.pop()
+    assert str(built.set_limit(10)) == printed
+
+
+def test_query_builder() -> None:
+    builder = (
+        QueryBuilder("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("timestamp"), Op.GT, NOW)])
+        .set_limit(10)
+    )
+    query = builder.build()
+    assert query == (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("timestamp"), Op.GT, NOW)])
+        .set_limit(10)
+    )
+
+    # Changing the builder doesn't change the queries it already built
+    builder.set_offset(10).set_debug(True)
+    assert query.offset is None and query.debug == Debug(False)
+    assert builder.build() == query.set_offset(10).set_debug(True)
+
+
+def test_query_fingerprint() -> None:
+    query = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id"), Function("count", [], "count")])
+        .set_where([Condition(Column("project_id"), Op.IN, (1, 2, 3))])
+        .set_limit(10)
+    )
+    same = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id"), Function("count", [], "c2")])
+        .set_where([Condition(Column("project_id"), Op.IN, (1, 2, 3))])
+        .set_limit(10)
+    )
+
+    assert query.fingerprint == same.fingerprint
+    assert query == same
+    assert {query: 1}[same] == 1
+    assert query.set_offset(1).fingerprint != query.fingerprint
+    assert query.set_limit(11).fingerprint != query.fingerprint
+
+
+def test_pickled_query() -> None:
+    query = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id"), Function("count", [], "count")])
+        .set_groupby([Column("event_id")])
+        .set_where([Condition(Column("project_id"), Op.IN, (1, 2, 3))])
+    )
+    query.snuba()
+
+    # The cached output is not pickled
+    assert len(pickle.dumps(query)) < len(pickle.dumps(query.__dict__))
+    copied = pickle.loads(pickle.dumps(query))
+    assert copied == query
+    assert "_cache" not in copied.__dict__
+    assert copied.snuba() == query.snuba()
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_compile_many(workers: int) -> None:
+    base = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id"), Function("count", [], "count")])
+        .set_groupby([Column("event_id")])
+        .set_where([Condition(Column("timestamp"), Op.GT, NOW)])
+    )
+    queries = [base.set_limit(i % 3 + 1) for i in range(6)]
+    # Equal to the base query, but with a different alias
+    queries.append(base.set_select([Column("event_id"), Function("count", [], "cnt")]))
+    queries.append(base)
+
+    compiled = compile_many(queries, workers=workers, batch_size=1)
+    assert compiled == [query.snuba() for query in queries]
+    assert compiled[-1] != compiled[-2]
+
+    invalid = base.set_groupby([])
+    with pytest.raises(InvalidQuery, match="groupby must be included"):
+        compile_many([base, invalid], workers=workers, batch_size=1)
+
+
+def test_deferred_validation() -> None:
+    with deferred_validation():
+        invalid = Function("count", [], "")
+        query = (
+            Query("discover", Entity("events"))
+            .set_select([Column("event_id"), invalid])
+            .set_where([Condition(Column("timestamp"), Op.GT, NOW)])
+        )
+
+    # The error is raised when the query is first validated, and is the same
+    # as the one that would have been raised by the constructor
+    with pytest.raises(InvalidExpression) as expected:
+        Function("count", [], "")
+    for _ in range(2):
+        with pytest.raises(InvalidExpression, match=re.escape(str(expected.value))):
+            query.snuba()
+
+    with deferred_validation():
+        column = Column("event_id")
+        condition = Condition(Function("toHour", [Column("timestamp")]), Op.GT, 1)
+
+    valid = query.set_select([column]).set_where([condition])
+    with mock.patch.object(Column, "validate", autospec=True) as validate:
+        assert (
+            str(valid) == "MATCH (events) SELECT event_id WHERE toHour(timestamp) > 1"
+        )
+        assert validate.call_count == 2
+        # The nodes were validated, so another query doesn't validate them again
+        str(valid.set_limit(5))
+        assert validate.call_count == 2
+
+
+def test_deferred_validation_fingerprint() -> None:
+    # Hashing a node before it is validated doesn't depend on the fields that
+    # validate fills in
+    with deferred_validation():
+        column = Column("tags[release]")
+        hash(column)
+        query = Query(
+            "discover",
+            Entity("events"),
+            select=[column, Function("count", [], "count")],
+            groupby=[Column("tags[release]")],
+        )
+
+    assert column == Column("tags[release]")
+    assert str(query) == (
+        "MATCH (events) SELECT tags[release], count() AS count BY tags[release]"
+    )
+
+
+def test_deferred_validation_is_per_thread() -> None:
+    errors: List[Exception] = []
+
+    def build() -> None:
+        try:
+            Column("")
+        except InvalidExpression as e:
+            errors.append(e)
+
+    with deferred_validation():
+        thread = threading.Thread(target=build)
+        thread.start()
+        thread.join()
+
+    assert len(errors) == 1
@@ -1,5 +1,7 @@
+import io
 import json
 import pytest
+from array import array
 from datetime import datetime, timezone
 from typing import Any, MutableMapping, Optional, Sequence, Tuple
 
@@ -18,7 +20,11 @@ from snuba_sdk.expressions import (
     Totals,
 )
 from snuba_sdk.query import Query
-
+from snuba_sdk.query_visitors import (
+    STREAM_BATCH_SIZE,
+    StreamingPrinter,
+    StreamingTranslator,
+)
 
 NOW = datetime(2021, 1, 2, 3, 4, 5, 6, timezone.utc)
 tests = [
@@ -219,3 +225,53 @@ def test_translate_query(
     if extras:
         body.update({k: v for k, v in extras})
     assert query.snuba() == json.dumps(body)
+
+
+@pytest.mark.parametrize("query, clauses, extras", tests)
+def test_stream_query(
+    query: Query, clauses: Sequence[str], extras: Optional[Sequence[Tuple[str, bool]]]
+) -> None:
+    assert "".join(StreamingPrinter().visit(query)) == str(query)
+    assert "".join(StreamingPrinter(pretty=True).visit(query)) == query.print()
+    assert "".join(StreamingTranslator().visit(query)) == query.snuba()
+
+
+size = STREAM_BATCH_SIZE * 4 + 1
+sequence_tests = [
+    pytest.param(list(range(size)), id="ints"),
+    pytest.param(tuple(f"it's {i}\n" for i in range(size)), id="escaped strings"),
+    pytest.param([str(i) for i in range(size - 1)] + [None], id="mixed"),
+    pytest.param(array("i", range(size)), id="array.array"),
+    pytest.param([], id="empty"),
+]
+
+
+@pytest.mark.parametrize("values", sequence_tests)
+def test_stream_large_sequences(values: Any) -> None:
+    query = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("event_id"), Op.IN, values)])
+    )
+    chunks = list(StreamingTranslator().visit(query))
+    assert "".join(chunks) == query.snuba()
+    if values:
+        # The elements are split across chunks
+        assert max(map(len, chunks)) < len(query.snuba()) // 2
+
+
+def test_write_snuba() -> None:
+    query = (
+        Query("discover", Entity("events"))
+        .set_select([Column("event_id")])
+        .set_where([Condition(Column("project_id"), Op.IN, list(range(5000)))])
+        .set_debug(True)
+    )
+    out = io.StringIO()
+    assert query.write_snuba(out) == len(out.getvalue())
+    assert out.getvalue() == query.snuba()
+
+    # Once the body is cached, it is written as is
+    cached = io.StringIO()
+    assert query.write_snuba(cached) == len(query.snuba())
+    assert cached.getvalue() == query.snuba()
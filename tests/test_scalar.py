@@ -1,8 +1,16 @@
 import pytest
 import re
+from array import array
 from datetime import date, datetime, timezone, timedelta
 
-from snuba_sdk.expressions import InvalidArray, InvalidExpression, ScalarType
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.expressions import (
+    Column,
+    InvalidArray,
+    InvalidExpression,
+    is_scalar,
+    ScalarType,
+)
 from snuba_sdk.visitors import _stringify_scalar
 
 tests = [
@@ -38,6 +46,17 @@ tests = [
         [[1, 2, None], [None, 5, 6]], "array(array(1, 2, NULL), array(NULL, 5, 6))"
     ),
     pytest.param(("a", "b", "c"), "tuple('a', 'b', 'c')"),
+    pytest.param([], "array()"),
+    pytest.param((), "tuple()"),
+    pytest.param([1, 2.5, -3], "array(1, 2.5, -3)"),
+    pytest.param([True, False], "array(TRUE, FALSE)"),
+    pytest.param(["a'b", "c\nd", "e"], "array('a\\'b', 'c\\nd', 'e')"),
+    pytest.param(
+        tuple(range(1000)), f"tuple({', '.join(str(i) for i in range(1000))})"
+    ),
+    pytest.param(array("q", [1, -2, 3]), "array(1, -2, 3)"),
+    pytest.param(array("d", [1.5, 2.0]), "array(1.5, 2.0)"),
+    pytest.param(array("B"), "array()"),
     pytest.param(
         (("a", 1, True), (None, "b", None)),
         "tuple(tuple('a', 1, TRUE), tuple(NULL, 'b', NULL))",
@@ -72,3 +91,26 @@ def test_invalid_scalars() -> None:
         match=re.escape("tuple must contain only scalar values"),
     ):
         _stringify_scalar(({"a": 1}, {1, 2, 3}))  # type: ignore
+
+
+def test_numeric_arrays() -> None:
+    assert not is_scalar(array("u", "abc"))
+    with pytest.raises(InvalidExpression, match=re.escape("is not a valid scalar")):
+        _stringify_scalar(array("u", "abc"))
+
+
+def test_numpy_arrays() -> None:
+    numpy = pytest.importorskip("numpy")
+
+    ids = numpy.array([1, 2, 3], dtype=numpy.uint64)
+    assert is_scalar(ids)
+    assert _stringify_scalar(ids) == "array(1, 2, 3)"
+    assert _stringify_scalar(numpy.array([0.5, 1.0])) == "array(0.5, 1.0)"
+
+    condition = Condition(Column("project_id"), Op.IN, ids)
+    assert condition.rhs is ids
+
+    for invalid in (numpy.array(["a", "b"]), numpy.array([[1, 2], [3, 4]])):
+        assert not is_scalar(invalid)
+        with pytest.raises(InvalidExpression):
+            Condition(Column("project_id"), Op.IN, invalid)
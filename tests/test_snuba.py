@@ -1,7 +1,13 @@
 import pytest
-from typing import Any, List
+from typing import Any, List, Optional
 
-from snuba_sdk.snuba import check_array_type
+from snuba_sdk.snuba import (
+    AGGREGATION_FUNCTIONS,
+    check_array_type,
+    function_info,
+    FunctionInfo,
+    is_aggregation_function,
+)
 
 tests = [
     pytest.param([1, 2, 3], True),
@@ -18,6 +24,9 @@ tests = [
     pytest.param([[None], [1]], True),
     pytest.param([[[1]]], True),
     pytest.param([[[1]], [[2.0]]], True),
+    pytest.param(["a", None, "b"], True),
+    pytest.param([(1,), ("a",)], True),
+    pytest.param([True, 1, 2.0], True),
     pytest.param([1, 2, "a"], False),
     pytest.param([1, "a", None], False),
     pytest.param([None, 2, "a"], False),
@@ -28,9 +37,58 @@ tests = [
     pytest.param([[[1]], [["a"]]], False),
     pytest.param([[[1]], [2.0]], False),
     pytest.param([[[None]], [2.0]], False),
+    pytest.param(["a", b"b"], False),
+    pytest.param([1, (1,)], False),
 ]
 
 
 @pytest.mark.parametrize("value, expected", tests)
 def test_check_array_type(value: List[Any], expected: bool) -> None:
     assert check_array_type(value) == expected, value
+
+
+function_tests = [
+    pytest.param("count", FunctionInfo("count", True, False, 0, 1)),
+    pytest.param("quantile", FunctionInfo("quantile", True, True, 1, 1)),
+    pytest.param("uniqIf", FunctionInfo("uniqIf", True, False, 2, None, ("If",))),
+    pytest.param(
+        "countIfMerge",
+        FunctionInfo("countIfMerge", True, False, 1, 1, ("If", "Merge")),
+    ),
+    pytest.param(
+        "uniqStateIf",
+        FunctionInfo("uniqStateIf", True, False, 2, None, ("State", "If")),
+    ),
+    pytest.param(
+        "quantileIfResample",
+        FunctionInfo("quantileIfResample", True, True, 3, 3, ("If", "Resample")),
+    ),
+    pytest.param("groupArray", FunctionInfo("groupArray", True, True, 1, 1)),
+    pytest.param(
+        "groupArrayArray",
+        FunctionInfo("groupArrayArray", True, True, 1, 1, ("Array",)),
+    ),
+    pytest.param("plus", None),
+    pytest.param("countIfPlus", None),
+    pytest.param("If", None),
+    pytest.param("quantile(0.5)", None),
+    pytest.param("", None),
+]
+
+
+@pytest.mark.parametrize("name, expected", function_tests)
+def test_function_info(name: str, expected: Optional[FunctionInfo]) -> None:
+    assert function_info(name) == expected
+    assert is_aggregation_function(name) == (expected is not None)
+
+
+def test_aggregation_functions() -> None:
+    assert "count" in AGGREGATION_FUNCTIONS
+    assert "uniqIf" in AGGREGATION_FUNCTIONS
+    assert "quantileMerge" in AGGREGATION_FUNCTIONS
+    assert "plus" not in AGGREGATION_FUNCTIONS
+    # Only a single combinator, like before the catalog was added
+    assert "countIfMerge" not in AGGREGATION_FUNCTIONS
+    assert all(is_aggregation_function(name) for name in AGGREGATION_FUNCTIONS)
+    assert len(AGGREGATION_FUNCTIONS) == len(set(AGGREGATION_FUNCTIONS))
+    assert AGGREGATION_FUNCTIONS >= {"sum", "sumIf", "sumState"}
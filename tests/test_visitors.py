@@ -0,0 +1,57 @@
+import pytest
+from dataclasses import dataclass
+
+from snuba_sdk.expressions import Column, Debug, Expression, Function, Limit
+from snuba_sdk.visitors import Translation
+
+
+@dataclass(frozen=True)
+class Star(Expression):
+    def validate(self) -> None:
+        pass
+
+
+@dataclass(frozen=True)
+class QualifiedColumn(Column):
+    pass
+
+
+class StarTranslation(Translation):
+    def _visit_star(self, star: Star) -> str:
+        return "*"
+
+
+StarTranslation.register(Star, "_visit_star")
+
+
+def test_builtin_dispatch() -> None:
+    translation = Translation()
+    assert translation.visit(Column("a")) == "a"
+    assert translation.visit(Function("uniq", [Column("a")], "ua")) == "uniq(a) AS ua"
+    assert translation.visit(Limit(10)) == "10"
+    assert translation.visit(Debug(True)) == "True"
+
+
+def test_subclasses_use_the_base_handler() -> None:
+    assert Translation().visit(QualifiedColumn("a")) == "a"
+
+
+def test_registered_handler() -> None:
+    translation = StarTranslation()
+    assert translation.visit(Star()) == "*"
+    assert translation.visit(Column("a")) == "a"
+
+    # Registering on a subclass doesn't change the parent visitor
+    with pytest.raises(AssertionError, match="Unhandled Expression"):
+        Translation().visit(Star())
+
+
+def test_registered_function_handler() -> None:
+    class UpperTranslation(Translation):
+        pass
+
+    UpperTranslation.register(Column, lambda v, column: column.name.upper())
+    translation = UpperTranslation()
+    assert translation.visit(Column("a")) == "A"
+    assert translation.visit(QualifiedColumn("b")) == "B"
+    assert Translation().visit(Column("a")) == "a"